@@ -0,0 +1,64 @@
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from .courriels import mettre_en_file_plusieurs
+from .gabarits import rendre_plusieurs
+from .models import Parametre, Produit, Utilisateur
+
+# Alertes de stock faible. Un produit est en stock faible quand son stock passe sous son
+# seuil : Produit.seuil_stock_faible, sinon celui de sa catégorie, sinon le Parametre
+# SEUIL_STOCK_FAIBLE (5 par défaut).
+# alerter_stock_faible ne signale que les franchissements : alerte_stock_faible marque les
+# produits déjà signalés et n'est réarmé que lorsque le stock remonte au seuil. Chaque
+# passage envoie au plus un récapitulatif par administrateur, quel que soit le nombre
+# de produits ; les indicateurs et la file d'envoi sont écrits dans la même transaction.
+
+PARAM_SEUIL = 'SEUIL_STOCK_FAIBLE'
+SEUIL_DEFAUT = 5
+
+
+def seuil_par_defaut():
+    parametre = Parametre.objects.filter(cle=PARAM_SEUIL).values_list('valeur', flat=True).first()
+    try:
+        return int(parametre)
+    except (TypeError, ValueError):
+        return SEUIL_DEFAUT
+
+
+def avec_seuil(produits, defaut=None):
+    """Annote `seuil` : seuil effectif d'alerte de chaque produit."""
+    defaut = seuil_par_defaut() if defaut is None else defaut
+    return produits.annotate(seuil=Coalesce('seuil_stock_faible', 'categorie__seuil_stock_faible', Value(defaut)))
+
+
+def en_stock_faible(produits, defaut=None):
+    return avec_seuil(produits, defaut).filter(stock__lt=F('seuil'))
+
+
+def alerter_stock_faible():
+    """Réarme les produits réapprovisionnés, signale les nouveaux ; retourne le nombre de produits signalés."""
+    defaut = seuil_par_defaut()
+    with transaction.atomic():
+        reapprovisionnes = avec_seuil(Produit.objects.filter(alerte_stock_faible=True), defaut).filter(stock__gte=F('seuil'))
+        Produit.objects.filter(pk__in=list(reapprovisionnes.values_list('pk', flat=True))).update(alerte_stock_faible=False)
+
+        # Lignes verrouillées : deux passages concurrents ne signalent pas deux fois le même produit
+        produits = list(
+            en_stock_faible(Produit.objects.select_for_update(skip_locked=True, of=('self',)), defaut)
+            .filter(is_active=True, alerte_stock_faible=False)
+            .order_by('categorie__nom', 'nom')
+            .values('id', 'nom', 'stock', 'seuil', nom_categorie=F('categorie__nom'))
+        )
+        if not produits:
+            return 0
+        Produit.objects.filter(pk__in=[produit['id'] for produit in produits]).update(alerte_stock_faible=True)
+
+        subject = 'Alerte Stock Faible - ChezFlora'
+        admins = list(Utilisateur.objects.filter(role='admin').exclude(email='').values_list('username', 'email'))
+        rendus = rendre_plusieurs(
+            'stock_faible_digest_email.html', [{'admin_name': username} for username, _ in admins], commun={'produits': produits}
+        )
+        mettre_en_file_plusieurs(subject, 'ChezFlora <plazarecrute@gmail.com>', [
+            ([email], plain_message, html_message) for (_, email), (html_message, plain_message) in zip(admins, rendus)
+        ])
+    return len(produits)
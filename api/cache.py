@@ -0,0 +1,59 @@
+import time
+from django.core.cache import cache
+from django.db import transaction
+
+# Compteurs de génération par modèle : toute réponse mise en cache inclut dans sa clé
+# la génération des modèles dont elle dépend. Incrémenter la génération (signaux
+# post_save / post_delete / m2m_changed) rend immédiatement obsolètes ces réponses.
+
+PREFIXE_GENERATION = 'generation'
+
+
+def cle_generation(model):
+    return f'{PREFIXE_GENERATION}:{model._meta.label_lower}'
+
+
+def generations(models):
+    """Générations courantes des modèles, dans l'ordre (une seule lecture du cache)."""
+    cles = [cle_generation(model) for model in models]
+    valeurs = cache.get_many(cles)
+    manquantes = {cle: _generation_initiale() for cle in cles if cle not in valeurs}
+    if manquantes:
+        # add() ne remplace pas une génération posée entre-temps par un autre processus
+        for cle, valeur in manquantes.items():
+            cache.add(cle, valeur, timeout=None)
+        valeurs.update(cache.get_many(list(manquantes)))
+    return [valeurs.get(cle, 0) for cle in cles]
+
+
+def _generation_initiale():
+    # Horodatage en ms : si le compteur est évincé, il ne revient jamais à une valeur déjà utilisée
+    return int(time.time() * 1000)
+
+
+def generation(cle):
+    """Génération d'une clé libre (hors modèle), initialisée au besoin."""
+    valeur = cache.get(cle)
+    if valeur is None:
+        cache.add(cle, _generation_initiale(), timeout=None)
+        valeur = cache.get(cle, 0)
+    return valeur
+
+
+def incrementer(cle):
+    """Incrémente une génération ; retourne la nouvelle valeur."""
+    try:
+        return cache.incr(cle)
+    except ValueError:
+        valeur = _generation_initiale()
+        cache.set(cle, valeur, timeout=None)
+        return valeur
+
+
+def incrementer_generation(model):
+    incrementer(cle_generation(model))
+
+
+def invalider(model):
+    """Incrémente la génération du modèle après le commit de la transaction en cours."""
+    transaction.on_commit(lambda: incrementer_generation(model))
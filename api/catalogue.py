@@ -0,0 +1,222 @@
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from .cache import incrementer, invalider
+from .counters import reconstruire_compteurs
+from .models import Categorie, Produit
+from .pricing import PromotionIndex
+from .search import mettre_a_jour_vecteurs
+from .stock import journaliser
+from .suggestions import CLE_VERSION as VERSION_SUGGESTIONS
+
+# Import / export en flux du catalogue produits (CSV ou JSON Lines).
+# L'import lit le fichier ligne à ligne et traite des lots de TAILLE_LOT lignes :
+# validation, une requête pour les produits existants du lot, puis bulk_create /
+# bulk_update. La mémoire reste constante quelle que soit la taille du fichier.
+# bulk_* ne déclenchant pas les signaux, prix effectifs (calculés avant écriture),
+# vecteurs de recherche, compteurs de catégorie, journal des mouvements de stock, cache
+# et index d'autocomplétion sont tenus explicitement.
+
+COLONNES = ['id', 'nom', 'description', 'prix', 'stock', 'categorie', 'is_active']
+CHAMPS_ECRITS = ['nom', 'description', 'prix', 'stock', 'categorie', 'is_active', 'prix_effectif', 'date_mise_a_jour']
+FORMATS = ('csv', 'jsonl')
+TAILLE_LOT = 1000
+MAX_REJETS_DETAILLES = 1000  # Au-delà, le rapport ne donne plus que le nombre de lignes rejetées
+VRAI = {'1', 'true', 'vrai', 'oui', 'yes'}
+FAUX = {'0', 'false', 'faux', 'non', 'no'}
+
+
+class RapportImport:
+    def __init__(self):
+        self.crees = 0
+        self.mis_a_jour = 0
+        self.nombre_rejets = 0
+        self.rejets = []
+
+    def rejeter(self, numero, erreurs):
+        self.nombre_rejets += 1
+        if len(self.rejets) < MAX_REJETS_DETAILLES:
+            self.rejets.append({'ligne': numero, 'erreurs': erreurs})
+
+    def as_dict(self):
+        return {
+            'crees': self.crees,
+            'mis_a_jour': self.mis_a_jour,
+            'rejetes': self.nombre_rejets,
+            'rejets': self.rejets,
+        }
+
+
+def lire_lignes(flux, format):
+    """Itère (numéro de ligne, dict) sur un flux binaire CSV ou JSONL, sans le charger en mémoire."""
+    texte = io.TextIOWrapper(flux, encoding='utf-8-sig', newline='')
+    if format == 'csv':
+        lecteur = csv.DictReader(texte)
+        for ligne in lecteur:
+            yield lecteur.line_num, ligne
+        return
+    for numero, brut in enumerate(texte, start=1):
+        if not brut.strip():
+            continue
+        try:
+            ligne = json.loads(brut)
+        except json.JSONDecodeError:
+            yield numero, None
+            continue
+        yield numero, ligne if isinstance(ligne, dict) else None
+
+
+def _texte(valeur):
+    return '' if valeur is None else str(valeur).strip()
+
+
+def valider_ligne(ligne, categories):
+    """
+    Valide une ligne d'import. Retourne (champs, erreurs) : `champs` prêt pour Produit(**champs)
+    (avec 'id' si la ligne désigne un produit existant), `erreurs` un dict champ -> message.
+    """
+    if ligne is None:
+        return None, {'ligne': 'Ligne illisible (JSON objet attendu).'}
+    erreurs, champs = {}, {}
+
+    identifiant = _texte(ligne.get('id'))
+    if identifiant:
+        if identifiant.isdigit():
+            champs['id'] = int(identifiant)
+        else:
+            erreurs['id'] = 'Identifiant invalide.'
+
+    nom = _texte(ligne.get('nom'))
+    if not nom:
+        erreurs['nom'] = 'Ce champ est obligatoire.'
+    elif len(nom) > Produit._meta.get_field('nom').max_length:
+        erreurs['nom'] = 'Nom trop long.'
+    champs['nom'] = nom
+    champs['description'] = _texte(ligne.get('description'))
+
+    try:
+        prix = Decimal(_texte(ligne.get('prix')).replace(',', '.'))
+        if not prix.is_finite() or prix < 0:
+            raise InvalidOperation
+        champs['prix'] = prix.quantize(Decimal('0.01'))
+    except InvalidOperation:
+        erreurs['prix'] = 'Prix invalide.'
+
+    try:
+        stock = int(_texte(ligne.get('stock')) or 0)
+        if stock < 0:
+            raise ValueError
+        champs['stock'] = stock
+    except ValueError:
+        erreurs['stock'] = 'Le stock doit être un entier positif.'
+
+    categorie = _texte(ligne.get('categorie'))
+    if categorie not in categories:
+        erreurs['categorie'] = f'Catégorie inconnue : {categorie}' if categorie else 'Ce champ est obligatoire.'
+    else:
+        champs['categorie_id'] = categories[categorie]
+
+    actif = _texte(ligne.get('is_active')).lower()
+    if actif in VRAI or actif == '':
+        champs['is_active'] = True
+    elif actif in FAUX:
+        champs['is_active'] = False
+    else:
+        erreurs['is_active'] = 'Booléen attendu.'
+    return champs, erreurs
+
+
+def _par_lots(iterable, taille):
+    iterateur = iter(iterable)
+    while lot := list(islice(iterateur, taille)):
+        yield lot
+
+
+def _ecrire_lot(lot, rapport, index):
+    """Écrit un lot de (numéro, champs) validés ; retourne les catégories touchées."""
+    ids = [champs['id'] for _, champs in lot if 'id' in champs]
+    maintenant = timezone.now()
+    with transaction.atomic():
+        # Lignes verrouillées : l'écart de stock journalisé est celui que bulk_update écrase
+        existants = {
+            pk: (categorie_id, stock) for pk, categorie_id, stock in
+            Produit.objects.select_for_update().filter(pk__in=ids).values_list('pk', 'categorie_id', 'stock')
+        } if ids else {}
+        a_creer, a_modifier = [], []
+        for numero, champs in lot:
+            if 'id' in champs and champs['id'] not in existants:
+                rapport.rejeter(numero, {'id': f"Produit {champs['id']} introuvable."})
+                continue
+            produit = Produit(**champs, date_mise_a_jour=maintenant)
+            produit.prix_effectif = index.prix(produit)
+            (a_modifier if 'id' in champs else a_creer).append(produit)
+
+        crees = Produit.objects.bulk_create(a_creer, batch_size=TAILLE_LOT)
+        if a_modifier:
+            Produit.objects.bulk_update(a_modifier, CHAMPS_ECRITS, batch_size=TAILLE_LOT)
+        produits = crees + a_modifier
+        if produits:
+            mettre_a_jour_vecteurs(Produit.objects.filter(pk__in=[p.pk for p in produits]))
+        journaliser([(p.pk, p.stock, '') for p in crees], 'initial')
+        journaliser([(p.pk, p.stock - existants[p.pk][1], '') for p in a_modifier], 'import')
+    rapport.crees += len(crees)
+    rapport.mis_a_jour += len(a_modifier)
+    return {p.categorie_id for p in produits} | {categorie_id for categorie_id, _ in existants.values()}
+
+
+def importer_produits(flux, format='csv'):
+    """Importe un flux CSV / JSONL de produits par lots ; retourne le RapportImport."""
+    if format not in FORMATS:
+        raise ValueError(f'Format inconnu : {format}')
+    rapport = RapportImport()
+    categories = dict(Categorie.objects.values_list('nom', 'id'))  # Une seule requête pour tout l'import
+    index = PromotionIndex.actives()  # Prix effectifs calculés avant l'écriture
+    touchees = set()
+    for lot in _par_lots(lire_lignes(flux, format), TAILLE_LOT):
+        valides = []
+        for numero, ligne in lot:
+            champs, erreurs = valider_ligne(ligne, categories)
+            if erreurs:
+                rapport.rejeter(numero, erreurs)
+            else:
+                valides.append((numero, champs))
+        if valides:
+            touchees |= _ecrire_lot(valides, rapport, index)
+    if touchees:
+        reconstruire_compteurs(Categorie.objects.filter(pk__in=touchees))
+    if rapport.crees or rapport.mis_a_jour:
+        invalider(Produit)
+        transaction.on_commit(lambda: incrementer(VERSION_SUGGESTIONS))
+    return rapport
+
+
+class _Echo:
+    """Pseudo-fichier pour csv.writer : renvoie la ligne au lieu de l'écrire."""
+
+    def write(self, valeur):
+        return valeur
+
+
+def exporter_produits(queryset=None, format='csv'):
+    """Génère l'export (CSV ou JSONL) ligne par ligne, réimportable tel quel par importer_produits."""
+    if format not in FORMATS:
+        raise ValueError(f'Format inconnu : {format}')
+    queryset = Produit.objects.all() if queryset is None else queryset
+    lignes = (
+        queryset.order_by('id')
+        .values_list('id', 'nom', 'description', 'prix', 'stock', 'categorie__nom', 'is_active')
+        .iterator(chunk_size=TAILLE_LOT)
+    )
+    if format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(COLONNES)
+        for ligne in lignes:
+            yield writer.writerow(ligne)
+    else:
+        for ligne in lignes:
+            yield json.dumps(dict(zip(COLONNES, ligne)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
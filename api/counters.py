@@ -0,0 +1,37 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .cache import invalider
+from .models import Categorie, Produit
+
+# Compteurs dénormalisés Categorie.produits_count / produits_actifs_count.
+# Tenus à jour par api.signals (création, suppression, activation, changement de
+# catégorie d'un produit) ; reconstruire_compteurs répare après un import en masse.
+
+
+def ajuster_compteurs(categorie_id, total=0, actifs=0):
+    """Ajoute (ou retire) des produits aux compteurs d'une catégorie, par UPDATE atomique."""
+    if categorie_id is None or not (total or actifs):
+        return
+    Categorie.objects.filter(pk=categorie_id).update(
+        produits_count=F('produits_count') + total,
+        produits_actifs_count=F('produits_actifs_count') + actifs,
+    )
+    invalider(Categorie)  # update() ne déclenche pas post_save
+
+
+def _compte(**filtres):
+    return Subquery(
+        Produit.objects.filter(categorie=OuterRef('pk'), **filtres)
+        .order_by().values('categorie').annotate(n=Count('pk')).values('n')
+    )
+
+
+def reconstruire_compteurs(categories=None):
+    """Recalcule les compteurs depuis la table des produits, en une requête UPDATE."""
+    categories = Categorie.objects.all() if categories is None else categories
+    nombre = categories.update(
+        produits_count=Coalesce(_compte(), 0),
+        produits_actifs_count=Coalesce(_compte(is_active=True), 0),
+    )
+    invalider(Categorie)
+    return nombre
@@ -0,0 +1,133 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Courriel
+
+# File d'envoi des e-mails. mettre_en_file remplace send_mail (mêmes arguments) : le
+# courriel devient une ligne Courriel écrite dans la transaction en cours (annulé avec
+# elle) et la tâche envoyer_courriels est déclenchée après le commit. Le temps de
+# réponse d'une requête ne dépend donc plus du serveur SMTP.
+# envoyer_en_attente réserve un lot pour DUREE_BAIL, l'envoie sur une seule connexion
+# SMTP et enregistre le résultat de chaque courriel : un échec est réessayé après un
+# délai exponentiel, jusqu'à MAX_TENTATIVES tentatives.
+# La tâche n'est déclenchée qu'une fois par transaction ; si le broker est injoignable,
+# l'erreur est seulement journalisée : la tâche périodique (chaque minute) videra la file.
+
+TAILLE_LOT = 100
+MAX_TENTATIVES = getattr(settings, 'COURRIELS_MAX_TENTATIVES', 6)
+DELAI_BASE = timedelta(seconds=30)
+DELAI_MAX = timedelta(hours=2)
+DUREE_BAIL = timedelta(minutes=10)  # Un worker interrompu rend son lot après ce délai
+
+logger = logging.getLogger(__name__)
+
+
+def mettre_en_file(subject, message, from_email, recipient_list, html_message=None):
+    """Comme send_mail, mais ajoute le courriel à la file d'envoi ; retourne le Courriel."""
+    courriel = Courriel.objects.create(
+        sujet=subject, texte=message, html=html_message or '',
+        expediteur=from_email or settings.DEFAULT_FROM_EMAIL, destinataires=list(recipient_list),
+    )
+    _programmer_envoi()
+    return courriel
+
+
+def mettre_en_file_plusieurs(subject, from_email, envois):
+    """Envoi en masse : un courriel par (destinataires, texte, html), en une insertion groupée."""
+    courriels = Courriel.objects.bulk_create([
+        Courriel(
+            sujet=subject, texte=texte, html=html or '',
+            expediteur=from_email or settings.DEFAULT_FROM_EMAIL, destinataires=list(destinataires),
+        )
+        for destinataires, texte, html in envois
+    ], batch_size=TAILLE_LOT)
+    if courriels:
+        _programmer_envoi()
+    return courriels
+
+
+def _programmer_envoi():
+    """Déclenche l'envoi après le commit, une seule fois par transaction."""
+    connexion = transaction.get_connection()
+    if connexion.in_atomic_block and any(rappel[1] is _declencher_envoi for rappel in connexion.run_on_commit):
+        return
+    transaction.on_commit(_declencher_envoi)
+
+
+def _declencher_envoi():
+    from .tasks import envoyer_courriels  # tasks importe ce module
+    try:
+        envoyer_courriels.delay()
+    except Exception:  # Broker injoignable : les données sont déjà validées, la requête ne doit pas échouer
+        logger.warning("Envoi des courriels non déclenché (broker injoignable) ; reporté à la tâche périodique", exc_info=True)
+
+
+def delai(tentatives):
+    """Attente après la `tentatives`-ième tentative ratée : 30 s, 1 min, 2 min… plafonnée à DELAI_MAX."""
+    return min(DELAI_BASE * 2 ** (tentatives - 1), DELAI_MAX)
+
+
+def _reserver(limite, maintenant):
+    # Le bail (prochain_essai repoussé) empêche un autre worker de prendre le même lot
+    with transaction.atomic():
+        ids = list(
+            Courriel.objects.select_for_update(skip_locked=True)
+            .filter(statut='en_attente', prochain_essai__lte=maintenant)
+            .order_by('prochain_essai').values_list('id', flat=True)[:limite]
+        )
+        Courriel.objects.filter(pk__in=ids).update(
+            prochain_essai=maintenant + DUREE_BAIL, tentatives=F('tentatives') + 1
+        )
+    return list(Courriel.objects.filter(pk__in=ids).order_by('id'))
+
+
+def _message(courriel, connexion):
+    message = EmailMultiAlternatives(
+        courriel.sujet, courriel.texte, courriel.expediteur, courriel.destinataires, connection=connexion
+    )
+    if courriel.html:
+        message.attach_alternative(courriel.html, 'text/html')
+    return message
+
+
+def _reporter(echecs, maintenant):
+    """Replanifie les courriels en échec, ou les abandonne après MAX_TENTATIVES."""
+    for courriel, erreur in echecs:
+        courriel.derniere_erreur = f'{erreur.__class__.__name__}: {erreur}'
+        if courriel.tentatives >= MAX_TENTATIVES:
+            courriel.statut = 'echec'
+        else:
+            courriel.prochain_essai = maintenant + delai(courriel.tentatives)
+    Courriel.objects.bulk_update([c for c, _ in echecs], ['statut', 'prochain_essai', 'derniere_erreur'])
+    return len(echecs)
+
+
+def envoyer_en_attente(limite=TAILLE_LOT, maintenant=None):
+    """Envoie un lot de courriels dus sur une seule connexion SMTP ; retourne (envoyés, reportés)."""
+    maintenant = maintenant or timezone.now()
+    courriels = _reserver(limite, maintenant)
+    if not courriels:
+        return 0, 0
+    connexion = get_connection()
+    try:
+        connexion.open()
+    except Exception as erreur:  # Serveur injoignable : tout le lot est reporté
+        return 0, _reporter([(courriel, erreur) for courriel in courriels], maintenant)
+
+    envoyes, echecs = [], []
+    try:
+        for courriel in courriels:
+            try:
+                connexion.send_messages([_message(courriel, connexion)])
+            except Exception as erreur:
+                echecs.append((courriel, erreur))
+            else:
+                envoyes.append(courriel.pk)
+    finally:
+        connexion.close()
+    Courriel.objects.filter(pk__in=envoyes).update(statut='envoye', date_envoi=timezone.now(), derniere_erreur='')
+    return len(envoyes), _reporter(echecs, maintenant)
@@ -23,10 +23,10 @@ def custom_exception_handler(exc, context):
         # Pour toutes les exceptions DRF (ex. ValidationError, PermissionDenied)
         response_data = {
             'error': exc.__class__.__name__,
-            'detail': response.data.get('detail', str(exc)),
+            'detail': response.data.get('detail', str(exc)) if isinstance(response.data, dict) else str(exc),
         }
-        # Si c’est une ValidationError avec des champs spécifiques
-        if hasattr(exc, 'detail') and isinstance(exc.detail, dict):
+        # Si c’est une ValidationError avec des champs spécifiques (une liste pour many=True)
+        if hasattr(exc, 'detail') and isinstance(exc.detail, (dict, list)):
             response_data['fields'] = exc.detail
         
         response.data = response_data
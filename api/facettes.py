@@ -0,0 +1,91 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import BooleanField, Case, Count, ExpressionWrapper, F, IntegerField, Q, Value, When
+from django.db.models.functions import Coalesce
+from .cache import generations
+from .models import Categorie, Produit, Promotion
+
+# Facettes du catalogue (/api/produits/facets/) : pour les produits répondant aux filtres
+# de la liste, nombre de produits par catégorie, par tranche de prix, en stock ou non,
+# en promotion ou non. Une seule requête GROUP BY sur les quatre dimensions ; les
+# comptes par dimension sont ensuite sommés en Python (quelques dizaines de groupes).
+# Le résultat est mis en cache par signature normalisée des filtres et par génération
+# des modèles Produit, Catégorie et Promotion.
+
+MODELES_FACETTES = (Produit, Categorie, Promotion)
+
+
+def _prix():
+    return Coalesce('prix_effectif', 'prix')
+
+
+def _tranche(bornes):
+    """Indice de la tranche de prix : 0 sous la première borne, len(bornes) au-delà de la dernière."""
+    return Case(
+        *(When(prix_facette__lt=borne, then=Value(i)) for i, borne in enumerate(bornes)),
+        default=Value(len(bornes)),
+        output_field=IntegerField(),
+    )
+
+
+def calculer_facettes(queryset, bornes=None):
+    """Facettes d'un queryset de produits, en une requête."""
+    bornes = sorted(settings.FACETTES_TRANCHES_PRIX if bornes is None else bornes)
+    groupes = (
+        queryset.order_by()
+        .annotate(prix_facette=_prix())
+        .annotate(
+            tranche=_tranche(bornes),
+            en_stock=ExpressionWrapper(Q(stock__gt=0), output_field=BooleanField()),
+            en_promotion=ExpressionWrapper(Q(prix_facette__lt=F('prix')), output_field=BooleanField()),
+        )
+        .values('categorie_id', 'categorie__nom', 'tranche', 'en_stock', 'en_promotion')
+        .annotate(n=Count('pk'))
+    )
+    total = 0
+    categories, tranches = {}, [0] * (len(bornes) + 1)
+    stock = {'en_stock': 0, 'rupture': 0}
+    promotion = {'en_promotion': 0, 'sans_promotion': 0}
+    for groupe in groupes:
+        n = groupe['n']
+        total += n
+        categorie = categories.setdefault(
+            groupe['categorie_id'], {'id': groupe['categorie_id'], 'nom': groupe['categorie__nom'], 'count': 0}
+        )
+        categorie['count'] += n
+        tranches[groupe['tranche']] += n
+        stock['en_stock' if groupe['en_stock'] else 'rupture'] += n
+        promotion['en_promotion' if groupe['en_promotion'] else 'sans_promotion'] += n
+    limites = [None, *bornes, None]
+    return {
+        'total': total,
+        'categories': sorted(categories.values(), key=lambda c: (-c['count'], c['nom'] or '')),
+        'prix': [
+            {'min': limites[i], 'max': limites[i + 1], 'count': count}
+            for i, count in enumerate(tranches)
+        ],
+        'stock': stock,
+        'promotion': promotion,
+    }
+
+
+def signature_filtres(params, noms):
+    """Signature stable des paramètres de filtre `noms` (ordre et paramètres étrangers ignorés)."""
+    valeurs = sorted(
+        (nom, sorted(v.strip() for v in params.getlist(nom) if v.strip()))
+        for nom in noms if nom in params
+    )
+    brut = repr([(nom, v) for nom, v in valeurs if v])
+    return hashlib.md5(brut.encode()).hexdigest()
+
+
+def facettes_en_cache(queryset, signature, timeout=None):
+    """calculer_facettes(queryset), mis en cache sous `signature` et la génération des modèles."""
+    version = '.'.join(str(g) for g in generations(MODELES_FACETTES))
+    cle = f'facettes:{version}:{signature}'
+    facettes = cache.get(cle)
+    if facettes is None:
+        facettes = calculer_facettes(queryset)
+        cache.set(cle, facettes, settings.CACHE_TTL if timeout is None else timeout)
+    return facettes
@@ -0,0 +1,114 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+# Sélection des champs rendus par les serializers, d'après la requête :
+#   ?fields=id,nom,categorie.nom   ne garde que ces champs (notation pointée pour les imbriqués)
+#   ?expand=photos,produits.photos  n'imbrique en entier que ces relations ; les autres
+#                                   serializers imbriqués sont rendus par leur(s) id(s)
+# Sans ?expand=, toutes les relations restent imbriquées comme avant.
+# Ne s'applique qu'aux lectures (GET / HEAD) : les champs acceptés en écriture ne changent pas.
+
+PARAM_FIELDS = 'fields'
+PARAM_EXPAND = 'expand'
+
+
+def _arbre(valeur):
+    """'id,categorie.nom' -> {'id': {}, 'categorie': {'nom': {}}}"""
+    arbre = {}
+    for chemin in valeur.split(','):
+        noeud = arbre
+        for nom in filter(None, (nom.strip() for nom in chemin.split('.'))):
+            noeud = noeud.setdefault(nom, {})
+    return arbre
+
+
+def _geler(arbre):
+    if arbre is None:
+        return None
+    return tuple(sorted((nom, _geler(enfant)) for nom, enfant in arbre.items()))
+
+
+def selection(context):
+    """(fields, expand) demandés par la requête du contexte : arbres de noms, ou None si absents."""
+    request = context.get('request')
+    if request is None or request.method not in SAFE_METHODS:
+        return None, None
+    params = request.query_params
+    fields = _arbre(params[PARAM_FIELDS]) if params.get(PARAM_FIELDS) else None
+    expand = _arbre(params[PARAM_EXPAND]) if PARAM_EXPAND in params else None
+    return fields or None, expand
+
+
+def cle_selection(context):
+    """Clé normalisée (hashable) de la sélection : même clé quel que soit l'ordre des noms."""
+    fields, expand = selection(context)
+    return _geler(fields), _geler(expand)
+
+
+def _est_relation(model, source):
+    """Vrai si `source` suit uniquement des relations du modèle (rendu possible par ids)."""
+    for attr in source.split('.'):
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            return False
+        if not field.is_relation:
+            return False
+        model = field.related_model
+    return True
+
+
+class DynamicFieldsMixin:
+    """
+    Mixin de ModelSerializer qui applique ?fields= et ?expand= à ses champs, y compris
+    quand il est imbriqué : son chemin depuis le serializer racine (ex. 'produits.photos')
+    désigne la partie de la sélection qui le concerne.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        demandes, expand = selection(self.context)
+        if demandes is None and expand is None:
+            return fields
+        chemin = self.chemin_selection()
+        demandes = self._noeud(demandes, chemin)
+        if demandes:
+            fields = {nom: field for nom, field in fields.items() if nom in demandes}
+        if expand is not None:
+            expand = self._noeud(expand, chemin)
+            if expand is None:
+                expand = {}  # Chemin non demandé : aucune relation imbriquée
+            for nom, field in fields.items():
+                if nom not in expand:
+                    fields[nom] = self._replier(nom, field)
+        return fields
+
+    def chemin_selection(self):
+        """Noms des champs menant du serializer racine à celui-ci."""
+        chemin, noeud = [], self
+        while noeud.parent is not None:
+            if noeud.field_name:  # L'enfant d'un ListSerializer n'a pas de nom
+                chemin.append(noeud.field_name)
+            noeud = noeud.parent
+        return chemin[::-1]
+
+    @staticmethod
+    def _noeud(arbre, chemin):
+        for nom in chemin:
+            if arbre is None:
+                return None
+            arbre = arbre.get(nom)
+        return arbre
+
+    def _replier(self, nom, field):
+        """Remplace un serializer imbriqué par les ids de la relation, si c'en est une."""
+        multiple = isinstance(field, serializers.ListSerializer)
+        enfant = field.child if multiple else field
+        if not isinstance(enfant, serializers.BaseSerializer):
+            return field
+        source = field.source or nom
+        if source == '*' or not _est_relation(self.Meta.model, source):
+            return field
+        kwargs = {'source': source} if source != nom else {}
+        return serializers.PrimaryKeyRelatedField(read_only=True, many=multiple, **kwargs)
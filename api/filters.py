@@ -24,8 +24,9 @@ class CategorieFilter(filters.FilterSet):
 # Filtre pour Produit
 class ProduitFilter(filters.FilterSet):
     categorie = filters.ModelChoiceFilter(queryset=Categorie.objects.all())
-    prix_min = filters.NumberFilter(field_name='prix', lookup_expr='gte')
-    prix_max = filters.NumberFilter(field_name='prix', lookup_expr='lte')
+    # Prix après promotion (colonne indexée prix_effectif)
+    prix_min = filters.NumberFilter(field_name='prix_effectif', lookup_expr='gte')
+    prix_max = filters.NumberFilter(field_name='prix_effectif', lookup_expr='lte')
     stock_min = filters.NumberFilter(field_name='stock', lookup_expr='gte')
 
     class Meta:
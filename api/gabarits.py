@@ -0,0 +1,123 @@
+import re
+from functools import lru_cache
+from html import unescape
+from django.conf import settings
+from django.template import engines
+from django.template.base import Node, VariableNode
+from django.template.defaulttags import AutoEscapeControlNode
+from django.utils.html import conditional_escape
+
+# Rendu des e-mails (gabarits de api/templates). Chaque gabarit est compilé une fois par
+# processus (avec DEBUG, le chargeur de Django relit et recompile le fichier à chaque appel).
+# La partie texte est tirée du HTML par quelques expressions régulières, en une passe,
+# là où strip_tags relance un analyseur HTML jusqu'à stabilité.
+# rendre_plusieurs rend le gabarit une seule fois pour tout un lot : les variables propres
+# à chaque destinataire y sont remplacées par des marqueurs, puis substituées (échappées
+# pour le HTML) dans le squelette déjà rendu. Seules les variables uniquement affichées
+# telles quelles ({{ variable }} : ni filtre, ni attribut, ni usage dans une balise, ce que
+# Gabarit vérifie sur l'arbre compilé) s'y prêtent ; sinon (ou valeur vide ou non textuelle)
+# chaque contexte est rendu entièrement.
+
+MARQUEUR = '\x1a'
+_MARQUEURS = re.compile(f'{MARQUEUR}(\\w+){MARQUEUR}')
+_BLOCS_INVISIBLES = re.compile(r'<(head|style|script)\b.*?</\1\s*>', re.S | re.I)
+_SAUTS = re.compile(r'<br\s*/?>|</(?:p|div|h[1-6]|li|tr|table|ul|ol)\s*>', re.I)
+_CELLULES = re.compile(r'</t[dh]\s*>', re.I)
+_BALISES = re.compile(r'<[^>]*>')
+_ESPACES = re.compile(r'[ \t\r\f\v]+')
+
+
+def html_en_texte(html):
+    """Version texte d'un e-mail HTML : une ligne par bloc, cellules séparées par un espace."""
+    texte = _BLOCS_INVISIBLES.sub('', html)
+    texte = _SAUTS.sub('\n', texte)
+    texte = _CELLULES.sub(' ', texte)
+    texte = unescape(_BALISES.sub('', texte))
+    lignes = (_ESPACES.sub(' ', ligne).strip() for ligne in texte.split('\n'))
+    return '\n'.join(ligne for ligne in lignes if ligne)
+
+
+def _substituable(valeur):
+    # Un entier n'est affiché tel quel que sans séparateur de milliers ; les flottants sont localisés
+    if isinstance(valeur, int) and not isinstance(valeur, bool):
+        return not settings.USE_THOUSAND_SEPARATOR
+    return isinstance(valeur, str) and valeur != ''
+
+
+def _variables_affichees(nodelist):
+    """Noms affichés uniquement par {{ nom }}, sans filtre ni attribut, hors de toute balise."""
+    noeuds = nodelist.get_nodes_by_type(Node)
+    brutes = {
+        id(noeud) for bloc in noeuds if isinstance(bloc, AutoEscapeControlNode) and not bloc.setting
+        for noeud in bloc.nodelist.get_nodes_by_type(VariableNode)
+    }
+    affichees, autres = set(), set()
+    for noeud in noeuds:
+        if isinstance(noeud, VariableNode):
+            expression = noeud.filter_expression
+            lookups = getattr(expression.var, 'lookups', None)
+            if not lookups:
+                continue  # Littéral
+            if len(lookups) == 1 and not expression.filters and id(noeud) not in brutes:
+                affichees.add(lookups[0])
+            else:
+                autres.add(lookups[0])
+        elif getattr(noeud, 'token', None) is not None and noeud.token.token_type.name == 'BLOCK':
+            autres.update(re.findall(r'\w+', noeud.token.contents))  # Par excès : mots-clés compris
+    return affichees - autres
+
+
+class Gabarit:
+    def __init__(self, nom, template=None):
+        self.nom = nom
+        self.template = template or engines['django'].get_template(nom)
+        self.substituables = _variables_affichees(self.template.template.nodelist)
+
+    def rendre(self, contexte):
+        """Retourne (html, texte)."""
+        html = self.template.render(contexte)
+        return html, html_en_texte(html)
+
+    def rendre_plusieurs(self, contextes, commun=None):
+        """Retourne (html, texte) pour chaque contexte, `commun` complétant chacun d'eux."""
+        contextes = list(contextes)
+        commun = commun or {}
+        variables = sorted({cle for contexte in contextes for cle in contexte})
+        if not contextes or not set(variables) <= self.substituables or not all(
+            set(contexte) == set(variables) and all(_substituable(v) for v in contexte.values())
+            for contexte in contextes
+        ):
+            return [self.rendre({**commun, **contexte}) for contexte in contextes]
+
+        squelette = self.template.render({**commun, **{cle: f'{MARQUEUR}{cle}{MARQUEUR}' for cle in variables}})
+        morceaux_html = _MARQUEURS.split(squelette)
+        morceaux_texte = _MARQUEURS.split(html_en_texte(squelette))
+        if set(morceaux_html[1::2]) != set(variables):  # Variable affichée nulle part
+            return [self.rendre({**commun, **contexte}) for contexte in contextes]
+        return [
+            (
+                _assembler(morceaux_html, {cle: conditional_escape(valeur) for cle, valeur in contexte.items()}),
+                _assembler(morceaux_texte, {cle: str(valeur) for cle, valeur in contexte.items()}),
+            )
+            for contexte in contextes
+        ]
+
+
+def _assembler(morceaux, valeurs):
+    # morceaux alterne texte fixe et noms de variables (re.split avec un groupe)
+    return ''.join(morceau if i % 2 == 0 else valeurs[morceau] for i, morceau in enumerate(morceaux))
+
+
+@lru_cache(maxsize=None)
+def gabarit(nom):
+    return Gabarit(nom)
+
+
+def rendre(nom, contexte):
+    """(html, texte) d'un e-mail, à partir du gabarit compilé en cache."""
+    return gabarit(nom).rendre(contexte)
+
+
+def rendre_plusieurs(nom, contextes, commun=None):
+    """(html, texte) pour chaque contexte d'un envoi en masse, le gabarit n'étant rendu qu'une fois."""
+    return gabarit(nom).rendre_plusieurs(contextes, commun)
@@ -0,0 +1,133 @@
+import os
+from io import BytesIO
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from PIL import Image, ImageOps
+from .cache import invalider
+
+# Variantes réduites des images téléversées (Photo.image, UploadedImage.image, Article.cover) :
+# pour chaque taille de IMAGES_VARIANTES, une version JPEG et une version WebP, enregistrées
+# à côté de l'original (photos/2026/10/17/rose.jpg -> photos/2026/10/17/rose.thumb.webp).
+# Générées par la tâche generer_variantes_image après l'enregistrement ; en attendant, l'URL
+# d'une variante manquante pointe vers la vue variante_image qui la génère à la première requête.
+# Une seule génération à la fois par image (verrou en cache, comme IdempotencyMixin) : les
+# requêtes qui arrivent pendant ce temps sont renvoyées vers l'original.
+# Le champ `variantes` du modèle mémorise les fichiers produits (et l'original dont ils dérivent),
+# pour que la sérialisation n'ait à interroger ni le stockage ni la base.
+
+TAILLES = getattr(settings, 'IMAGES_VARIANTES', {'thumb': 160, 'medium': 480})
+FORMATS = {'jpeg': 'jpg', 'webp': 'webp'}
+OPTIONS = {'jpeg': {'quality': 82, 'optimize': True, 'progressive': True}, 'webp': {'quality': 80, 'method': 4}}
+CHAMPS_IMAGE = {'api.photo': 'image', 'api.uploadedimage': 'image', 'api.article': 'cover'}
+DUREE_VERROU = 120  # Secondes : une génération interrompue libère l'image après ce délai
+
+
+def nom_variante(nom, taille, format):
+    base, _ = os.path.splitext(nom)
+    return f'{base}.{taille}.{FORMATS[format]}'
+
+
+def _encoder(image, format):
+    if format == 'jpeg' and image.mode != 'RGB':
+        image = image.convert('RGB')  # Pas de transparence en JPEG
+    elif format == 'webp' and image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    sortie = BytesIO()
+    image.save(sortie, format=format.upper(), **OPTIONS[format])
+    return sortie.getvalue()
+
+
+def generer_variantes(nom, storage=default_storage):
+    """
+    Crée les variantes manquantes de l'image `nom` ; retourne {'taille.format': nom du fichier}.
+    L'original n'est décodé qu'une fois, à la résolution utile la plus basse (draft JPEG).
+    """
+    variantes, manquantes = {}, []
+    for taille, cote in TAILLES.items():
+        for format in FORMATS:
+            cible = nom_variante(nom, taille, format)
+            variantes[f'{taille}.{format}'] = cible
+            if not storage.exists(cible):
+                manquantes.append((taille, cote, format, cible))
+    if not manquantes:
+        return variantes
+
+    with storage.open(nom, 'rb') as fichier:
+        image = Image.open(fichier)
+        plus_grand = max(cote for _, cote, _, _ in manquantes)
+        image.draft('RGB', (plus_grand, plus_grand))  # Sans effet hors JPEG
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    for taille, cote, format, cible in sorted(manquantes, key=lambda m: -m[1]):
+        reduite = image.copy()
+        reduite.thumbnail((cote, cote), Image.LANCZOS, reducing_gap=2.0)
+        storage.save(cible, ContentFile(_encoder(reduite, format)))
+    return variantes
+
+
+def champ_image(model):
+    return CHAMPS_IMAGE[model._meta.label_lower]
+
+
+def variantes_a_jour(instance):
+    """Vrai si le champ `variantes` décrit bien l'image actuelle de l'instance."""
+    fichier = getattr(instance, champ_image(type(instance)))
+    return not fichier or instance.variantes.get('source') == fichier.name
+
+
+def preparer_variantes(model, pk):
+    """
+    Génère les variantes d'une instance et les enregistre sur celle-ci ; retourne le champ
+    `variantes`, ou None si une autre requête (ou la tâche) est déjà en train de les générer.
+    """
+    instance = model.objects.get(pk=pk)
+    fichier = getattr(instance, champ_image(model))
+    if not fichier:
+        return {}
+    if variantes_a_jour(instance):
+        return instance.variantes
+    verrou = f'images:variantes:{model._meta.label_lower}:{pk}'
+    if not cache.add(verrou, fichier.name, DUREE_VERROU):
+        return None
+    try:
+        variantes = {'source': fichier.name, **generer_variantes(fichier.name, fichier.storage)}
+        # update() : pas de post_save, donc pas de nouvelle tâche
+        model.objects.filter(pk=pk).update(variantes=variantes)
+    finally:
+        cache.delete(verrou)
+    invalider(model)
+    return variantes
+
+
+def modele_image(label):
+    """Modèle porteur d'images désigné par son label ('api.photo'), ou None."""
+    if label not in CHAMPS_IMAGE:
+        return None
+    return apps.get_model(label)
+
+
+def srcset(instance, request=None):
+    """
+    {taille: {format: url}} pour l'image de l'instance. Une variante déjà générée est servie
+    directement depuis MEDIA_URL, les autres par la vue qui les génère à la demande.
+    """
+    fichier = getattr(instance, champ_image(type(instance)))
+    if not fichier:
+        return None
+    connues = instance.variantes if variantes_a_jour(instance) else {}
+    label = instance._meta.label_lower
+    resultat = {}
+    for taille in TAILLES:
+        resultat[taille] = {}
+        for format in FORMATS:
+            cle = f'{taille}.{format}'
+            if cle in connues:
+                url = fichier.storage.url(connues[cle])
+            else:
+                url = reverse('image-variante', args=[label, instance.pk, taille, format])
+            resultat[taille][format] = request.build_absolute_uri(url) if request else url
+    return resultat
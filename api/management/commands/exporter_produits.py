@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api.catalogue import FORMATS, exporter_produits
+
+
+class Command(BaseCommand):
+    help = "Exporte le catalogue produits en CSV ou JSONL, ligne par ligne"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', choices=FORMATS, default='csv', help="Format de sortie (csv par défaut)")
+        parser.add_argument('--sortie', help="Fichier de sortie (sortie standard par défaut)")
+
+    def handle(self, *args, **options):
+        lignes = exporter_produits(format=options['type'])
+        if not options['sortie']:
+            for ligne in lignes:
+                self.stdout.write(ligne, ending='')
+            return
+        with open(options['sortie'], 'w', encoding='utf-8', newline='') as sortie:
+            sortie.writelines(lignes)
+        self.stdout.write(self.style.SUCCESS(f"Catalogue exporté dans {options['sortie']}"))
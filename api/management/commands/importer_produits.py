@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.catalogue import FORMATS, importer_produits
+
+
+class Command(BaseCommand):
+    help = "Importe des produits en masse depuis un fichier CSV ou JSONL (lecture en flux, écriture par lots)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help="Chemin du fichier à importer")
+        parser.add_argument('--type', choices=FORMATS, help="Format du fichier (déduit de l'extension par défaut)")
+
+    def handle(self, *args, **options):
+        chemin = options['fichier']
+        type_fichier = options['type'] or ('jsonl' if chemin.endswith(('.jsonl', '.ndjson')) else 'csv')
+        try:
+            with open(chemin, 'rb') as flux:
+                rapport = importer_produits(flux, type_fichier)
+        except OSError as e:
+            raise CommandError(f"Lecture impossible : {e}")
+        for rejet in rapport.rejets:
+            self.stderr.write(f"Ligne {rejet['ligne']} rejetée : {rejet['erreurs']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{rapport.crees} produits créés, {rapport.mis_a_jour} mis à jour, {rapport.nombre_rejets} lignes rejetées"
+        ))
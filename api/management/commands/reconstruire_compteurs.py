@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.counters import reconstruire_compteurs
+
+
+class Command(BaseCommand):
+    help = "Recalcule les compteurs de produits (total et actifs) de chaque catégorie"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            nombre = reconstruire_compteurs()
+        self.stdout.write(self.style.SUCCESS(f"Compteurs recalculés pour {nombre} catégories"))
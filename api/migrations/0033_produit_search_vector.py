@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:12
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Index GIN, extension unaccent et configuration « french_unaccent » :
+# uniquement sur PostgreSQL (les tests tournent sur SQLite).
+
+CREATE_CONFIG = """
+CREATE EXTENSION IF NOT EXISTS unaccent;
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'french_unaccent') THEN
+        CREATE TEXT SEARCH CONFIGURATION french_unaccent (COPY = french);
+        ALTER TEXT SEARCH CONFIGURATION french_unaccent
+            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, french_stem;
+    END IF;
+END
+$$;
+"""
+
+CREATE_INDEX = "CREATE INDEX IF NOT EXISTS produit_search_gin ON api_produit USING gin (search_vector);"
+
+POPULATE = """
+UPDATE api_produit SET search_vector =
+    setweight(to_tsvector('french_unaccent', coalesce(nom, '')), 'A') ||
+    setweight(to_tsvector('french_unaccent', coalesce(description, '')), 'B');
+"""
+
+
+def forwards(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(CREATE_CONFIG)
+    schema_editor.execute(CREATE_INDEX)
+    schema_editor.execute(POPULATE)
+
+
+def backwards(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS produit_search_gin;")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0032_remove_photo_article"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="produit",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name="produit",
+                    index=django.contrib.postgres.indexes.GinIndex(
+                        fields=["search_vector"], name="produit_search_gin"
+                    ),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(forwards, backwards),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0033_produit_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="commande",
+            index=models.Index(fields=["date", "id"], name="commande_date_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="paiement",
+            index=models.Index(fields=["date", "id"], name="paiement_date_id_idx"),
+        ),
+    ]
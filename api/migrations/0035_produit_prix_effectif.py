@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:05
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def remplir_prix_effectifs(apps, schema_editor):
+    # Même règle que api.pricing : la plus forte réduction active (produit ou catégorie)
+    Produit = apps.get_model("api", "Produit")
+    Promotion = apps.get_model("api", "Promotion")
+    now = timezone.now()
+    par_produit, par_categorie = {}, {}
+    actives = Promotion.objects.filter(is_active=True, date_debut__lte=now, date_fin__gte=now)
+    for reduction, categorie_id, produit_id in actives.values_list(
+        "reduction", "categorie_id", "produits"
+    ):
+        reduction = Decimal(str(reduction))
+        if produit_id is not None:
+            par_produit[produit_id] = max(reduction, par_produit.get(produit_id, Decimal("0")))
+        if categorie_id is not None:
+            par_categorie[categorie_id] = max(
+                reduction, par_categorie.get(categorie_id, Decimal("0"))
+            )
+    produits = list(Produit.objects.only("id", "prix", "categorie_id"))
+    for produit in produits:
+        reduction = max(
+            par_produit.get(produit.id, Decimal("0")),
+            par_categorie.get(produit.categorie_id, Decimal("0")),
+        )
+        produit.prix_effectif = (produit.prix * (1 - reduction)).quantize(
+            Decimal("0.01"), rounding=ROUND_HALF_UP
+        )
+    Produit.objects.bulk_update(produits, ["prix_effectif"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0034_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="produit",
+            name="prix_effectif",
+            field=models.DecimalField(
+                db_index=True, decimal_places=2, editable=False, max_digits=10, null=True
+            ),
+        ),
+        migrations.RunPython(remplir_prix_effectifs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:40
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remplir_compteurs(apps, schema_editor):
+    Categorie = apps.get_model("api", "Categorie")
+    Produit = apps.get_model("api", "Produit")
+
+    def compte(**filtres):
+        return Subquery(
+            Produit.objects.filter(categorie=OuterRef("pk"), **filtres)
+            .order_by()
+            .values("categorie")
+            .annotate(n=Count("pk"))
+            .values("n")
+        )
+
+    Categorie.objects.update(
+        produits_count=Coalesce(compte(), 0),
+        produits_actifs_count=Coalesce(compte(is_active=True), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0035_produit_prix_effectif"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="categorie",
+            name="produits_actifs_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="categorie",
+            name="produits_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(remplir_compteurs, migrations.RunPython.noop),
+    ]
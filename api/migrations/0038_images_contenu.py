@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:28
+
+import api.models
+import api.stockage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0037_images_variantes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FichierImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(max_length=255, unique=True)),
+                ('references', models.IntegerField(default=0)),
+                ('orphelin_depuis', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Fichier image',
+                'verbose_name_plural': 'Fichiers images',
+            },
+        ),
+        migrations.AlterField(
+            model_name='photo',
+            name='image',
+            field=models.ImageField(help_text='Image au format JPG, JPEG, PNG ou GIF, max 5MB', storage=api.stockage.StockageContenu(), upload_to='photos/%Y/%m/%d/', validators=[api.models.validate_image]),
+        ),
+        migrations.AlterField(
+            model_name='uploadedimage',
+            name='image',
+            field=models.ImageField(storage=api.stockage.StockageContenu(), upload_to='article_images/'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:33
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def echeance_lignes_existantes(apps, schema_editor):
+    # Lignes antérieures : réservation de 30 minutes depuis leur ajout (déjà échue
+    # pour un panier abandonné, que la première passe de la tâche libérera)
+    PanierProduit = apps.get_model('api', 'PanierProduit')
+    PanierProduit.objects.update(reserve_jusqu_a=F('date_ajout') + timedelta(minutes=30))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0038_images_contenu'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='panierproduit',
+            name='reservation_active',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='panierproduit',
+            name='reserve_jusqu_a',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(echeance_lignes_existantes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:46
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def stock_initial(apps, schema_editor):
+    # Un mouvement 'initial' par produit existant : le journal recalcule le stock actuel
+    Produit = apps.get_model('api', 'Produit')
+    MouvementStock = apps.get_model('api', 'MouvementStock')
+    MouvementStock.objects.bulk_create(
+        (MouvementStock(produit_id=pk, delta=stock, raison='initial')
+         for pk, stock in Produit.objects.exclude(stock=0).values_list('pk', 'stock').iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0039_panier_reservations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstantaneStock',
+            fields=[
+                ('produit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='instantane_stock', serialize=False, to='api.produit')),
+                ('stock', models.IntegerField(default=0)),
+                ('dernier_mouvement', models.BigIntegerField(default=0)),
+                ('date', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Instantané de stock',
+                'verbose_name_plural': 'Instantanés de stock',
+            },
+        ),
+        migrations.CreateModel(
+            name='MouvementStock',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('delta', models.IntegerField()),
+                ('raison', models.CharField(choices=[('initial', 'Stock initial'), ('panier', 'Réservation panier'), ('expiration', 'Réservation expirée'), ('annulation', 'Annulation de commande'), ('remboursement', 'Remboursement'), ('ajustement', 'Ajustement manuel'), ('import', 'Import du catalogue')], max_length=20)),
+                ('reference', models.CharField(blank=True, max_length=50)),
+                ('date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mouvements_stock', to='api.produit')),
+            ],
+            options={
+                'verbose_name': 'Mouvement de stock',
+                'verbose_name_plural': 'Mouvements de stock',
+                'indexes': [models.Index(fields=['produit', 'id'], name='mouvement_produit_id_idx'), models.Index(fields=['date'], name='mouvement_date_idx')],
+            },
+        ),
+        migrations.RunPython(stock_initial, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0040_journal_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Courriel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sujet', models.CharField(max_length=255)),
+                ('texte', models.TextField()),
+                ('html', models.TextField(blank=True)),
+                ('expediteur', models.CharField(max_length=255)),
+                ('destinataires', models.JSONField(default=list)),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('envoye', 'Envoyé'), ('echec', 'Échec')], default='en_attente', max_length=20)),
+                ('tentatives', models.PositiveIntegerField(default=0)),
+                ('prochain_essai', models.DateTimeField(default=django.utils.timezone.now)),
+                ('derniere_erreur', models.TextField(blank=True)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_envoi', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Courriel',
+                'verbose_name_plural': 'Courriels',
+                'indexes': [models.Index(fields=['statut', 'prochain_essai'], name='courriel_a_envoyer_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0041_courriels'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categorie',
+            name='seuil_stock_faible',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='alerte_stock_faible',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='seuil_stock_faible',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
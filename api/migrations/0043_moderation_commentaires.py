@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:03
+
+from django.db import migrations, models
+
+
+def statut_existant(apps, schema_editor):
+    # Les commentaires existants ont déjà été modérés à leur création
+    Commentaire = apps.get_model('api', 'Commentaire')
+    Commentaire.objects.filter(is_active=True).update(statut_moderation='approuve')
+    Commentaire.objects.filter(is_active=False).update(statut_moderation='rejete')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0042_seuils_stock_faible'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VerdictModeration',
+            fields=[
+                ('empreinte', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('approprie', models.BooleanField()),
+                ('raison', models.TextField(blank=True)),
+                ('date', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Verdict de modération',
+                'verbose_name_plural': 'Verdicts de modération',
+            },
+        ),
+        migrations.AddField(
+            model_name='commentaire',
+            name='statut_moderation',
+            field=models.CharField(choices=[('en_attente', 'En attente'), ('approuve', 'Approuvé'), ('rejete', 'Rejeté')], default='en_attente', max_length=20),
+        ),
+        migrations.RunPython(statut_existant, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,22 @@
 import csv
+import hashlib
+import json
+import time
+from datetime import datetime
 from io import StringIO
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
 from django.http import StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
 from rest_framework.permissions import IsAdminUser
 from rest_framework import viewsets
 from drf_spectacular.utils import extend_schema, OpenApiExample
 from rest_framework.decorators import action
+from rest_framework.response import Response
+from .cache import generations
+from .queryplan import plan_pour
 
 
 class ExportCSVViewSetMixin:
@@ -57,4 +69,247 @@ class ExportCSVViewSetMixin:
             content_type='text/csv'
         )
         response['Content-Disposition'] = f'attachment; filename="{self.csv_filename}"'
-        return response
\ No newline at end of file
+        return response
+
+
+class QueryPlanViewSetMixin:
+    """
+    Mixin qui applique au queryset le plan de chargement (select_related,
+    prefetch_related, annotations) déduit du serializer de l’action courante
+    et des champs demandés (?fields= / ?expand=).
+    Les ViewSets l’appellent depuis get_queryset via planifier_queryset.
+    """
+    query_plan_actions = ('list', 'retrieve')
+
+    def planifier_queryset(self, queryset):
+        if getattr(self, 'action', None) not in self.query_plan_actions:
+            return queryset
+        return plan_pour(self.get_serializer_class(), self.get_serializer_context()).appliquer(queryset)
+
+
+
+class CachedResponseMixin:
+    """
+    Mixin de cache des réponses GET anonymes (list / retrieve, et les actions
+    qui appellent cached_response). La clé inclut la génération de chaque modèle
+    de `cache_models` : une modification (signal) invalide aussitôt les réponses.
+    """
+    cache_models = ()  # Modèles dont dépend la réponse
+    cache_actions = ('list', 'retrieve')
+    cache_timeout = settings.CACHE_TTL
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+    def get_cache_timeout(self):
+        return self.cache_timeout
+
+    def get_cache_key(self, request):
+        chemin = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        version = '.'.join(str(g) for g in generations(self.cache_models))
+        return f'reponse:{self.basename}:{self.action}:{version}:{chemin}'
+
+    def is_cacheable(self, request):
+        return (
+            request.method == 'GET'
+            and self.action in self.cache_actions
+            and not request.user.is_authenticated
+        )
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return handler(request, *args, **kwargs)
+        cle = self.get_cache_key(request)
+        entree = cache.get(cle)
+        if entree is not None:
+            data, entetes = entree
+            # Les validateurs (ConditionalGetMixin) sont conservés avec la réponse
+            response = Response(status=304) if etag_correspond(request, entetes.get('ETag')) else Response(data)
+            for nom, valeur in entetes.items():
+                response[nom] = valeur
+            return response
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            entetes = {nom: response[nom] for nom in ('ETag', 'Last-Modified') if response.has_header(nom)}
+            cache.set(cle, (response.data, entetes), self.get_cache_timeout())
+        return response
+
+
+def etag_correspond(request, etag):
+    """Vrai si l’en-tête If-None-Match de la requête désigne `etag` (comparaison faible)."""
+    entete = request.headers.get('If-None-Match')
+    if not entete or not etag:
+        return False
+    if entete.strip() == '*':
+        return True
+    valeur = etag.removeprefix('W/')
+    return any(candidat.strip().removeprefix('W/') == valeur for candidat in entete.split(','))
+
+
+class ConditionalGetMixin:
+    """
+    Mixin de GET conditionnel (ETag / Last-Modified) pour list et retrieve.
+    Le validateur est calculé en une requête d’agrégat, avant toute sérialisation :
+    max(`conditional_field`) et nombre de lignes pour une liste, date de l’objet pour un détail.
+    Les modèles de `conditional_models` (par défaut `cache_models`) entrent dans l’ETag
+    par leur génération, car la réponse en dépend sans modifier la date de l’objet.
+    Si le client présente un validateur encore valide, la réponse est un 304 sans corps.
+    """
+    conditional_field = 'date_mise_a_jour'
+    conditional_models = None  # None : reprend cache_models
+    conditional_actions = ('list', 'retrieve')
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().retrieve, *args, **kwargs)
+
+    def get_conditional_models(self):
+        if self.conditional_models is None:
+            return getattr(self, 'cache_models', ())
+        return self.conditional_models
+
+    def get_conditional_queryset(self):
+        """Queryset sur lequel porte le validateur (filtres de la requête appliqués)."""
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.detail:
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return queryset
+
+    def get_validators(self, request):
+        """(etag, last_modified), ou (None, None) si l’objet demandé n’existe pas."""
+        queryset = self.get_conditional_queryset()
+        if self.detail:
+            derniere = queryset.values_list(self.conditional_field, flat=True).first()
+            if derniere is None:
+                return None, None
+            total = 1
+        else:
+            agregat = queryset.order_by().aggregate(derniere=Max(self.conditional_field), total=Count('pk'))
+            derniere, total = agregat['derniere'], agregat['total']
+        version = '.'.join(str(g) for g in generations(self.get_conditional_models()))
+        utilisateur = request.user.pk if request.user.is_authenticated else ''
+        empreinte = f'{request.get_full_path()}|{utilisateur}|{derniere}|{total}|{version}'
+        etag = f'W/"{hashlib.md5(empreinte.encode()).hexdigest()}"'
+        return etag, derniere
+
+    def non_modifie_depuis(self, request, derniere):
+        """If-Modified-Since n’est fiable que pour un détail sans dépendance externe."""
+        if not self.detail or derniere is None or self.get_conditional_models():
+            return False
+        if 'If-None-Match' in request.headers:
+            return False  # If-None-Match prime (RFC 9110)
+        depuis = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return depuis is not None and int(derniere.timestamp()) <= depuis
+
+    def conditional_response(self, request, handler, *args, **kwargs):
+        if request.method != 'GET' or self.action not in self.conditional_actions:
+            return handler(request, *args, **kwargs)
+        etag, derniere = self.get_validators(request)
+        if etag is None:
+            return handler(request, *args, **kwargs)
+        if etag_correspond(request, etag) or self.non_modifie_depuis(request, derniere):
+            response = Response(status=304)
+        else:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if derniere is not None and isinstance(derniere, datetime):
+            response['Last-Modified'] = http_date(derniere.timestamp())
+        return response
+
+
+class _Rejeu(Exception):
+    """Interrompt l'action : la réponse est déjà connue (rejeu ou conflit)."""
+
+    def __init__(self, response):
+        self.response = response
+
+
+class IdempotencyMixin:
+    """
+    Mixin d'idempotence des POST listés dans `idempotent_actions` : un client qui envoie
+    l'en-tête Idempotency-Key obtient, pour toute nouvelle tentative avec la même clé,
+    la réponse de la première exécution (en-tête Idempotent-Replayed), sans que l'action
+    soit rejouée. La réponse est conservée IDEMPOTENCE_TTL secondes, par utilisateur.
+    Un doublon concurrent attend la fin de la première exécution (au plus
+    IDEMPOTENCE_ATTENTE secondes, puis 409). Une clé réutilisée avec un autre corps
+    de requête est refusée (422). Les erreurs 5xx ne sont pas conservées : la
+    tentative suivante exécute de nouveau l'action.
+    """
+    idempotent_actions = ()
+    idempotency_header = 'Idempotency-Key'
+    idempotency_ttl = getattr(settings, 'IDEMPOTENCE_TTL', 60 * 60 * 24)
+    idempotency_wait = getattr(settings, 'IDEMPOTENCE_ATTENTE', 10)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._idempotence = None
+        cle = request.headers.get(self.idempotency_header)
+        if not cle or request.method != 'POST' or self.action not in self.idempotent_actions:
+            return
+        if len(cle) > 255:
+            raise _Rejeu(Response({'error': 'Idempotency-Key trop longue'}, status=status.HTTP_400_BAD_REQUEST))
+        cible = f"{request.user.pk}:{self.basename}:{self.action}:{self.kwargs.get(self.lookup_url_kwarg or self.lookup_field, '')}"
+        base = f"idempotence:{hashlib.md5(f'{cible}:{cle}'.encode()).hexdigest()}"
+        empreinte = hashlib.md5(json.dumps(request.data, sort_keys=True, default=str).encode()).hexdigest()
+        cle_reponse, cle_verrou = f'{base}:reponse', f'{base}:verrou'
+
+        limite = time.monotonic() + self.idempotency_wait
+        while True:
+            entree = cache.get(cle_reponse)
+            if entree is not None:
+                raise _Rejeu(self._rejouer(entree, empreinte))
+            if cache.add(cle_verrou, empreinte, self.idempotency_wait + 60):
+                self._idempotence = (cle_reponse, cle_verrou, empreinte)
+                return
+            if cache.get(cle_verrou) not in (None, empreinte):
+                raise _Rejeu(self._cle_reutilisee())
+            if time.monotonic() >= limite:
+                raise _Rejeu(Response(
+                    {'error': 'Requête identique en cours de traitement, réessayez'},
+                    status=status.HTTP_409_CONFLICT,
+                ))
+            time.sleep(0.05)
+
+    def _rejouer(self, entree, empreinte):
+        empreinte_initiale, statut, data = entree
+        if empreinte_initiale != empreinte:
+            return self._cle_reutilisee()
+        response = Response(data, status=statut)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    def _cle_reutilisee(self):
+        return Response(
+            {'error': 'Idempotency-Key déjà utilisée pour une autre requête'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+
+    def handle_exception(self, exc):
+        if isinstance(exc, _Rejeu):
+            return exc.response
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            # Exception non gérée : finalize_response ne sera pas appelée, le verrou est rendu ici
+            if getattr(self, '_idempotence', None):
+                cache.delete(self._idempotence[1])
+                self._idempotence = None
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, '_idempotence', None):
+            cle_reponse, cle_verrou, empreinte = self._idempotence
+            self._idempotence = None
+            if response.status_code < 500:
+                cache.set(cle_reponse, (empreinte, response.status_code, getattr(response, 'data', None)), self.idempotency_ttl)
+            cache.delete(cle_verrou)
+        return response
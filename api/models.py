@@ -1,13 +1,16 @@
 from datetime import timedelta
 from decimal import Decimal
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from django.utils.crypto import get_random_string
 from django.core.validators import FileExtensionValidator
 from django.core.exceptions import ValidationError
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 import os
+from .stockage import stockage_images
 
 
 def validate_image(file):
@@ -22,6 +25,7 @@ def validate_image(file):
 class Photo(models.Model):
     image = models.ImageField(
         upload_to='photos/%Y/%m/%d/', 
+        storage=stockage_images,  # Nom réel : empreinte du contenu (api.stockage)
         validators=[validate_image],
         help_text="Image au format JPG, JPEG, PNG ou GIF, max 5MB"
     )
@@ -29,6 +33,7 @@ class Photo(models.Model):
     produit = models.ForeignKey('Produit', on_delete=models.CASCADE, related_name='photos', null=True, blank=True)
     service = models.ForeignKey('Service', on_delete=models.CASCADE, related_name='photos', null=True, blank=True)
     realisation = models.ForeignKey('Realisation', on_delete=models.CASCADE, related_name='photos', null=True, blank=True)
+    variantes = models.JSONField(default=dict, blank=True, editable=False)  # Tailles réduites, voir api.images
 
     class Meta:
         verbose_name = "Photo"
@@ -100,12 +105,29 @@ class OTP(models.Model):
     def est_valide(self):
         return not self.is_used and timezone.now() <= self.expiration
 
+class SuggestionMixin:
+    """Retient le nom visible lu en base (nom si actif, sinon None ; absent si nom ou is_active différé)."""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'nom' in instance.__dict__ and 'is_active' in instance.__dict__:
+            # api.signals ne touche l'index d'autocomplétion que si ce nom visible change
+            instance._suggestion_charge = instance.nom if instance.is_active else None
+        return instance
+
+
 # Modèle Catégorie
-class Categorie(models.Model):
+class Categorie(SuggestionMixin, models.Model):
     nom = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True, null=True)
     is_active = models.BooleanField(default=True)  # Pour désactiver une catégorie sans suppression
     date_creation = models.DateTimeField(auto_now_add=True)
+    # Seuil d'alerte de stock faible de ses produits (sauf seuil propre) ; vide : SEUIL_STOCK_FAIBLE
+    seuil_stock_faible = models.PositiveIntegerField(null=True, blank=True)
+    # Compteurs dénormalisés, maintenus par api.signals (voir api.counters)
+    produits_count = models.PositiveIntegerField(default=0, editable=False)
+    produits_actifs_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         verbose_name = "Catégorie"
@@ -116,14 +138,28 @@ class Categorie(models.Model):
 
 
 class UploadedImage(models.Model):
-    image = models.ImageField(upload_to="article_images/")  # Images dans le contenu
+    image = models.ImageField(upload_to="article_images/", storage=stockage_images)  # Images dans le contenu
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    variantes = models.JSONField(default=dict, blank=True, editable=False)  # Tailles réduites, voir api.images
 
     def __str__(self):
         return f"Image uploaded at {self.uploaded_at}"
 
+class FichierImage(models.Model):
+    """Fichier du stockage adressé par le contenu, avec le nombre de Photo / UploadedImage qui l'utilisent."""
+    nom = models.CharField(max_length=255, unique=True)
+    references = models.IntegerField(default=0)
+    orphelin_depuis = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Fichier image"
+        verbose_name_plural = "Fichiers images"
+
+    def __str__(self):
+        return f"{self.nom} ({self.references} références)"
+
 # Modèle Produit
-class Produit(models.Model):
+class Produit(SuggestionMixin, models.Model):
     nom = models.CharField(max_length=100)
     description = models.TextField()
     prix = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
@@ -132,6 +168,13 @@ class Produit(models.Model):
     is_active = models.BooleanField(default=True)
     date_creation = models.DateTimeField(auto_now_add=True)
     date_mise_a_jour = models.DateTimeField(auto_now=True)
+    search_vector = SearchVectorField(null=True, editable=False)  # Maintenu par api.signals (PostgreSQL)
+    # Prix après la plus forte promotion active, maintenu par api.pricing.recalculer_prix_effectifs
+    prix_effectif = models.DecimalField(max_digits=10, decimal_places=2, null=True, editable=False, db_index=True)
+    # Alerte de stock faible (api.alertes) : seuil propre, sinon celui de la catégorie ;
+    # alerte_stock_faible est vrai tant que le produit est resté sous le seuil depuis l'alerte
+    seuil_stock_faible = models.PositiveIntegerField(null=True, blank=True)
+    alerte_stock_faible = models.BooleanField(default=False, editable=False)
 
     # Plus de photos = models.JSONField(default=list, blank=True)
     # La relation avec Photo est gérée via related_name='photos'
@@ -139,10 +182,72 @@ class Produit(models.Model):
     class Meta:
         verbose_name = "Produit"
         verbose_name_plural = "Produits"
+        indexes = [GinIndex(fields=['search_vector'], name='produit_search_gin')]
 
     def __str__(self):
         return f"{self.nom} ({self.categorie})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Stock lu en base : api.signals ne journalise un save() que si l'appelant l'a modifié
+        instance._stock_charge = instance.__dict__.get('stock')
+        return instance
+
+    # Les compteurs de la catégorie et le journal du stock (api.signals) sont mis à jour dans la même transaction
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+# Journal des mouvements de stock (api.stock) : une ligne par variation, jamais modifiée.
+# Produit.stock reste le compteur sur lequel s'appliquent les UPDATE conditionnels ;
+# le journal en garde l'historique et permet de le recalculer (instantané + mouvements récents).
+class MouvementStock(models.Model):
+    RAISONS = [
+        ('initial', 'Stock initial'),
+        ('panier', 'Réservation panier'),          # Ajout, modification ou retrait d'une ligne
+        ('expiration', 'Réservation expirée'),
+        ('annulation', 'Annulation de commande'),
+        ('remboursement', 'Remboursement'),
+        ('ajustement', 'Ajustement manuel'),      # Modification du produit (admin)
+        ('import', 'Import du catalogue'),
+    ]
+    id = models.BigAutoField(primary_key=True)
+    produit = models.ForeignKey(Produit, on_delete=models.CASCADE, related_name='mouvements_stock')
+    delta = models.IntegerField()
+    raison = models.CharField(max_length=20, choices=RAISONS)
+    reference = models.CharField(max_length=50, blank=True)  # Ex. 'panier:12', 'commande:34'
+    date = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Mouvement de stock"
+        verbose_name_plural = "Mouvements de stock"
+        indexes = [
+            models.Index(fields=['produit', 'id'], name='mouvement_produit_id_idx'),  # Historique, recalcul
+            models.Index(fields=['date'], name='mouvement_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.delta:+d} {self.produit_id} ({self.raison})"
+
+# Stock compacté d'un produit : somme de ses mouvements jusqu'à dernier_mouvement inclus
+class InstantaneStock(models.Model):
+    produit = models.OneToOneField(Produit, on_delete=models.CASCADE, primary_key=True, related_name='instantane_stock')
+    stock = models.IntegerField(default=0)
+    dernier_mouvement = models.BigIntegerField(default=0)
+    date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Instantané de stock"
+        verbose_name_plural = "Instantanés de stock"
+
+    def __str__(self):
+        return f"{self.produit_id} : {self.stock} (mouvement {self.dernier_mouvement})"
+
 # Modèle Promotion
 class Promotion(models.Model):
     nom = models.CharField(max_length=100, unique=True)
@@ -188,6 +293,10 @@ class PanierProduit(models.Model):
     produit = models.ForeignKey(Produit, on_delete=models.CASCADE, related_name='paniers')
     quantite = models.IntegerField(validators=[MinValueValidator(1)])
     date_ajout = models.DateTimeField(auto_now_add=True)
+    # Stock retenu pour cette ligne jusqu'à reserve_jusqu_a (voir api.stock) ; libéré ensuite
+    # par la tâche liberer_reservations_expirees, la ligne restant au panier sans réservation.
+    reserve_jusqu_a = models.DateTimeField(null=True, blank=True, db_index=True)
+    reservation_active = models.BooleanField(default=True)
 
     class Meta:
         unique_together = ('panier', 'produit')  # Un produit unique par panier
@@ -293,7 +402,7 @@ class Devis(models.Model):
             self.save()
 
 # Modèle Service
-class Service(models.Model):
+class Service(SuggestionMixin, models.Model):
     nom = models.CharField(max_length=100, unique=True)
     description = models.TextField()
     is_active = models.BooleanField(default=True)
@@ -426,6 +535,7 @@ class Article(models.Model):
     titre = models.CharField(max_length=200)
     contenu = models.TextField()
     cover = models.ImageField(upload_to='article_covers', null=True, blank=True)
+    variantes = models.JSONField(default=dict, blank=True, editable=False)  # Tailles réduites de la couverture
     auteur = models.ForeignKey(Utilisateur, on_delete=models.CASCADE)
     date_publication = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
@@ -440,6 +550,11 @@ class Article(models.Model):
 
 # Modèle Commentaire
 class Commentaire(models.Model):
+    STATUTS_MODERATION = [
+        ('en_attente', 'En attente'),  # Enregistré, pas encore visible (tâche moderer_commentaire)
+        ('approuve', 'Approuvé'),
+        ('rejete', 'Rejeté'),
+    ]
     article = models.ForeignKey('Article', on_delete=models.CASCADE, related_name='commentaires')
     client = models.ForeignKey(Utilisateur, on_delete=models.CASCADE)
     texte = models.TextField()
@@ -447,6 +562,7 @@ class Commentaire(models.Model):
     parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='reponses')
     is_active = models.BooleanField(default=True)  # Visible publiquement ou non
     ban_reason = models.TextField(null=True, blank=True)  # Raison du bannissement, si applicable
+    statut_moderation = models.CharField(max_length=20, choices=STATUTS_MODERATION, default='en_attente')
 
     class Meta:
         ordering = ['id']
@@ -504,6 +620,7 @@ class Commande(models.Model):
     class Meta:
         verbose_name = "Commande"
         verbose_name_plural = "Commandes"
+        indexes = [models.Index(fields=['date', 'id'], name='commande_date_id_idx')]  # Pagination par clé
 
     def __str__(self):
         return f"Commande #{self.id} - {self.client}"
@@ -552,6 +669,7 @@ class Paiement(models.Model):
     class Meta:
         verbose_name = "Paiement"
         verbose_name_plural = "Paiements"
+        indexes = [models.Index(fields=['date', 'id'], name='paiement_date_id_idx')]  # Pagination par clé
 
     def __str__(self):
         return f"Paiement #{self.id} - {self.type_transaction} ({self.statut})"
@@ -569,4 +687,47 @@ class Wishlist(models.Model):
         unique_together = ('client',)  # Une seule wishlist par client
 
     def __str__(self):
-        return f"Wishlist de {self.client.username}"
\ No newline at end of file
+        return f"Wishlist de {self.client.username}"
+
+# File d'envoi des e-mails (api.courriels) : écrite dans la transaction de la requête,
+# vidée par la tâche Celery envoyer_courriels
+class Courriel(models.Model):
+    STATUTS = [
+        ('en_attente', 'En attente'),  # À envoyer (ou à réessayer) à partir de prochain_essai
+        ('envoye', 'Envoyé'),
+        ('echec', 'Échec'),            # Abandonné après MAX_TENTATIVES
+    ]
+    sujet = models.CharField(max_length=255)
+    texte = models.TextField()
+    html = models.TextField(blank=True)
+    expediteur = models.CharField(max_length=255)
+    destinataires = models.JSONField(default=list)
+    statut = models.CharField(max_length=20, choices=STATUTS, default='en_attente')
+    tentatives = models.PositiveIntegerField(default=0)
+    prochain_essai = models.DateTimeField(default=timezone.now)
+    derniere_erreur = models.TextField(blank=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_envoi = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Courriel"
+        verbose_name_plural = "Courriels"
+        indexes = [models.Index(fields=['statut', 'prochain_essai'], name='courriel_a_envoyer_idx')]
+
+    def __str__(self):
+        return f"{self.sujet} → {', '.join(self.destinataires)} ({self.statut})"
+
+
+class VerdictModeration(models.Model):
+    """Verdict du modèle de modération pour un texte, repéré par l'empreinte de sa forme normalisée."""
+    empreinte = models.CharField(max_length=64, primary_key=True)  # SHA-256 hexadécimal
+    approprie = models.BooleanField()
+    raison = models.TextField(blank=True)
+    date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Verdict de modération"
+        verbose_name_plural = "Verdicts de modération"
+
+    def __str__(self):
+        return f"{self.empreinte[:12]} : {'approprié' if self.approprie else 'inapproprié'}"
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import re
+import unicodedata
+import requests
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from .cache import invalider
+from .models import Commentaire, VerdictModeration
+
+# Modération des commentaires, hors requête : un commentaire est enregistré 'en_attente'
+# (invisible) et la tâche moderer_commentaire lui applique un verdict.
+# 1. Préfiltre local : une expression compilée une fois, qui réunit la liste de mots
+#    interdits (MOTS_INTERDITS, complétée par settings.MODERATION_MOTS_INTERDITS), parcourt
+#    le texte normalisé en une passe ; trop de liens vaut aussi rejet (spam).
+# 2. Cache : les verdicts du modèle sont conservés par empreinte SHA-256 du texte
+#    normalisé (VerdictModeration) ; un texte déjà jugé n'est pas renvoyé au modèle.
+# 3. Modèle (Gemini par défaut, MODERATION_URL) appelé avec un délai maximal
+#    (MODERATION_TIMEOUT) : une panne lève ErreurModeration, et la tâche réessaie.
+# Un commentaire encore en attente après toute la série d'essais (RELANCE_APRES) a perdu sa
+# tâche : a_relancer le réserve en cache pour qu'une seule nouvelle série soit lancée.
+
+MODERATION_URL = getattr(
+    settings, 'MODERATION_URL',
+    'https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent',
+)
+MODERATION_TIMEOUT = getattr(settings, 'MODERATION_TIMEOUT', (3, 10))  # (connexion, lecture) en secondes
+LIENS_MAX = 2
+ESSAIS_MAX = 5  # Nouvelles tentatives de la tâche moderer_commentaire
+DELAI_ESSAI = timedelta(seconds=30)
+
+
+def delai_essai(essai):
+    """Attente avant la nouvelle tentative n° `essai` (0, 1…) : 30 s, 1 min, 2 min…"""
+    return DELAI_ESSAI * 2 ** essai
+
+
+# Série d'essais complète, plus une marge pour les appels eux-mêmes et la file Celery
+RELANCE_APRES = sum((delai_essai(essai) for essai in range(ESSAIS_MAX)), timedelta()) + timedelta(minutes=15)
+
+MOTS_INTERDITS = [
+    'connard', 'connasse', 'salope', 'salaud', 'encule', 'enculé', 'batard', 'bâtard', 'pute', 'putain',
+    'fils de pute', 'nique ta mere', 'ntm', 'pd', 'pédé', 'tapette', 'negre', 'nègre', 'bougnoule',
+    'crétin', 'abruti', 'débile', 'merde', 'ta gueule', 'fdp',
+    'fuck', 'fucking', 'shit', 'bitch', 'asshole', 'motherfucker', 'cunt',
+    'viagra', 'casino en ligne', 'crypto gratuite',
+]
+
+_LEET = str.maketrans({'0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '@': 'a', '$': 's'})
+_NON_MOTS = re.compile(r'[\W_]+')
+_REPETITIONS = re.compile(r'(\w)\1+')  # « connaaard » → « conard », comme la liste compilée
+_LETTRES_ESPACEES = re.compile(r'\b\w(?: \w\b){2,}')  # « m e r d e » → « merde »
+_LIENS = re.compile(r'https?://|www\.', re.I)
+
+
+class ErreurModeration(Exception):
+    """Le modèle de modération n'a pas répondu, ou pas dans le format attendu."""
+
+
+def normaliser(texte):
+    """Minuscules, sans accents ni ponctuation, espaces réduits : la forme hachée et filtrée."""
+    texte = unicodedata.normalize('NFKD', texte)
+    texte = ''.join(c for c in texte if not unicodedata.combining(c)).casefold()
+    return _NON_MOTS.sub(' ', texte).strip()
+
+
+def empreinte(texte):
+    return hashlib.sha256(normaliser(texte).encode()).hexdigest()
+
+
+def _forme_filtree(texte):
+    texte = normaliser(texte).translate(_LEET)
+    texte = _LETTRES_ESPACEES.sub(lambda m: m.group(0).replace(' ', ''), texte)
+    return _REPETITIONS.sub(r'\1', texte)
+
+
+def _compiler(mots):
+    # Les mots les plus longs d'abord : « fils de pute » est reconnu avant « pute »
+    formes = sorted({_forme_filtree(mot) for mot in mots if normaliser(mot)}, key=len, reverse=True)
+    return re.compile(r'\b(?:' + '|'.join(re.escape(forme) for forme in formes) + r')\b')
+
+
+_INTERDITS = _compiler(MOTS_INTERDITS + list(getattr(settings, 'MODERATION_MOTS_INTERDITS', [])))
+
+
+def prefiltrer(texte):
+    """(approprie, raison) si le texte se juge sans le modèle, sinon None."""
+    if len(_LIENS.findall(texte)) > LIENS_MAX:
+        return False, 'Trop de liens (spam)'
+    if _INTERDITS.search(_forme_filtree(texte)):
+        return False, 'Langage inapproprié'
+    return None
+
+
+def demander_au_modele(texte):
+    """(approprie, raison) selon le modèle ; lève ErreurModeration en cas de panne ou de réponse illisible."""
+    consigne = f"""
+    Analyse le texte suivant et détermine s'il contient du contenu inapproprié (insultes, langage offensant, spam, etc.).
+    Retourne un objet JSON avec :
+    - "isAppropriate": true/false
+    - "reason": une courte explication si inapproprié
+    Texte à analyser : "{texte}"
+    """
+    try:
+        response = requests.post(
+            MODERATION_URL, json={'contents': [{'parts': [{'text': consigne}]}]},
+            params={'key': settings.GEMINI_API_KEY}, timeout=MODERATION_TIMEOUT,
+        )
+        response.raise_for_status()
+        reponse = response.json()['candidates'][0]['content']['parts'][0]['text']
+        # Le JSON peut être entouré d'un bloc Markdown ```json … ```
+        match = re.search(r'\{.*\}', reponse, re.DOTALL)
+        resultat = json.loads(match.group(0) if match else reponse)
+        return bool(resultat['isAppropriate']), str(resultat.get('reason') or '')
+    except (requests.RequestException, ValueError, KeyError, IndexError, TypeError) as erreur:
+        raise ErreurModeration(f'{erreur.__class__.__name__}: {erreur}') from erreur
+
+
+def verdict(texte):
+    """(approprie, raison) : préfiltre, puis verdict en cache, puis modèle (résultat mis en cache)."""
+    resultat = prefiltrer(texte)
+    if resultat is not None:
+        return resultat
+    cle = empreinte(texte)
+    connu = VerdictModeration.objects.filter(pk=cle).values_list('approprie', 'raison').first()
+    if connu:
+        return connu
+    approprie, raison = demander_au_modele(texte)
+    VerdictModeration.objects.bulk_create(
+        [VerdictModeration(empreinte=cle, approprie=approprie, raison=raison)], ignore_conflicts=True
+    )
+    return approprie, raison
+
+
+def appliquer(commentaire_id, approprie, raison=''):
+    """
+    Rend le commentaire visible ou le rejette, s'il est toujours en attente : une décision
+    d'administrateur prise entre-temps (action moderate) n'est pas écrasée.
+    """
+    fait = Commentaire.objects.filter(pk=commentaire_id, statut_moderation='en_attente').update(
+        statut_moderation='approuve' if approprie else 'rejete',
+        is_active=approprie,
+        ban_reason=None if approprie else (raison or 'Contenu inapproprié'),
+    )
+    if fait:
+        invalider(Commentaire)  # update() ne déclenche pas post_save : articles en cache
+    return fait
+
+
+def moderer(commentaire_id):
+    """Juge un commentaire en attente ; retourne son statut. ErreurModeration si le modèle est indisponible."""
+    texte = Commentaire.objects.filter(
+        pk=commentaire_id, statut_moderation='en_attente'
+    ).values_list('texte', flat=True).first()
+    if texte is None:
+        return None
+    approprie, raison = verdict(texte)
+    appliquer(commentaire_id, approprie, raison)
+    return 'approuve' if approprie else 'rejete'
+
+
+def a_relancer(maintenant, limite=100):
+    """
+    Ids des commentaires en attente depuis plus de RELANCE_APRES, chacun réservé pour
+    RELANCE_APRES : un commentaire déjà relancé ne l'est pas de nouveau pendant sa série d'essais.
+    """
+    ids = Commentaire.objects.filter(
+        statut_moderation='en_attente', date__lte=maintenant - RELANCE_APRES
+    ).order_by('id').values_list('id', flat=True)[:limite]
+    return [pk for pk in ids if cache.add(f'moderation:relance:{pk}', 1, RELANCE_APRES.total_seconds())]
@@ -0,0 +1,166 @@
+import base64
+import json
+from functools import reduce
+from operator import or_
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    page_size = 10
+    page_size_query_param = 'per_page'
+    max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pagination par clé (keyset) : la page suivante est lue avec un
+    WHERE (date, id) < (dernière date, dernier id) au lieu d’un OFFSET,
+    sans COUNT(*). L’ordre est stable même si des lignes sont insérées entre deux pages.
+    Le ViewSet peut définir `keyset_ordering` (ex. ('-date', '-id')) ; par défaut ('-id',).
+    Le dernier champ doit être unique (l’id) pour départager les ex æquo.
+    """
+    page_size = StandardResultsSetPagination.page_size
+    page_size_query_param = StandardResultsSetPagination.page_size_query_param
+    max_page_size = StandardResultsSetPagination.max_page_size
+    cursor_query_param = 'cursor'
+    ordering = ('-id',)
+    invalid_cursor_message = 'Curseur invalide'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_ordering(self, view):
+        ordering = tuple(getattr(view, 'keyset_ordering', self.ordering))
+        if len({champ.startswith('-') for champ in ordering}) != 1:
+            raise ValueError('keyset_ordering doit utiliser un seul sens de tri.')
+        return ordering
+
+    def encode_cursor(self, valeurs):
+        # isoformat conserve les microsecondes (DjangoJSONEncoder les tronque)
+        valeurs = [v.isoformat() if hasattr(v, 'isoformat') else v for v in valeurs]
+        brut = json.dumps(valeurs, cls=DjangoJSONEncoder).encode()
+        return base64.urlsafe_b64encode(brut).decode()
+
+    def decode_cursor(self, request, model, champs):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            valeurs = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if len(valeurs) != len(champs):
+                raise ValueError
+            return [model._meta.get_field(champ).to_python(valeur) for champ, valeur in zip(champs, valeurs)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def filtre_apres(self, champs, valeurs, descendant):
+        """(c1, c2, ...) après (v1, v2, ...) dans le sens du tri, en conditions indexables."""
+        lookup = 'lt' if descendant else 'gt'
+        conditions = []
+        for i, champ in enumerate(champs):
+            egalites = {c: v for c, v in zip(champs[:i], valeurs[:i])}
+            conditions.append(Q(**egalites, **{f'{champ}__{lookup}': valeurs[i]}))
+        return reduce(or_, conditions)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        ordering = self.get_ordering(view)
+        champs = [champ.lstrip('-') for champ in ordering]
+        descendant = ordering[0].startswith('-')
+
+        queryset = queryset.order_by(*ordering)
+        valeurs = self.decode_cursor(request, queryset.model, champs)
+        if valeurs is not None:
+            queryset = queryset.filter(self.filtre_apres(champs, valeurs, descendant))
+
+        resultats = list(queryset[:self.page_size + 1])
+        self.has_next = len(resultats) > self.page_size
+        resultats = resultats[:self.page_size]
+        self.next_cursor = None
+        if self.has_next:
+            dernier = resultats[-1]
+            self.next_cursor = self.encode_cursor([getattr(dernier, champ) for champ in champs])
+        return resultats
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_first_link(self):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, '')
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'first': self.get_first_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'first': {'type': 'string', 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Curseur de pagination (vide pour la première page).',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Nombre de résultats par page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+class StandardOrKeysetPagination(StandardResultsSetPagination):
+    """
+    Pagination par numéro de page par défaut ; bascule en KeysetPagination dès que
+    le paramètre ?cursor= est présent (même vide pour la première page).
+    Utile pour les tables d’admin (pages numérotées) et le défilement infini mobile.
+    """
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.keyset_class.cursor_query_param in request.query_params:
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        parametres = super().get_schema_operation_parameters(view)
+        return parametres + self.keyset_class().get_schema_operation_parameters(view)[:1]
@@ -0,0 +1,109 @@
+from decimal import Decimal, ROUND_HALF_UP
+from django.db.models import Q
+from django.utils import timezone
+from .cache import invalider
+from .models import Produit, Promotion
+
+CENTIMES = Decimal('0.01')
+TAILLE_LOT = 500
+
+
+def promotions_actives(now=None):
+    """Promotions actives à l'instant `now` (par défaut : maintenant)."""
+    now = now or timezone.now()
+    return Promotion.objects.filter(is_active=True, date_debut__lte=now, date_fin__gte=now)
+
+
+def appliquer_reduction(prix, reduction):
+    """Applique une réduction (entre 0 et 1) à un prix et arrondit au centime."""
+    prix = Decimal(str(prix)) * (1 - Decimal(str(reduction)))
+    return prix.quantize(CENTIMES, rounding=ROUND_HALF_UP)
+
+
+class PromotionIndex:
+    """
+    Index en mémoire des promotions actives, par produit et par catégorie.
+    Une promotion s'applique à ses produits et à tous les produits de sa catégorie
+    (même règle que PromotionViewSet.produits_affectes). Quand plusieurs promotions
+    s'appliquent, seule la plus forte réduction est retenue, comme au paiement.
+    """
+
+    def __init__(self, lignes, produit_ids=None):
+        # lignes : itérable de (promotion_id, reduction, categorie_id, produit_id)
+        # produit_ids : produits couverts par l'index, None si toutes les promotions actives sont chargées
+        self.par_produit = {}
+        self.par_categorie = {}
+        self.produit_ids = set(produit_ids) if produit_ids is not None else None
+        for _, reduction, categorie_id, produit_id in lignes:
+            reduction = Decimal(str(reduction))
+            if produit_id is not None:
+                self.par_produit[produit_id] = max(reduction, self.par_produit.get(produit_id, Decimal('0')))
+            if categorie_id is not None:
+                self.par_categorie[categorie_id] = max(reduction, self.par_categorie.get(categorie_id, Decimal('0')))
+
+    @classmethod
+    def _charger(cls, queryset, produit_ids=None):
+        lignes = queryset.values_list('id', 'reduction', 'categorie_id', 'produits')
+        return cls(lignes, produit_ids=produit_ids)
+
+    @classmethod
+    def actives(cls, now=None):
+        """Charge toutes les promotions actives en une requête."""
+        return cls._charger(promotions_actives(now))
+
+    @classmethod
+    def pour_produits(cls, produits, now=None):
+        """Charge en une requête les promotions actives touchant un ensemble de produits."""
+        produits = list(produits)
+        produit_ids = {p.id for p in produits}
+        categorie_ids = {p.categorie_id for p in produits if p.categorie_id is not None}
+        if not produits:
+            return cls([], produit_ids=produit_ids)
+        queryset = promotions_actives(now).filter(
+            Q(produits__in=produit_ids) | Q(categorie_id__in=categorie_ids)
+        )
+        return cls._charger(queryset, produit_ids=produit_ids)
+
+    def couvre(self, produit):
+        return self.produit_ids is None or produit.id in self.produit_ids
+
+    def reduction(self, produit):
+        """Plus forte réduction applicable au produit (Decimal, 0 si aucune)."""
+        return max(
+            self.par_produit.get(produit.id, Decimal('0')),
+            self.par_categorie.get(produit.categorie_id, Decimal('0')),
+        )
+
+    def prix(self, produit):
+        """Prix unitaire effectif du produit, arrondi au centime."""
+        return appliquer_reduction(produit.prix, self.reduction(produit))
+
+    def total(self, items):
+        """Total d'une liste de lignes (objets avec `produit` et `quantite`)."""
+        return sum((self.prix(item.produit) * item.quantite for item in items), Decimal('0.00'))
+
+
+def recalculer_prix_effectifs(produits=None, now=None):
+    """
+    Recalcule la colonne Produit.prix_effectif pour `produits` (instances ou queryset),
+    ou pour tout le catalogue. N'écrit que les prix qui changent ; renvoie leur nombre.
+    """
+    if produits is None:
+        index = PromotionIndex.actives(now)
+        produits = Produit.objects.only('id', 'prix', 'categorie_id', 'prix_effectif').order_by().iterator(
+            chunk_size=TAILLE_LOT
+        )
+    else:
+        produits = list(produits)
+        index = PromotionIndex.pour_produits(produits, now)
+    modifies = []
+    for produit in produits:
+        prix = index.prix(produit)
+        if produit.prix_effectif != prix:
+            produit.prix_effectif = prix
+            modifies.append(produit)
+    if modifies:
+        # bulk_update ne déclenche pas post_save : invalidation explicite du cache
+        Produit.objects.bulk_update(modifies, ['prix_effectif'], batch_size=TAILLE_LOT)
+        invalider(Produit)
+    return len(modifies)
@@ -0,0 +1,96 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+from .fieldsets import cle_selection
+
+_plans = {}
+MAX_PLANS = 256  # ?fields= / ?expand= arbitraires : le cache des plans reste borné
+
+
+class QueryPlan:
+    """
+    Plan de chargement d'un queryset pour un serializer donné :
+    select_related pour les clés étrangères, prefetch_related pour les relations
+    multiples, et annotations déclarées dans `Meta.annotations` du serializer racine.
+    """
+
+    def __init__(self):
+        self.select_related = set()
+        self.prefetch_related = set()
+        self.annotations = {}
+
+    def appliquer(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*sorted(self.select_related))
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*sorted(self.prefetch_related))
+        if self.annotations:
+            queryset = queryset.annotate(**self.annotations)
+        return queryset
+
+
+def _relations(model, source_attrs):
+    """Suit un chemin d'attributs sur le modèle et retourne les champs relationnels traversés."""
+    chemin = []
+    for attr in source_attrs:
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            break
+        if not field.is_relation:
+            break
+        chemin.append(field)
+        model = field.related_model
+    return chemin
+
+
+def _ajouter(plan, prefixe, multiple, chemin):
+    """Ajoute le chemin au plan ; retourne (lookup, multiple) pour les relations imbriquées."""
+    lookup = prefixe
+    for field in chemin:
+        lookup = f'{lookup}__{field.name}' if lookup else field.name
+        multiple = multiple or field.many_to_many or field.one_to_many
+        if multiple:
+            plan.prefetch_related.add(lookup)
+        else:
+            plan.select_related.add(lookup)
+    return lookup, multiple
+
+
+def _planifier(plan, serializer, prefixe='', multiple=False):
+    model = serializer.Meta.model
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        chemin = _relations(model, field.source_attrs)
+        if not chemin:
+            continue
+        if isinstance(field, PrimaryKeyRelatedField) and len(chemin) == 1 and not (
+            chemin[0].many_to_many or chemin[0].one_to_many
+        ):
+            # Clé étrangère rendue par son id : pas besoin de charger l'objet
+            continue
+        lookup, imbrique_multiple = _ajouter(plan, prefixe, multiple, chemin)
+        if isinstance(field, ManyRelatedField):
+            continue
+        enfant = field.child if isinstance(field, serializers.ListSerializer) else field
+        if isinstance(enfant, serializers.ModelSerializer):
+            _planifier(plan, enfant, lookup, imbrique_multiple)
+
+
+def plan_pour(serializer_class, context=None):
+    """
+    Plan (mis en cache) pour une classe de serializer et la sélection ?fields= / ?expand=
+    de la requête du contexte : seules les relations effectivement rendues sont chargées.
+    """
+    context = context or {}
+    cle = (serializer_class, cle_selection(context))
+    plan = _plans.get(cle)
+    if plan is None:
+        plan = QueryPlan()
+        _planifier(plan, serializer_class(context=context))
+        plan.annotations = dict(getattr(serializer_class.Meta, 'annotations', {}))
+        if len(_plans) >= MAX_PLANS:
+            _plans.clear()
+        _plans[cle] = plan
+    return plan
@@ -0,0 +1,46 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F
+from rest_framework import filters
+
+# Configuration plein texte créée par la migration 0033 : français + unaccent
+SEARCH_CONFIG = 'french_unaccent'
+
+
+def recherche_plein_texte_disponible():
+    return connection.vendor == 'postgresql'
+
+
+def vecteur_produit():
+    """Expression du vecteur de recherche d'un produit (nom prioritaire sur la description)."""
+    return (
+        SearchVector('nom', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+    )
+
+
+def mettre_a_jour_vecteurs(queryset):
+    """Recalcule le vecteur de recherche stocké pour un queryset de produits."""
+    if recherche_plein_texte_disponible():
+        queryset.update(search_vector=vecteur_produit())
+
+
+class ProduitSearchFilter(filters.SearchFilter):
+    """
+    Recherche plein texte sur `Produit.search_vector` (index GIN), triée par pertinence.
+    Sur une base autre que PostgreSQL (tests SQLite), retombe sur le SearchFilter
+    classique (ILIKE sur search_fields).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        if not recherche_plein_texte_disponible():
+            return super().filter_queryset(request, queryset, view)
+        termes = self.get_search_terms(request)
+        if not termes:
+            return queryset
+        query = SearchQuery(' '.join(termes), config=SEARCH_CONFIG, search_type='websearch')
+        return (
+            queryset.filter(search_vector=query)
+            .annotate(rank=SearchRank(F('search_vector'), query))
+            .order_by('-rank', 'id')
+        )
@@ -1,11 +1,15 @@
 from django.utils import timezone
 from decimal import Decimal
+from django.db import models
 from rest_framework import serializers
 from .models import (
     AbonnementProduit, UploadedImage, Utilisateur, Categorie, Produit, Promotion, Commande, LigneCommande, Photo,
     Panier, PanierProduit, Adresse, Devis, Service, Realisation, Abonnement,
-    Atelier, Article, Commentaire, Parametre, Paiement, OTP, Wishlist, Participant
+    Atelier, Article, Commentaire, Parametre, Paiement, OTP, Wishlist, Participant, MouvementStock
 )
+from .fieldsets import DynamicFieldsMixin
+from .images import srcset
+from .pricing import PromotionIndex
 from drf_spectacular.utils import extend_schema_field
 from PIL import Image
 from io import BytesIO
@@ -25,13 +29,25 @@ def compress_and_convert_image(image):
     output.seek(0)
     return ContentFile(output.getvalue(), name=image.name.rsplit('.', 1)[0] + '.jpg')
 
-class PhotoSerializer(serializers.ModelSerializer):
+@extend_schema_field({'type': 'object', 'nullable': True, 'example': {'thumb': {'jpeg': 'url', 'webp': 'url'}}})
+class SrcsetField(serializers.Field):
+    """URLs des tailles réduites (JPEG / WebP) de l'image de l'objet, voir api.images."""
+
+    def __init__(self, **kwargs):
+        super().__init__(source='*', read_only=True, **kwargs)
+
+    def to_representation(self, instance):
+        return srcset(instance, self.context.get('request'))
+
+
+class PhotoSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    srcset = SrcsetField()
     entity_type = serializers.CharField(write_only=True)  # "produit", "service", etc.
     entity_id = serializers.CharField(write_only=True)    # ID de l'entité
 
     class Meta:
         model = Photo
-        fields = ['id', 'image', 'uploaded_at', 'entity_type', 'entity_id']
+        fields = ['id', 'image', 'srcset', 'uploaded_at', 'entity_type', 'entity_id']
         read_only_fields = ['id', 'uploaded_at']
 
     def validate(self, data):
@@ -77,21 +93,24 @@ class PhotoSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         request = self.context.get('request')
         representation = super().to_representation(instance)
-        representation['image'] = request.build_absolute_uri(instance.image.url) if request else instance.image.url
-        # Ajouter des infos sur l'entité associée
-        if instance.produit:
+        if 'image' in representation:
+            representation['image'] = request.build_absolute_uri(instance.image.url) if request else instance.image.url
+        if 'entity_type' not in self.fields:
+            return representation  # Exclu par ?fields=
+        # Ajouter des infos sur l'entité associée (par les ids : pas de requête)
+        if instance.produit_id:
             representation['entity_type'] = 'produit'
-            representation['entity_id'] = instance.produit.id
-        elif instance.service:
+            representation['entity_id'] = instance.produit_id
+        elif instance.service_id:
             representation['entity_type'] = 'service'
-            representation['entity_id'] = instance.service.id
-        elif instance.realisation:
+            representation['entity_id'] = instance.service_id
+        elif instance.realisation_id:
             representation['entity_type'] = 'realisation'
-            representation['entity_id'] = instance.realisation.id
+            representation['entity_id'] = instance.realisation_id
         return representation
 
 # Serializer pour Utilisateur
-class UtilisateurSerializer(serializers.ModelSerializer):
+class UtilisateurSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Utilisateur
         fields = ['id', 'username', 'email', 'adresse', 'telephone', 'role', 'is_active', 'date_creation', 'date_mise_a_jour', 'password', 'is_banned']
@@ -114,7 +133,7 @@ class UtilisateurSerializer(serializers.ModelSerializer):
         return user
     
 
-class OTPSerializer(serializers.ModelSerializer):
+class OTPSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = OTP
         fields = ['id', 'utilisateur', 'code', 'date_creation', 'expiration', 'is_used']
@@ -127,22 +146,36 @@ class OTPSerializer(serializers.ModelSerializer):
 
 # Serializer pour Categorie
 
-class CategorieSerializer(serializers.ModelSerializer):
-    produits_count = serializers.SerializerMethodField()
-
+class CategorieSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Categorie
-        fields = ['id', 'nom', 'description', 'is_active', 'date_creation', 'produits_count']
-        read_only_fields = ['date_creation']
+        fields = [
+            'id', 'nom', 'description', 'is_active', 'seuil_stock_faible', 'date_creation', 'produits_count',
+            'produits_actifs_count',
+        ]
+        read_only_fields = ['date_creation', 'produits_count', 'produits_actifs_count']  # Compteurs dénormalisés
 
-    @extend_schema_field(int)  # Annotation pour indiquer que c’est un entier
-    def get_produits_count(self, obj):
-        return obj.produits.count()
+# Résumé de catégorie imbriqué dans les produits
+class CategorieResumeSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Categorie
+        fields = ['id', 'nom']
+
+# Serializer de liste pour Produit : charge les promotions de toute la page en une requête
+class ProduitListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        produits = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        index = self.context.get('promotion_index')
+        a_calculer = [p for p in produits if p.prix_effectif is None and (index is None or not index.couvre(p))]
+        if a_calculer and 'prix_reduit' in self.child.fields:
+            # Prix effectif pas encore matérialisé : index des promotions pour la page
+            self.context['promotion_index'] = PromotionIndex.pour_produits(produits)
+        return super().to_representation(produits)
 
 # Serializer pour Produit
-class ProduitSerializer(serializers.ModelSerializer):
+class ProduitSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     prix_reduit = serializers.SerializerMethodField()
-    categorie = CategorieSerializer(read_only=True)
+    categorie = CategorieResumeSerializer(read_only=True)
     categorie_id = serializers.PrimaryKeyRelatedField(queryset=Categorie.objects.all(), source='categorie', write_only=True, required=False)
     promotions = serializers.PrimaryKeyRelatedField(many=True, queryset=Promotion.objects.all(), required=False)  # Rendu optionnel
     photos = PhotoSerializer(many=True, read_only=True)
@@ -153,11 +186,12 @@ class ProduitSerializer(serializers.ModelSerializer):
     class Meta:
         model = Produit
         fields = [
-            'id', 'nom', 'description', 'prix', 'stock', 'photos', 'categorie', 
+            'id', 'nom', 'description', 'prix', 'stock', 'seuil_stock_faible', 'photos', 'categorie', 
             'categorie_id', 'promotions', 'is_active', 'date_creation', 
             'date_mise_a_jour', 'prix_reduit', 'photo_ids',
         ]
         read_only_fields = ['date_creation', 'date_mise_a_jour']
+        list_serializer_class = ProduitListSerializer
 
     def validate_stock(self, value):
         if value < 0:
@@ -170,31 +204,22 @@ class ProduitSerializer(serializers.ModelSerializer):
         return value
     
     def get_prix_reduit(self, obj):
-        promotions = obj.promotions.filter(
-            is_active=True,
-            date_debut__lte=timezone.now(),
-            date_fin__gte=timezone.now()
-        )
-        
-        # Si aucune promotion active, on retourne le prix d'origine
-        if not promotions.exists():
-            return float(obj.prix)
-
-        # Appliquer chaque réduction successivement
-        prix_reduit = float(obj.prix)
-        for promotion in promotions:
-            prix_reduit *= (1 - float(promotion.reduction))
-
-        return round(prix_reduit, 2)  # Arrondir à 2 décimales pour plus de précision
+        # Index partagé via le contexte (panier : prix à l'instant) ; sinon colonne matérialisée
+        index = self.context.get('promotion_index')
+        if index is not None and index.couvre(obj):
+            return float(index.prix(obj))
+        if obj.prix_effectif is not None:
+            return float(obj.prix_effectif)
+        return float(PromotionIndex.pour_produits([obj]).prix(obj))
     
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['categorie'] = {'id': instance.categorie.id, 'nom': instance.categorie.nom} if instance.categorie else None
-        representation['promotions'] = [{'id': p.id, 'nom': p.nom} for p in instance.promotions.all()]
+        if 'promotions' in representation:
+            representation['promotions'] = [{'id': p.id, 'nom': p.nom} for p in instance.promotions.all()]
         return representation
     
 # Serializer pour Promotion
-class PromotionSerializer(serializers.ModelSerializer):
+class PromotionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     categorie = CategorieSerializer(read_only=True)
     categorie_id = serializers.PrimaryKeyRelatedField(queryset=Categorie.objects.all(), source='categorie', write_only=True, required=False, allow_null=True)
     produits = ProduitSerializer(many=True, read_only=True)  # Liste des produits en promotion
@@ -215,7 +240,7 @@ class PromotionSerializer(serializers.ModelSerializer):
         return representation
 
 # Serializer pour LigneCommande
-class LigneCommandeSerializer(serializers.ModelSerializer):
+class LigneCommandeSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     produit = ProduitSerializer(read_only=True)
     produit_id = serializers.PrimaryKeyRelatedField(queryset=Produit.objects.all(), source='produit', write_only=True)
 
@@ -225,18 +250,49 @@ class LigneCommandeSerializer(serializers.ModelSerializer):
         read_only_fields = ['date_creation']
 
 # Serializer pour PanierProduit (table intermédiaire)
-class PanierProduitSerializer(serializers.ModelSerializer):
+class PanierProduitSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     produit = ProduitSerializer(read_only=True)
     produit_id = serializers.PrimaryKeyRelatedField(queryset=Produit.objects.all(), source='produit', write_only=True)
+    reservation_expiree = serializers.SerializerMethodField()
 
     class Meta:
         model = PanierProduit
-        fields = ['id', 'panier', 'produit', 'produit_id', 'quantite', 'date_ajout']
-        read_only_fields = ['date_ajout']
+        fields = ['id', 'panier', 'produit', 'produit_id', 'quantite', 'date_ajout', 'reserve_jusqu_a', 'reservation_expiree']
+        read_only_fields = ['date_ajout', 'reserve_jusqu_a']
+
+    def get_reservation_expiree(self, obj) -> bool:
+        """Vrai si le stock n'est plus retenu pour cette ligne (ou ne le sera plus au prochain passage)."""
+        return not obj.reservation_active or (obj.reserve_jusqu_a is not None and obj.reserve_jusqu_a <= timezone.now())
+
+
+class OperationPanierSerializer(serializers.Serializer):
+    """Opération de POST /api/paniers/{id}/batch/ : add (ajoute), set (fixe la quantité), remove."""
+    op = serializers.ChoiceField(choices=['add', 'set', 'remove'])
+    produit_id = serializers.IntegerField()
+    quantite = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, data):
+        if data['op'] != 'remove' and 'quantite' not in data:
+            raise serializers.ValidationError({'quantite': 'Ce champ est obligatoire.'})
+        if data['op'] == 'add' and data['quantite'] == 0:
+            raise serializers.ValidationError({'quantite': 'La quantité doit être positive.'})
+        return data
+
+
+class AnnulationCommandesSerializer(serializers.Serializer):
+    """Corps de POST /api/commandes/annuler/ : ids des commandes à annuler."""
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
+
+
+# Serializer pour le journal des mouvements de stock
+class MouvementStockSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MouvementStock
+        fields = ['id', 'delta', 'raison', 'reference', 'date']
 
 
 # Serializer pour Panier
-class PanierSerializer(serializers.ModelSerializer):
+class PanierSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     client = UtilisateurSerializer(read_only=True)
     client_id = serializers.PrimaryKeyRelatedField(queryset=Utilisateur.objects.filter(role='client'), source='client', write_only=True)
     items = PanierProduitSerializer(many=True, read_only=True)  # Liste des produits dans le panier
@@ -248,7 +304,7 @@ class PanierSerializer(serializers.ModelSerializer):
         read_only_fields = ['date_creation', 'date_mise_a_jour']
 
 # Serializer pour Service
-class ServiceSerializer(serializers.ModelSerializer):
+class ServiceSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     realisations = serializers.PrimaryKeyRelatedField(many=True, read_only=True)  # Liste des réalisations associées
     photos = PhotoSerializer(many=True, read_only=True)
     photo_ids = serializers.PrimaryKeyRelatedField(
@@ -261,7 +317,7 @@ class ServiceSerializer(serializers.ModelSerializer):
         read_only_fields = ['date_creation']
 
 
-class DevisSerializer(serializers.ModelSerializer):
+class DevisSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     service = ServiceSerializer(read_only=True)
     service_id = serializers.PrimaryKeyRelatedField(
         queryset=Service.objects.filter(is_active=True),
@@ -310,7 +366,7 @@ class DevisSerializer(serializers.ModelSerializer):
 
 
 # Serializer pour Realisation
-class RealisationSerializer(serializers.ModelSerializer):
+class RealisationSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     service = ServiceSerializer(read_only=True)
     service_id = serializers.PrimaryKeyRelatedField(queryset=Service.objects.all(), source='service', write_only=True)
     admin = UtilisateurSerializer(read_only=True)
@@ -326,7 +382,7 @@ class RealisationSerializer(serializers.ModelSerializer):
         read_only_fields = ['date_creation']
 
 
-class AbonnementProduitSerializer(serializers.ModelSerializer):
+class AbonnementProduitSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     produit = ProduitSerializer(read_only=True)
     produit_id = serializers.PrimaryKeyRelatedField(
         queryset=Produit.objects.all(), source='produit', write_only=True
@@ -337,7 +393,7 @@ class AbonnementProduitSerializer(serializers.ModelSerializer):
         fields = ['produit', 'produit_id', 'quantite']
 
 # Serializer pour Abonnement
-class AbonnementSerializer(serializers.ModelSerializer):
+class AbonnementSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     abonnement_produits = AbonnementProduitSerializer(many=True, read_only=True)
     produit_quantites = serializers.ListField(
         child=serializers.DictField(
@@ -400,14 +456,14 @@ class AbonnementSerializer(serializers.ModelSerializer):
         return instance
 
 # Serializer pour Atelier
-class ParticipantSerializer(serializers.ModelSerializer):
+class ParticipantSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     utilisateur = UtilisateurSerializer()
 
     class Meta:
         model = Participant
         fields = ['id', 'utilisateur', 'date_inscription', 'statut']
 
-class AtelierSerializer(serializers.ModelSerializer):
+class AtelierSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     participants = ParticipantSerializer(many=True, read_only=True)
 
     class Meta:
@@ -466,20 +522,21 @@ class AtelierSerializer(serializers.ModelSerializer):
         return value
 
 # Serializer pour Commentaire
-class CommentaireSerializer(serializers.ModelSerializer):
+class CommentaireSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     client = serializers.StringRelatedField()
     reponses = serializers.SerializerMethodField()
 
     class Meta:
         model = Commentaire
-        fields = ['id', 'article', 'client', 'texte', 'date', 'parent', 'reponses', 'ban_reason']
+        fields = ['id', 'article', 'client', 'texte', 'date', 'parent', 'reponses', 'ban_reason', 'statut_moderation']
+        read_only_fields = ['ban_reason', 'statut_moderation']
 
     def get_reponses(self, obj):
         reponses = obj.reponses.all()
         return CommentaireSerializer(reponses, many=True).data
 
 # Serializer pour Article
-class ArticleSerializer(serializers.ModelSerializer):
+class ArticleSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     auteur = serializers.StringRelatedField()    
     # Filtrer pour ne retourner que les commentaires sans parent
     commentaires_ids = CommentaireSerializer(
@@ -487,19 +544,34 @@ class ArticleSerializer(serializers.ModelSerializer):
         read_only=True, 
         source='commentaires.filter(parent__isnull=True)'
     )
+    cover_srcset = SrcsetField()
     class Meta:
         model = Article
-        fields = ['id', 'titre', 'contenu', 'date_publication', 'auteur', 'commentaires_ids', 'is_active', 'date_mise_a_jour', 'cover']
+        fields = ['id', 'titre', 'contenu', 'date_publication', 'auteur', 'commentaires_ids', 'is_active', 'date_mise_a_jour', 'cover', 'cover_srcset']
         read_only_fields = ['date_publication', 'date_mise_a_jour']
 
 
-class UploadedImageSerializer(serializers.ModelSerializer):
+class ArticleDetailSerializer(ArticleSerializer):
+    """Détail d'un article : ajoute les commentaires actifs de premier niveau."""
+    commentaires = serializers.SerializerMethodField()
+
+    class Meta(ArticleSerializer.Meta):
+        fields = ArticleSerializer.Meta.fields + ['commentaires']
+
+    def get_commentaires(self, obj):
+        commentaires = obj.commentaires.filter(parent__isnull=True, is_active=True)
+        return CommentaireSerializer(commentaires, many=True).data
+
+
+class UploadedImageSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    srcset = SrcsetField()
+
     class Meta:
         model = UploadedImage
-        fields = ["id", "image"]
+        fields = ["id", "image", "srcset"]
 
 # Serializer pour Parametre
-class ParametreSerializer(serializers.ModelSerializer):
+class ParametreSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Parametre
         fields = ['id', 'cle', 'valeur', 'description', 'date_mise_a_jour']
@@ -511,7 +583,7 @@ class ParametreSerializer(serializers.ModelSerializer):
         return value
 
 # Serializer pour Paiement
-class PaiementSerializer(serializers.ModelSerializer):
+class PaiementSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     commande_id = serializers.PrimaryKeyRelatedField(queryset=Commande.objects.all(), source='commande', write_only=True, required=False)
     abonnement = AbonnementSerializer(read_only=True)
     abonnement_id = serializers.PrimaryKeyRelatedField(queryset=Abonnement.objects.all(), source='abonnement', write_only=True, required=False)
@@ -532,14 +604,14 @@ class PaiementSerializer(serializers.ModelSerializer):
         return data
 
 
-class AdresseSerializer(serializers.ModelSerializer):
+class AdresseSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     client = UtilisateurSerializer(read_only=True)
     class Meta:
         model = Adresse
         fields = ['id', 'nom', 'rue', 'ville', 'code_postal', 'pays', 'is_default', 'client']
 
 # Serializer pour Commande
-class CommandeSerializer(serializers.ModelSerializer):
+class CommandeSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     client = UtilisateurSerializer(read_only=True)
     client_id = serializers.PrimaryKeyRelatedField(queryset=Utilisateur.objects.filter(role='client'), source='client', write_only=True)
     lignes = LigneCommandeSerializer(many=True, read_only=True)  # Liste des lignes de commande
@@ -550,7 +622,7 @@ class CommandeSerializer(serializers.ModelSerializer):
         fields = ['id', 'client', 'client_id', 'date', 'statut', 'total', 'lignes', 'is_active', 'date_mise_a_jour', 'paiement', 'adresse']
         read_only_fields = ['date', 'date_mise_a_jour']
 
-class WishlistSerializer(serializers.ModelSerializer):
+class WishlistSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     produits = ProduitSerializer(many=True, read_only=True)
     produit_ids = serializers.PrimaryKeyRelatedField(
         queryset=Produit.objects.all(),
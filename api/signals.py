@@ -0,0 +1,197 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .cache import invalider
+from .counters import ajuster_compteurs
+from .images import variantes_a_jour
+from .models import (
+    Adresse, Article, Categorie, Commentaire, Parametre, Photo, Produit, Promotion, Realisation, Service,
+    UploadedImage, Utilisateur
+)
+from .pricing import recalculer_prix_effectifs
+from .search import mettre_a_jour_vecteurs
+from .stock import journaliser
+from .stockage import referencer
+from .suggestions import TYPES as TYPES_SUGGESTIONS, index_suggestions
+from .tasks import programmer_variantes
+
+CHAMPS_RECHERCHE = {'nom', 'description'}
+CHAMPS_PRIX = {'prix', 'categorie'}
+CHAMPS_COMPTEURS = {'categorie', 'is_active'}
+CHAMPS_SUGGESTIONS = {'nom', 'is_active'}
+INCONNU = object()  # Nom visible non lu en base (objet construit en mémoire, champ différé)
+
+# Modèles dont dépendent les réponses mises en cache et les ETag (CachedResponseMixin, ConditionalGetMixin)
+MODELES_VERSIONNES = (
+    Adresse, Article, Categorie, Commentaire, Parametre, Photo, Produit, Promotion, Realisation, Service,
+    Utilisateur
+)
+
+
+@receiver(post_save, sender=Produit)
+def produit_vecteur_recherche(sender, instance, update_fields=None, **kwargs):
+    """Maintient le vecteur de recherche à jour quand le nom ou la description change."""
+    if update_fields is not None and not CHAMPS_RECHERCHE & set(update_fields):
+        return
+    mettre_a_jour_vecteurs(Produit.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Produit)
+def produit_prix_effectif(sender, instance, update_fields=None, **kwargs):
+    """Recalcule le prix effectif d'un produit créé ou dont le prix / la catégorie change."""
+    if update_fields is not None and not CHAMPS_PRIX & set(update_fields):
+        return
+    recalculer_prix_effectifs([instance])
+
+
+@receiver(pre_save, sender=Produit)
+def produit_etat_avant(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Mémorise catégorie et statut en base avant l'enregistrement (pour les compteurs)."""
+    instance._compteurs_avant = None
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and not CHAMPS_COMPTEURS & set(update_fields):
+        return
+    instance._compteurs_avant = (
+        Produit.objects.filter(pk=instance.pk).values_list('categorie_id', 'is_active').first()
+    )
+
+
+@receiver(post_save, sender=Produit)
+def produit_compteurs(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Répercute création, activation et changement de catégorie sur les compteurs."""
+    if raw:
+        return
+    if update_fields is not None and not CHAMPS_COMPTEURS & set(update_fields):
+        return
+    avant = getattr(instance, '_compteurs_avant', None)
+    if created or avant is None:
+        ajuster_compteurs(instance.categorie_id, total=1, actifs=int(instance.is_active))
+        return
+    categorie_avant, actif_avant = avant
+    categorie = instance.categorie_id if update_fields is None or 'categorie' in update_fields else categorie_avant
+    actif = instance.is_active if update_fields is None or 'is_active' in update_fields else actif_avant
+    if categorie != categorie_avant:
+        ajuster_compteurs(categorie_avant, total=-1, actifs=-int(actif_avant))
+        ajuster_compteurs(categorie, total=1, actifs=int(actif))
+    elif actif != actif_avant:
+        ajuster_compteurs(categorie, actifs=1 if actif else -1)
+
+
+@receiver(post_delete, sender=Produit)
+def produit_compteurs_suppression(sender, instance, **kwargs):
+    ajuster_compteurs(instance.categorie_id, total=-1, actifs=-int(instance.is_active))
+
+
+@receiver(pre_save, sender=Produit)
+def produit_stock_avant(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Mémorise le stock en base avant un enregistrement par save() qui le modifie (journal des
+    mouvements). Ligne verrouillée (Produit.save est atomique) : une réservation concurrente
+    ne fausse pas le delta.
+    """
+    instance._stock_avant = None
+    if raw or instance._state.adding or (update_fields is not None and 'stock' not in update_fields):
+        return
+    if instance.stock == getattr(instance, '_stock_charge', None):
+        return  # Stock inchangé depuis la lecture : pas de requête
+    instance._stock_avant = (
+        Produit.objects.select_for_update().filter(pk=instance.pk).values_list('stock', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Produit)
+def produit_mouvement_stock(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Journalise le stock initial d'un produit créé et les modifications manuelles du stock."""
+    if raw:
+        return
+    if created:
+        journaliser([(instance.pk, instance.stock, '')], 'initial')
+    elif getattr(instance, '_stock_avant', None) is not None:
+        journaliser([(instance.pk, instance.stock - instance._stock_avant, '')], 'ajustement')
+    instance._stock_charge = instance.stock
+
+
+def invalider_cache(sender, update_fields=None, **kwargs):
+    """Incrémente la génération du modèle modifié."""
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return  # Connexion d'un utilisateur : rien de visible publiquement
+    invalider(sender)
+
+
+def invalider_cache_m2m(sender, instance, action, model, **kwargs):
+    if action.startswith('post_'):
+        invalider(type(instance))
+        invalider(model)
+
+
+for modele in MODELES_VERSIONNES:
+    post_save.connect(invalider_cache, sender=modele, dispatch_uid=f'cache_save_{modele._meta.label_lower}')
+    post_delete.connect(invalider_cache, sender=modele, dispatch_uid=f'cache_delete_{modele._meta.label_lower}')
+
+m2m_changed.connect(invalider_cache_m2m, sender=Promotion.produits.through, dispatch_uid='cache_m2m_promotion_produits')
+
+
+def suggestions_enregistrement(sender, instance, raw=False, created=False, update_fields=None, **kwargs):
+    """Reporte nom et activité dans l'index d'autocomplétion, après le commit, s'ils ont changé."""
+    if raw or (update_fields is not None and not CHAMPS_SUGGESTIONS & set(update_fields)):
+        return
+    apres = instance.nom if instance.is_active else None
+    # Nom visible lu en base (SuggestionMixin), ou fixé par le save() précédent
+    avant = None if created else getattr(instance, '_suggestion_charge', INCONNU)
+    instance._suggestion_charge = apres
+    if avant == apres:
+        return  # Stock, prix... : rien de visible, pas de version partagée à incrémenter
+    type_, pk, nom, actif = sender._meta.model_name, instance.pk, instance.nom, instance.is_active
+    transaction.on_commit(lambda: index_suggestions.appliquer(type_, pk, nom, actif))
+
+
+def suggestions_suppression(sender, instance, **kwargs):
+    if getattr(instance, '_suggestion_charge', INCONNU) is None:
+        return  # Objet inactif : absent des suggestions
+    type_, pk = sender._meta.model_name, instance.pk
+    transaction.on_commit(lambda: index_suggestions.appliquer(type_, pk))
+
+
+for modele in TYPES_SUGGESTIONS.values():
+    label = modele._meta.label_lower
+    post_save.connect(suggestions_enregistrement, sender=modele, dispatch_uid=f'suggestions_save_{label}')
+    post_delete.connect(suggestions_suppression, sender=modele, dispatch_uid=f'suggestions_delete_{label}')
+
+
+@receiver(post_save, sender=Photo)
+@receiver(post_save, sender=UploadedImage)
+@receiver(post_save, sender=Article)
+def image_variantes(sender, instance, raw=False, **kwargs):
+    """Demande les tailles réduites d'une image nouvelle ou remplacée, après le commit."""
+    if raw or variantes_a_jour(instance):
+        return
+    programmer_variantes(sender._meta.label_lower, instance.pk)
+
+
+@receiver(pre_save, sender=Photo)
+@receiver(pre_save, sender=UploadedImage)
+def image_fichier_avant(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Mémorise le fichier en base avant l'enregistrement (pour les références)."""
+    instance._fichier_avant = None
+    if raw or instance._state.adding or (update_fields is not None and 'image' not in update_fields):
+        return
+    instance._fichier_avant = sender.objects.filter(pk=instance.pk).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Photo)
+@receiver(post_save, sender=UploadedImage)
+def image_references(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Compte une référence au nouveau fichier et en retire une à l'ancien."""
+    if raw or (update_fields is not None and 'image' not in update_fields):
+        return
+    avant = None if created else getattr(instance, '_fichier_avant', None)
+    if instance.image.name != avant:
+        referencer(instance.image.name, 1)
+        referencer(avant, -1)
+
+
+@receiver(post_delete, sender=Photo)
+@receiver(post_delete, sender=UploadedImage)
+def image_references_suppression(sender, instance, **kwargs):
+    referencer(instance.image.name, -1)
@@ -0,0 +1,276 @@
+from collections import Counter
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Max, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .cache import invalider
+from .models import (
+    Commande, InstantaneStock, LigneCommande, MouvementStock, Panier, PanierProduit, Parametre, Produit
+)
+
+# Mouvements de stock des produits, sans lecture préalable ni verrou de ligne :
+# chaque opération est un UPDATE unique dont la condition (stock >= n) est évaluée
+# par la base au moment de l'écriture. Deux réservations concurrentes ne peuvent donc
+# ni perdre une mise à jour ni faire passer le stock sous zéro ; le nombre de lignes
+# modifiées indique si la réservation a abouti.
+# Tous les chemins qui touchent au stock (panier, commande, annulation, remboursement)
+# passent par ce module. update() ne déclenchant pas post_save, le cache est invalidé ici.
+# Une ligne de panier ne retient son stock que DUREE_RESERVATION_PANIER_MINUTES (Parametre) :
+# liberer_reservations_expirees le rend ensuite, par lots, en une requête par lot.
+# Chaque variation est aussi ajoutée au journal MouvementStock (un bulk_create dans la même
+# transaction) ; les enregistrements de Produit par save() sont journalisés par api.signals.
+# compacter_journal reporte périodiquement les mouvements dans InstantaneStock : le stock
+# recalculé (instantané + mouvements postérieurs) sert à l'historique et au rapprochement.
+
+PARAM_DUREE_RESERVATION = 'DUREE_RESERVATION_PANIER_MINUTES'
+DUREE_RESERVATION_DEFAUT = 30
+TAILLE_LOT = 500
+# Les mouvements plus récents ne sont pas compactés : une transaction encore ouverte
+# peut valider un id inférieur au dernier id visible.
+MARGE_COMPACTION = timedelta(minutes=5)
+
+
+def journaliser(mouvements, raison):
+    """Ajoute au journal des (produit_id, delta, reference), en une requête."""
+    maintenant = timezone.now()
+    MouvementStock.objects.bulk_create([
+        MouvementStock(produit_id=produit_id, delta=delta, raison=raison, reference=reference, date=maintenant)
+        for produit_id, delta, reference in mouvements if delta
+    ], batch_size=TAILLE_LOT)
+
+
+def reserver(produit_id, quantite, raison='panier', reference=''):
+    """Retire `quantite` du stock si elle est disponible ; retourne True si c'est fait."""
+    if quantite <= 0:
+        return quantite == 0
+    with transaction.atomic():  # Compteur et journal ensemble
+        fait = Produit.objects.filter(pk=produit_id, stock__gte=quantite).update(
+            stock=F('stock') - quantite, date_mise_a_jour=timezone.now()
+        )
+        if fait:
+            journaliser([(produit_id, -quantite, reference)], raison)
+    if fait:
+        invalider(Produit)
+    return bool(fait)
+
+
+def liberer(produit_id, quantite, raison='panier', reference=''):
+    """Remet `quantite` en stock."""
+    if quantite <= 0:
+        return
+    with transaction.atomic():
+        Produit.objects.filter(pk=produit_id).update(stock=F('stock') + quantite, date_mise_a_jour=timezone.now())
+        journaliser([(produit_id, quantite, reference)], raison)
+    invalider(Produit)
+
+
+def ajuster(produit_id, difference, raison='panier', reference=''):
+    """Réserve (difference > 0) ou libère (difference < 0) ; retourne False si le stock manque."""
+    if difference < 0:
+        liberer(produit_id, -difference, raison, reference)
+        return True
+    return reserver(produit_id, difference, raison, reference)
+
+
+def liberer_lignes(lignes, raison, reference=''):
+    """Remet en stock des lignes (produit_id et quantite), regroupées par produit, en une requête."""
+    quantites = Counter()
+    for ligne in lignes:
+        quantites[ligne.produit_id] += ligne.quantite
+    liberer_quantites(quantites, raison, reference)
+
+
+def _crediter(quantites):
+    """Ajoute {produit_id: quantité} au stock en une seule requête (CASE sur l'id), sans journal."""
+    Produit.objects.filter(pk__in=quantites).update(
+        stock=F('stock') + _par_produit(quantites), date_mise_a_jour=timezone.now()
+    )
+    invalider(Produit)
+
+
+def liberer_quantites(quantites, raison, reference=''):
+    """Remet en stock {produit_id: quantité} en une seule requête (CASE sur l'id)."""
+    quantites = {pk: n for pk, n in quantites.items() if n > 0}
+    if not quantites:
+        return
+    with transaction.atomic():
+        _crediter(quantites)
+        journaliser(((pk, n, reference) for pk, n in quantites.items()), raison)
+
+
+def restituer_commandes(commande_ids, raison='annulation'):
+    """
+    Remet en stock toutes les lignes des commandes données : une agrégation, un UPDATE,
+    et un mouvement par commande et produit dans le journal.
+    """
+    par_commande = [
+        ligne for ligne in
+        LigneCommande.objects.filter(commande_id__in=commande_ids).order_by()
+        .values('commande_id', 'produit_id').annotate(total=Sum('quantite'))
+        .values_list('commande_id', 'produit_id', 'total')
+        if ligne[2] > 0
+    ]
+    quantites = Counter()
+    for _, produit_id, total in par_commande:
+        quantites[produit_id] += total
+    if quantites:
+        with transaction.atomic():
+            _crediter(quantites)
+            journaliser(
+                ((produit_id, total, f'commande:{commande_id}') for commande_id, produit_id, total in par_commande), raison
+            )
+    return dict(quantites)
+
+
+def annuler_commandes(commandes, raison='annulation'):
+    """
+    Passe à 'annulee' les commandes du queryset `commandes` et restitue leur stock, en un
+    nombre constant de requêtes quel que soit le nombre de commandes et de lignes.
+    Le queryset porte la condition de transition (ex. statut__in=[...]) : les lignes sont
+    verrouillées puis relues, si bien qu'une annulation concurrente ne restitue pas le stock
+    deux fois. Retourne les ids effectivement annulés.
+    """
+    with transaction.atomic():
+        ids = list(commandes.select_for_update().order_by().values_list('id', flat=True))
+        if ids:
+            Commande.objects.filter(pk__in=ids).update(statut='annulee', date_mise_a_jour=timezone.now())
+            restituer_commandes(ids, raison)
+    return ids
+
+
+def _par_produit(quantites):
+    return Case(
+        *(When(pk=pk, then=Value(n)) for pk, n in quantites.items()),
+        default=Value(0), output_field=IntegerField(),
+    )
+
+
+class _Incomplet(Exception):
+    pass
+
+
+def reserver_quantites(quantites, raison='panier', reference=''):
+    """
+    Réserve {produit_id: quantité} en une requête, tout ou rien : si un produit manque
+    de stock, rien n'est réservé (savepoint annulé) et la fonction retourne False.
+    Une quantité négative est rendue au stock dans la même requête.
+    """
+    quantites = {pk: n for pk, n in quantites.items() if n}
+    if not quantites:
+        return True
+    try:
+        with transaction.atomic():
+            fait = Produit.objects.filter(pk__in=quantites, stock__gte=_par_produit(quantites)).update(
+                stock=F('stock') - _par_produit(quantites), date_mise_a_jour=timezone.now()
+            )
+            if fait != len(quantites):
+                raise _Incomplet
+            journaliser(((pk, -n, reference) for pk, n in quantites.items()), raison)
+    except _Incomplet:
+        return False
+    invalider(Produit)
+    return True
+
+
+def manquants(quantites):
+    """Ids des produits dont le stock ne couvre pas la quantité demandée."""
+    quantites = {pk: n for pk, n in quantites.items() if n > 0}
+    return list(Produit.objects.filter(pk__in=quantites, stock__lt=_par_produit(quantites)).values_list('id', flat=True))
+
+
+def duree_reservation():
+    parametre = Parametre.objects.filter(cle=PARAM_DUREE_RESERVATION).values_list('valeur', flat=True).first()
+    try:
+        return timedelta(minutes=int(parametre))
+    except (TypeError, ValueError):
+        return timedelta(minutes=DUREE_RESERVATION_DEFAUT)
+
+
+def echeance_reservation():
+    return timezone.now() + duree_reservation()
+
+
+def liberer_reservations_expirees(maintenant=None):
+    """Rend au stock les lignes de panier dont la réservation est échue ; retourne leur nombre."""
+    maintenant = maintenant or timezone.now()
+    total = 0
+    while True:
+        with transaction.atomic():
+            # skip_locked : une ligne en cours de modification par son client est traitée au passage suivant
+            lignes = list(
+                PanierProduit.objects.select_for_update(skip_locked=True)
+                .filter(reservation_active=True, reserve_jusqu_a__lte=maintenant)
+                .values_list('pk', 'panier_id', 'produit_id', 'quantite')[:TAILLE_LOT]
+            )
+            if not lignes:
+                return total
+            PanierProduit.objects.filter(pk__in=[l[0] for l in lignes]).update(reservation_active=False)
+            quantites = Counter()
+            for _, _, produit_id, quantite in lignes:
+                quantites[produit_id] += quantite
+            _crediter(quantites)
+            journaliser(
+                ((produit_id, quantite, f'panier:{panier_id}') for _, panier_id, produit_id, quantite in lignes),
+                'expiration',
+            )
+            # ETag des paniers concernés (ConditionalGetMixin)
+            Panier.objects.filter(pk__in={l[1] for l in lignes}).update(date_mise_a_jour=maintenant)
+        total += len(lignes)
+        if len(lignes) < TAILLE_LOT:
+            return total
+
+
+def avec_stock_calcule(produits):
+    """
+    Annote `stock_calcule` : stock de l'instantané plus la somme des mouvements postérieurs,
+    lus par l'index (produit, id) du journal.
+    """
+    recents = (
+        MouvementStock.objects
+        .filter(produit=OuterRef('pk'), id__gt=Coalesce(OuterRef('instantane_stock__dernier_mouvement'), 0))
+        .order_by().values('produit').annotate(total=Sum('delta')).values('total')
+    )
+    return produits.annotate(stock_calcule=(
+        Coalesce(F('instantane_stock__stock'), 0) + Coalesce(Subquery(recents, output_field=IntegerField()), 0)
+    ))
+
+
+def ecarts_stock(produits=None):
+    """Rapprochement : {produit_id: (stock, stock_calcule)} des produits dont le compteur diverge du journal."""
+    produits = avec_stock_calcule(produits if produits is not None else Produit.objects.all())
+    return {
+        pk: (stock, calcule)
+        for pk, stock, calcule in produits.exclude(stock=F('stock_calcule')).values_list('pk', 'stock', 'stock_calcule')
+    }
+
+
+def compacter_journal(maintenant=None):
+    """
+    Reporte dans InstantaneStock les mouvements antérieurs à MARGE_COMPACTION qui n'y
+    sont pas encore ; retourne le nombre de produits dont l'instantané a changé.
+    Le journal lui-même n'est jamais modifié.
+    """
+    limite = (maintenant or timezone.now()) - MARGE_COMPACTION
+    with transaction.atomic():
+        borne = MouvementStock.objects.filter(date__lte=limite).aggregate(borne=Max('id'))['borne']
+        # Chaque compaction porte tous les produits concernés jusqu'à la même borne
+        depuis = InstantaneStock.objects.aggregate(depuis=Max('dernier_mouvement'))['depuis'] or 0
+        if borne is None or borne <= depuis:
+            return 0
+        deltas = dict(
+            MouvementStock.objects.filter(id__gt=depuis, id__lte=borne).order_by()
+            .values('produit_id').annotate(total=Sum('delta')).values_list('produit_id', 'total')
+        )
+        existants = dict(
+            InstantaneStock.objects.select_for_update().filter(produit_id__in=deltas).values_list('produit_id', 'stock')
+        )
+        InstantaneStock.objects.bulk_create(
+            [
+                InstantaneStock(produit_id=pk, stock=existants.get(pk, 0) + total, dernier_mouvement=borne)
+                for pk, total in deltas.items()
+            ],
+            update_conflicts=True, unique_fields=['produit'], update_fields=['stock', 'dernier_mouvement', 'date'],
+            batch_size=TAILLE_LOT,
+        )
+    return len(deltas)
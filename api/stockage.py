@@ -0,0 +1,147 @@
+import hashlib
+import os
+import re
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db.models import Case, F, When
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+from .images import FORMATS as FORMATS_VARIANTES, TAILLES as TAILLES_VARIANTES, nom_variante
+
+# Stockage adressé par le contenu des images téléversées (Photo.image, UploadedImage.image) :
+# un fichier est enregistré sous cas/ab/cd/<sha256>.<ext>, donc une image envoyée deux fois
+# n'occupe qu'un fichier. L'empreinte est calculée pendant la réception de l'upload (gestionnaires
+# ci-dessous, voir FILE_UPLOAD_HANDLERS), sinon en relisant le contenu par morceaux.
+# FichierImage compte les références (tenues par api.signals) ; collecter_orphelins supprime
+# les fichiers qui n'en ont plus depuis DELAI_ORPHELINS, ainsi que leurs variantes (api.images).
+# api.models importe ce module (storage des ImageField) : FichierImage est résolu à l'exécution.
+
+PREFIXE = 'cas/'
+DELAI_ORPHELINS = timedelta(hours=getattr(settings, 'IMAGES_DELAI_ORPHELINS_HEURES', 24))
+ORIGINAL = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+
+
+def empreinte(contenu):
+    """SHA-256 du fichier : celle calculée à la réception si disponible, sinon en le relisant."""
+    deja = getattr(contenu, 'empreinte', None)
+    if deja:
+        return deja
+    sha = hashlib.sha256()
+    for morceau in contenu.chunks():
+        sha.update(morceau)
+    contenu.seek(0)
+    return sha.hexdigest()
+
+
+def chemin_contenu(hexa, extension):
+    return f'{PREFIXE}{hexa[:2]}/{hexa[2:4]}/{hexa}{extension.lower()}'
+
+
+@deconstructible
+class StockageContenu(FileSystemStorage):
+    """
+    FileSystemStorage dont le nom des fichiers est l'empreinte de leur contenu. Un nom déjà
+    situé sous PREFIXE (variantes dérivées d'un original, api.images) est conservé tel quel.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name and name.startswith(PREFIXE):
+            return super().save(name, content, max_length)
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        nom = chemin_contenu(empreinte(content), os.path.splitext(name or '')[1])
+        if self.exists(nom):
+            FichierImage = apps.get_model('api', 'FichierImage')
+            # Déjà stocké : on le protège du ramasse-miettes le temps que la référence soit enregistrée
+            FichierImage.objects.filter(nom=nom, references__lte=0).update(orphelin_depuis=timezone.now())
+            return nom
+        enregistre = super().save(nom, content, max_length)
+        if enregistre != nom:
+            # Même contenu écrit en parallèle par un autre upload : on garde un seul exemplaire
+            self.delete(enregistre)
+        return nom
+
+
+stockage_images = StockageContenu()
+
+
+class _EmpreinteMixin:
+    """Calcule le SHA-256 de chaque fichier au fil de sa réception."""
+
+    def new_file(self, *args, **kwargs):
+        self._sha = hashlib.sha256()
+        return super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self._sha.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        fichier = super().file_complete(file_size)
+        if fichier is not None:
+            fichier.empreinte = self._sha.hexdigest()
+        return fichier
+
+
+class MemoryEmpreinteUploadHandler(_EmpreinteMixin, MemoryFileUploadHandler):
+    pass
+
+
+class TemporaryEmpreinteUploadHandler(_EmpreinteMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def referencer(nom, delta):
+    """Ajoute `delta` références au fichier `nom` (ignoré hors du stockage adressé par le contenu)."""
+    if not nom or not nom.startswith(PREFIXE) or not delta:
+        return
+    FichierImage = apps.get_model('api', 'FichierImage')
+    if delta > 0:
+        FichierImage.objects.bulk_create([FichierImage(nom=nom)], ignore_conflicts=True)
+    # orphelin_depuis d'abord : l'expression lit l'ancienne valeur de references
+    FichierImage.objects.filter(nom=nom).update(
+        orphelin_depuis=Case(When(references__lte=-delta, then=timezone.now()), default=None),
+        references=F('references') + delta,
+    )
+
+
+def _supprimer_fichiers(storage, nom):
+    for chemin in [nom] + [nom_variante(nom, t, f) for t in TAILLES_VARIANTES for f in FORMATS_VARIANTES]:
+        storage.delete(chemin)
+
+
+def _parcourir(storage, dossier):
+    dossiers, fichiers = storage.listdir(dossier)
+    for fichier in fichiers:
+        yield f'{dossier}{fichier}'
+    for sous_dossier in dossiers:
+        yield from _parcourir(storage, f'{dossier}{sous_dossier}/')
+
+
+def collecter_orphelins(delai=DELAI_ORPHELINS, storage=stockage_images):
+    """
+    Supprime les images (et variantes) sans référence depuis `delai`, puis les fichiers du
+    stockage qu'aucune ligne ne suit (upload dont la transaction a échoué). Retourne leur nombre.
+    """
+    FichierImage = apps.get_model('api', 'FichierImage')
+    limite = timezone.now() - delai
+    supprimes = 0
+    candidats = FichierImage.objects.filter(references__lte=0, orphelin_depuis__lt=limite)
+    for nom in list(candidats.values_list('nom', flat=True)):
+        # DELETE conditionnel : une référence a pu revenir entre-temps
+        if candidats.filter(nom=nom).delete()[0]:
+            _supprimer_fichiers(storage, nom)
+            supprimes += 1
+
+    if not storage.exists(PREFIXE):
+        return supprimes
+    suivis = set(FichierImage.objects.values_list('nom', flat=True))
+    for nom in _parcourir(storage, PREFIXE):
+        if ORIGINAL.match(os.path.basename(nom)) and nom not in suivis and storage.get_modified_time(nom) < limite:
+            _supprimer_fichiers(storage, nom)
+            supprimes += 1
+    return supprimes
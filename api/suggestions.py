@@ -0,0 +1,177 @@
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+from django.conf import settings
+from .cache import generation, incrementer
+from .models import Categorie, Produit, Service
+
+# Index en mémoire (par processus) des noms de produits, catégories et services actifs,
+# pour l'autocomplétion (/api/produits/suggest/?q=) sans requête SQL.
+# - Recherche par préfixe de mots (liste triée + bisect), insensible aux accents et à la casse ;
+#   repli par trigrammes quand aucun nom ne correspond (faute de frappe, milieu de mot).
+# - Les signaux post_save / post_delete mettent l'index du processus à jour ligne par ligne,
+#   seulement si le nom visible (nom si actif) diffère de celui lu en base (SuggestionMixin).
+#   Quand un nom visible change, la version partagée (cache) est incrémentée : les autres
+#   processus, qui la consultent au plus une fois par VERIFICATION secondes, se reconstruisent.
+
+CLE_VERSION = 'suggestions:version'
+VERIFICATION = getattr(settings, 'SUGGESTIONS_VERIFICATION_SECONDES', 1)
+LIMITE_PAR_DEFAUT = 10
+LIMITE_MAX = 50
+SIMILARITE_MIN = 0.3
+TYPES = {'produit': Produit, 'categorie': Categorie, 'service': Service}
+
+
+def normaliser(texte):
+    """Minuscules sans accents, ponctuation remplacée par des espaces."""
+    texte = unicodedata.normalize('NFKD', texte or '')
+    texte = ''.join(c for c in texte if not unicodedata.combining(c)).lower()
+    return ' '.join(re.findall(r'\w+', texte))
+
+
+def trigrammes(texte):
+    texte = f'  {texte} '
+    return {texte[i:i + 3] for i in range(len(texte) - 2)}
+
+
+class IndexSuggestions:
+    def __init__(self):
+        self._verrou = threading.RLock()
+        self._charge = False
+        self._version = None
+        self._verifie_a = 0.0
+        self._entrees = {}    # (type, id) -> (nom, nom normalisé)
+        self._mots = []       # mots normalisés distincts, triés
+        self._par_mot = {}    # mot -> {(type, id)}
+        self._par_trigramme = {}
+
+    # Construction et mise à jour
+
+    def reinitialiser(self):
+        with self._verrou:
+            self.__init__()
+
+    def _charger(self):
+        self._entrees, self._mots, self._par_mot, self._par_trigramme = {}, [], {}, {}
+        for type_, model in TYPES.items():
+            for pk, nom in model.objects.filter(is_active=True).values_list('pk', 'nom'):
+                self._ajouter((type_, pk), nom)
+        self._charge = True
+
+    def _a_jour(self):
+        """Recharge l'index si la version partagée a changé (au plus une lecture du cache par VERIFICATION s)."""
+        maintenant = time.monotonic()
+        if self._charge and maintenant - self._verifie_a < VERIFICATION:
+            return
+        with self._verrou:
+            version = generation(CLE_VERSION)
+            if not self._charge or version != self._version:
+                self._charger()
+                self._version = version
+            self._verifie_a = maintenant
+
+    def _ajouter(self, cle, nom):
+        normalise = normaliser(nom)
+        self._entrees[cle] = (nom, normalise)
+        for mot in set(normalise.split()):
+            cles = self._par_mot.get(mot)
+            if cles is None:
+                cles = self._par_mot[mot] = set()
+                insort(self._mots, mot)
+            cles.add(cle)
+        for trigramme in trigrammes(normalise):
+            self._par_trigramme.setdefault(trigramme, set()).add(cle)
+
+    def _retirer(self, cle):
+        nom, normalise = self._entrees.pop(cle)
+        for mot in set(normalise.split()):
+            cles = self._par_mot[mot]
+            cles.discard(cle)
+            if not cles:
+                del self._par_mot[mot]
+                del self._mots[bisect_left(self._mots, mot)]
+        for trigramme in trigrammes(normalise):
+            cles = self._par_trigramme[trigramme]
+            cles.discard(cle)
+            if not cles:
+                del self._par_trigramme[trigramme]
+
+    def appliquer(self, type_, pk, nom=None, actif=False):
+        """
+        Reporte l'état d'un objet (nom / actif, ou supprimé) dans l'index du processus.
+        Si ce que voient les suggestions change, incrémente la version partagée.
+        """
+        with self._verrou:
+            if not self._charge:
+                incrementer(CLE_VERSION)  # Index non chargé ici : tous les processus rechargeront
+                return
+            cle = (type_, pk)
+            avant = self._entrees.get(cle)
+            apres = nom if actif else None
+            if (avant[0] if avant else None) == apres:
+                return  # Stock, prix... : rien de visible ici
+            if avant:
+                self._retirer(cle)
+            if apres is not None:
+                self._ajouter(cle, apres)
+            version = incrementer(CLE_VERSION)
+            # Aucune autre écriture entre-temps : l'index local est déjà à cette version
+            self._version = version if self._version is not None and version == self._version + 1 else None
+
+    # Recherche
+
+    def _prefixe(self, terme):
+        cles = set()
+        for i in range(bisect_left(self._mots, terme), len(self._mots)):
+            mot = self._mots[i]
+            if not mot.startswith(terme):
+                break
+            cles |= self._par_mot[mot]
+        return cles
+
+    def _rang(self, cle, requete):
+        nom, normalise = self._entrees[cle]
+        return (not normalise.startswith(requete), len(nom), nom)
+
+    def suggerer(self, q, limite=LIMITE_PAR_DEFAUT, types=None):
+        """Top `limite` des (type, id, nom) correspondant à `q`."""
+        requete = normaliser(q)
+        if not requete:
+            return []
+        self._a_jour()
+        with self._verrou:
+            candidats = None
+            for terme in requete.split():
+                cles = self._prefixe(terme)
+                candidats = cles if candidats is None else candidats & cles
+                if not candidats:
+                    break
+            if types and candidats:
+                candidats = {cle for cle in candidats if cle[0] in types}
+            if candidats:
+                meilleurs = heapq.nsmallest(limite, candidats, key=lambda cle: self._rang(cle, requete))
+            else:
+                meilleurs = self._approchants(requete, limite, types)
+            return [{'type': cle[0], 'id': cle[1], 'nom': self._entrees[cle][0]} for cle in meilleurs]
+
+    def _approchants(self, requete, limite, types):
+        """Repli par trigrammes partagés (similarité de Jaccard approchée)."""
+        cibles = trigrammes(requete)
+        communs = Counter()
+        for trigramme in cibles:
+            communs.update(self._par_trigramme.get(trigramme, ()))
+        scores = []
+        for cle, n in communs.items():
+            if types and cle[0] not in types:
+                continue
+            similarite = n / len(cibles | trigrammes(self._entrees[cle][1]))
+            if similarite >= SIMILARITE_MIN:
+                scores.append((-similarite, self._entrees[cle][0], cle))
+        return [cle for _, _, cle in heapq.nsmallest(limite, scores)]
+
+
+index_suggestions = IndexSuggestions()
@@ -1,10 +1,19 @@
+import logging
+from datetime import timedelta
 from decimal import Decimal
 from celery import shared_task
-from .models import Abonnement, Paiement, Produit, Utilisateur
+from .models import Abonnement, Paiement
+from .images import modele_image, preparer_variantes
+from .pricing import recalculer_prix_effectifs
+from .stock import compacter_journal, ecarts_stock, liberer_reservations_expirees as liberer_reservations
+from .stockage import collecter_orphelins
+from .alertes import alerter_stock_faible
+from .courriels import TAILLE_LOT as TAILLE_LOT_COURRIELS, envoyer_en_attente, mettre_en_file
+from .moderation import ESSAIS_MAX, ErreurModeration, a_relancer, appliquer as appliquer_verdict, delai_essai, moderer
+from django.db import transaction
 from django.utils import timezone
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
+
+logger = logging.getLogger(__name__)
 
 @shared_task
 def generer_commandes_abonnements():
@@ -14,7 +23,7 @@ def generer_commandes_abonnements():
         commande = abonnement.generer_commande()
         if commande:
             # Envoyer une notification au client
-            send_mail(
+            mettre_en_file(
                 'Nouvelle livraison planifiée - ChezFlora',
                 f'Votre commande #{commande.id} est prête pour livraison.',
                 'ChezFlora <plazarecrute@gmail.com>',
@@ -40,7 +49,7 @@ def facturer_abonnements():
         )
         abonnement.prochaine_facturation = abonnement.calculer_prochaine_facturation()
         abonnement.save()
-        send_mail(
+        mettre_en_file(
             'Facture mensuelle - ChezFlora',
             f'Paiement de {montant} FCFA pour votre abonnement {abonnement.type}.',
             'ChezFlora <plazarecrute@gmail.com>',
@@ -49,20 +58,133 @@ def facturer_abonnements():
 
 @shared_task
 def notifier_stock_faible():
-    produits = Produit.objects.filter(stock__lt=5, is_active=True)
-    if produits.exists():
-        admins = Utilisateur.objects.filter(role='admin')
-        for admin in admins:
-            for produit in produits:
-                subject = 'Alerte Stock Faible - ChezFlora'
-                html_message = render_to_string('stock_faible_email.html', {
-                    'admin_name': admin.username,
-                    'produit_nom': produit.nom,
-                    'stock': produit.stock,
-                })
-                plain_message = strip_tags(html_message)
-                send_mail(subject, plain_message, 'ChezFlora <plazarecrute@gmail.com>', [admin.email], html_message=html_message)
-    return f"{produits.count()} produits en stock faible notifiés"
+    """Un récapitulatif par administrateur des produits passés sous leur seuil depuis le dernier passage."""
+    return f"{alerter_stock_faible()} produits passés en stock faible notifiés"
+
+
+@shared_task
+def rafraichir_prix_effectifs():
+    """Recalcule Produit.prix_effectif d'après les promotions actives à l'instant présent."""
+    return f"{recalculer_prix_effectifs()} prix effectifs mis à jour"
+
+
+@shared_task
+def generer_variantes_image(label, pk):
+    """Crée les tailles réduites (JPEG et WebP) de l'image d'une Photo, UploadedImage ou Article."""
+    model = modele_image(label)
+    if model is None or not model.objects.filter(pk=pk).exists():
+        return f"{label} {pk} introuvable"
+    variantes = preparer_variantes(model, pk)
+    if variantes is None:
+        return f"Variantes de {label} {pk} déjà en cours de génération"
+    return f"{len(variantes)} variantes pour {label} {pk}"
+
+
+def programmer_variantes(label, pk):
+    """
+    Après le commit : génération des variantes d'une image. Si le broker est injoignable,
+    l'enregistrement n'échoue pas ; la vue variante_image les génère à la première requête.
+    """
+    def programmer():
+        try:
+            generer_variantes_image.delay(label, pk)
+        except Exception:
+            logger.warning("Variantes de %s %s non programmées (broker injoignable)", label, pk, exc_info=True)
+    transaction.on_commit(programmer)
+
+
+@shared_task
+def collecter_images_orphelines():
+    """Supprime les images du stockage adressé par le contenu qui ne sont plus référencées."""
+    return f"{collecter_orphelins()} images orphelines supprimées"
+
+
+@shared_task
+def liberer_reservations_expirees():
+    """Rend au stock les quantités des lignes de panier dont la réservation a expiré."""
+    return f"{liberer_reservations()} réservations de panier libérées"
+
+
+@shared_task
+def envoyer_courriels():
+    """Vide la file d'envoi des e-mails, lot par lot, une connexion SMTP par lot."""
+    envoyes = reportes = 0
+    while True:
+        lot_envoyes, lot_reportes = envoyer_en_attente()
+        envoyes += lot_envoyes
+        reportes += lot_reportes
+        if lot_envoyes + lot_reportes < TAILLE_LOT_COURRIELS:
+            return f"{envoyes} courriels envoyés, {reportes} reportés"
+
+
+@shared_task
+def compacter_journal_stock():
+    """Compacte le journal des mouvements de stock puis le rapproche du stock des produits."""
+    compactes = compacter_journal()
+    ecarts = ecarts_stock()
+    if ecarts:
+        detail = ', '.join(f'{pk} : {stock} / {calcule}' for pk, (stock, calcule) in sorted(ecarts.items()))
+        return f"{compactes} instantanés mis à jour ; écarts stock / journal : {detail}"
+    return f"{compactes} instantanés mis à jour ; aucun écart"
+
+
+@shared_task(bind=True, max_retries=ESSAIS_MAX)
+def moderer_commentaire(self, commentaire_id):
+    """
+    Modère un commentaire en attente (préfiltre, cache, puis modèle). Modèle indisponible :
+    nouvel essai après 30 s, 1 min, 2 min… ; au-delà de max_retries, le commentaire est
+    accepté par défaut, comme avant la modération asynchrone.
+    """
+    try:
+        return f"Commentaire {commentaire_id} : {moderer(commentaire_id) or 'déjà modéré'}"
+    except ErreurModeration as erreur:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=erreur, countdown=delai_essai(self.request.retries).total_seconds())
+        appliquer_verdict(commentaire_id, True)
+        return f"Commentaire {commentaire_id} accepté par défaut ({erreur})"
+
+
+@shared_task
+def moderer_commentaires_en_attente():
+    """Relance la modération des commentaires restés en attente après toute leur série d'essais (tâche perdue)."""
+    ids = a_relancer(timezone.now())
+    for commentaire_id in ids:
+        moderer_commentaire.delay(commentaire_id)
+    return f"{len(ids)} commentaires en attente relancés"
+
+
+def programmer_moderation(commentaire_id):
+    """
+    Après le commit : modération du commentaire. Si le broker est injoignable, la requête
+    n'échoue pas ; moderer_commentaires_en_attente reprendra le commentaire.
+    """
+    def programmer():
+        try:
+            moderer_commentaire.delay(commentaire_id)
+        except Exception:
+            logger.warning("Modération du commentaire %s non programmée (broker injoignable)", commentaire_id, exc_info=True)
+    transaction.on_commit(programmer)
+
+
+def planifier_prix_effectifs(promotion=None):
+    """
+    Après le commit : recalcul immédiat des prix effectifs, puis tâches ETA au début
+    et juste après la fin de la promotion (une promotion est active jusqu'à date_fin incluse).
+    Une ancienne échéance devenue inutile ne fait qu'un recalcul sans effet.
+    Broker injoignable : la requête n'échoue pas, le recalcul horaire rattrape les prix.
+    """
+    def planifier():
+        try:
+            rafraichir_prix_effectifs.delay()
+            if promotion is None:
+                return
+            now = timezone.now()
+            for echeance in (promotion.date_debut, promotion.date_fin + timedelta(seconds=1)):
+                if echeance > now:
+                    rafraichir_prix_effectifs.apply_async(eta=echeance)
+        except Exception:
+            logger.warning("Recalcul des prix effectifs non programmé (broker injoignable)", exc_info=True)
+    transaction.on_commit(planifier)
 
 
 import os
@@ -0,0 +1,24 @@
+import pytest
+from celery import current_app
+from django.core.cache import cache
+from api.suggestions import index_suggestions
+
+
+@pytest.fixture(autouse=True)
+def vider_cache():
+    """Chaque test démarre avec un cache vide (réponses et générations) et un index de suggestions à recharger."""
+    cache.clear()
+    index_suggestions.reinitialiser()
+    yield
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def celery_sur_place():
+    """Tâches Celery exécutées sur place, sans broker, leurs exceptions remontant au test."""
+    conf = current_app.conf
+    cles = ('task_always_eager', 'task_eager_propagates', 'broker_url', 'result_backend')
+    avant = {cle: conf[cle] for cle in cles}
+    conf.update(task_always_eager=True, task_eager_propagates=True, broker_url='memory://', result_backend='cache+memory://')
+    yield
+    conf.update(avant)
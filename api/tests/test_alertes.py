@@ -0,0 +1,62 @@
+import pytest
+from decimal import Decimal
+from django.core import mail
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from api import stock
+from api.alertes import alerter_stock_faible
+from api.courriels import envoyer_en_attente
+from api.models import Categorie, Courriel, Parametre, Produit, Utilisateur
+
+
+@pytest.fixture
+def produits(db):
+    roses = Categorie.objects.create(nom='Roses', seuil_stock_faible=10)
+    lys = Categorie.objects.create(nom='Lys')
+    creer = lambda nom, categorie, stock, **champs: Produit.objects.create(
+        nom=nom, description='', prix=Decimal('1000'), stock=stock, categorie=categorie, **champs
+    )
+    return {
+        'rose': creer('Rose', roses, 8),                            # Seuil de la catégorie : 10
+        'rose_rare': creer('Rose rare', roses, 8, seuil_stock_faible=3),  # Seuil propre : 3
+        'lys': creer('Lys', lys, 4),                                # Seuil par défaut : 5
+        'lys_blanc': creer('Lys blanc', lys, 50),
+    }
+
+
+@pytest.fixture
+def admins(db):
+    return [
+        Utilisateur.objects.create_user(username=f'admin{i}', email=f'admin{i}@example.com', password='x', role='admin')
+        for i in range(3)
+    ]
+
+
+def noms_signales():
+    return [p.nom for p in Produit.objects.filter(alerte_stock_faible=True).order_by('nom')]
+
+
+@pytest.mark.django_db
+def test_un_recapitulatif_par_admin_aux_franchissements(produits, admins):
+    with CaptureQueriesContext(connection) as requetes:
+        assert alerter_stock_faible() == 2
+    assert noms_signales() == ['Lys', 'Rose']
+    assert Courriel.objects.count() == len(admins)
+    assert len(requetes) <= 8  # Une insertion groupée dans la file, rien par admin ni par produit
+
+    envoyer_en_attente()
+    assert sorted(m.to[0] for m in mail.outbox) == [a.email for a in admins]
+    assert 'Lys' in mail.outbox[0].body and 'Rose rare' not in mail.outbox[0].body
+
+    # Toujours sous le seuil : pas de nouvelle alerte
+    stock.reserver(produits['rose'].pk, 1)
+    assert alerter_stock_faible() == 0
+
+    # Réapprovisionné puis de nouveau sous le seuil : nouvelle alerte ; franchissement du seuil par défaut modifié
+    stock.liberer(produits['rose'].pk, 10)
+    assert alerter_stock_faible() == 0 and noms_signales() == ['Lys']
+    stock.reserver(produits['rose'].pk, 15)
+    Parametre.objects.create(cle='SEUIL_STOCK_FAIBLE', valeur='60')
+    assert alerter_stock_faible() == 2
+    assert noms_signales() == ['Lys', 'Lys blanc', 'Rose']
+    assert Courriel.objects.count() == 2 * len(admins)
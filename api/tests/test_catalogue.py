@@ -0,0 +1,63 @@
+import io
+import json
+import pytest
+from decimal import Decimal
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework.test import APIClient
+from api.models import Categorie, Produit, Utilisateur
+
+
+@pytest.fixture
+def admin_client(db):
+    admin = Utilisateur.objects.create_user(username='admin', password='secret', role='admin', is_staff=True)
+    client = APIClient()
+    client.force_authenticate(admin)
+    return client
+
+
+@pytest.mark.django_db
+def test_import_csv_cree_met_a_jour_et_rejette(admin_client, django_capture_on_commit_callbacks):
+    """L'import crée et met à jour par lots, et rapporte les lignes rejetées avec leur numéro."""
+    roses = Categorie.objects.create(nom='Roses')
+    existant = Produit.objects.create(nom='Ancienne', description='', prix=Decimal('10'), stock=1, categorie=roses)
+    contenu = (
+        'id,nom,description,prix,stock,categorie,is_active\n'
+        ',Rose rouge,Belle,1500,10,Roses,true\n'
+        f'{existant.id},Rose blanche,,2000.50,3,Roses,false\n'
+        ',Tulipe,,abc,2,Tulipes,\n'
+    )
+    with django_capture_on_commit_callbacks(execute=True):
+        response = admin_client.post(reverse('produit-importer'), {
+            'fichier': SimpleUploadedFile('produits.csv', contenu.encode()),
+        }, format='multipart')
+    assert response.status_code == 200
+    assert (response.data['crees'], response.data['mis_a_jour'], response.data['rejetes']) == (1, 1, 1)
+    assert response.data['rejets'][0]['ligne'] == 4
+    assert set(response.data['rejets'][0]['erreurs']) == {'prix', 'categorie'}
+
+    existant.refresh_from_db()
+    assert (existant.nom, existant.prix, existant.is_active) == ('Rose blanche', Decimal('2000.50'), False)
+    assert Produit.objects.get(nom='Rose rouge').prix_effectif == Decimal('1500.00')
+    roses.refresh_from_db()
+    assert (roses.produits_count, roses.produits_actifs_count) == (2, 1)
+
+
+@pytest.mark.django_db
+def test_export_jsonl_reimportable(admin_client, tmp_path):
+    """L'export JSONL en flux se réimporte tel quel par la commande (mise à jour des mêmes produits)."""
+    roses = Categorie.objects.create(nom='Roses')
+    Produit.objects.bulk_create([
+        Produit(nom=f'Rose {i}', description='', prix=Decimal('100'), stock=i, categorie=roses) for i in range(5)
+    ])
+    response = admin_client.get(reverse('produit-exporter'), {'type': 'jsonl'})
+    contenu = b''.join(response.streaming_content)
+    lignes = [json.loads(ligne) for ligne in contenu.decode().splitlines()]
+    assert [ligne['categorie'] for ligne in lignes] == ['Roses'] * 5
+
+    fichier = tmp_path / 'produits.jsonl'
+    fichier.write_bytes(contenu)
+    sortie = io.StringIO()
+    call_command('importer_produits', str(fichier), stdout=sortie)
+    assert '0 produits créés, 5 mis à jour, 0 lignes rejetées' in sortie.getvalue()
@@ -0,0 +1,47 @@
+import pytest
+from decimal import Decimal
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework.test import APIClient
+from api.models import Categorie, Produit
+
+
+def compteurs(categorie):
+    categorie.refresh_from_db()
+    return categorie.produits_count, categorie.produits_actifs_count
+
+
+@pytest.mark.django_db
+def test_compteurs_suivent_les_produits():
+    """Création, désactivation, changement de catégorie et suppression mettent à jour les compteurs."""
+    roses, tulipes = Categorie.objects.create(nom='Roses'), Categorie.objects.create(nom='Tulipes')
+    produit = Produit.objects.create(nom='Rose', description='', prix=Decimal('10'), stock=1, categorie=roses)
+    Produit.objects.create(nom='Rose blanche', description='', prix=Decimal('10'), stock=1, categorie=roses)
+    assert compteurs(roses) == (2, 2)
+
+    produit.is_active = False
+    produit.save()
+    assert compteurs(roses) == (2, 1)
+
+    produit.categorie = tulipes
+    produit.save()
+    assert compteurs(roses) == (1, 1) and compteurs(tulipes) == (1, 0)
+
+    produit.delete()
+    assert compteurs(tulipes) == (0, 0)
+
+
+@pytest.mark.django_db
+def test_reconstruire_compteurs_et_liste_sans_comptage(django_assert_num_queries):
+    """La commande répare les compteurs ; la liste des catégories ne compte plus les produits."""
+    categories = [Categorie.objects.create(nom=f'Catégorie {i}') for i in range(5)]
+    Produit.objects.bulk_create([
+        Produit(nom=f'P{i}', description='', prix=Decimal('10'), stock=1, categorie=categories[i % 5])
+        for i in range(10)
+    ])  # bulk_create ne déclenche pas les signaux
+    call_command('reconstruire_compteurs')
+    assert compteurs(categories[0]) == (2, 2)
+
+    with django_assert_num_queries(2):  # count + catégories
+        response = APIClient().get(reverse('categorie-list'))
+    assert {c['produits_count'] for c in response.data['results']} == {2}
@@ -0,0 +1,117 @@
+import pytest
+from datetime import timedelta
+from decimal import Decimal
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from api.models import (
+    Adresse, Categorie, Commande, Paiement, Panier, PanierProduit, Produit, Promotion, Utilisateur
+)
+
+
+@pytest.fixture
+def cliente(db):
+    return Utilisateur.objects.create_user(username='cliente', password='x')
+
+
+@pytest.fixture
+def client(cliente):
+    client = APIClient()
+    client.force_authenticate(cliente)
+    return client
+
+
+@pytest.fixture
+def adresse(cliente):
+    return Adresse.objects.create(client=cliente, nom='Maison', rue='1 rue', ville='Douala', code_postal='0', pays='CM')
+
+
+@pytest.fixture
+def produits(db):
+    categories = [Categorie.objects.create(nom=f'Catégorie {i}') for i in range(3)]
+    produits = [
+        Produit.objects.create(nom=f'Produit {i}', description='', prix=Decimal('1000'), stock=100, categorie=categories[i % 3])
+        for i in range(30)
+    ]
+    now = timezone.now()
+    promotion = Promotion.objects.create(
+        nom='Printemps', reduction=0.2, date_debut=now - timedelta(days=1), date_fin=now + timedelta(days=1)
+    )
+    promotion.produits.set(produits[:10])
+    return produits
+
+
+def remplir(cliente, produits, expirees=0):
+    panier, _ = Panier.objects.get_or_create(client=cliente)
+    PanierProduit.objects.bulk_create([
+        PanierProduit(panier=panier, produit=produit, quantite=2, reservation_active=i >= expirees)
+        for i, produit in enumerate(produits)
+    ])
+    return panier
+
+
+def valider(client, panier, adresse):
+    with CaptureQueriesContext(connection) as requetes:
+        response = client.post(reverse('panier-valider-panier', args=[panier.pk]), {'adresse_id': adresse.pk})
+    assert response.status_code == 201, response.data
+    return len(requetes)
+
+
+@pytest.mark.django_db
+def test_valider_panier_nombre_de_requetes_constant(client, cliente, adresse, produits):
+    """1 ligne ou 30 lignes (dont des réservations expirées), même nombre de requêtes."""
+    petit = valider(client, remplir(cliente, produits[:1]), adresse)
+    grand = valider(client, remplir(cliente, produits, expirees=5), adresse)
+    assert grand <= petit + 4  # Savepoint, UPDATE et journal des réservations expirées, une fois
+
+    commande = Commande.objects.latest('id')
+    assert commande.lignes.count() == 30
+    assert commande.total == Decimal('56000.00')  # 10 lignes à 800 et 20 à 1000, par 2
+    assert Paiement.objects.get(commande=commande).montant == commande.total
+    assert not PanierProduit.objects.exists()
+    assert Produit.objects.get(pk=produits[4].pk).stock == 98   # Réservation expirée : reprise
+    assert Produit.objects.get(pk=produits[5].pk).stock == 100  # Déjà réservé au panier
+
+
+@pytest.mark.django_db
+def test_valider_panier_stock_manquant(client, cliente, adresse, produits):
+    Produit.objects.filter(pk=produits[1].pk).update(stock=1)
+    panier = remplir(cliente, produits[:3], expirees=3)
+    response = client.post(reverse('panier-valider-panier', args=[panier.pk]), {'adresse_id': adresse.pk})
+    assert response.status_code == 400
+    assert response.data['produits'] == [produits[1].pk]
+    assert list(Produit.objects.filter(pk__in=[p.pk for p in produits[:3]]).values_list('stock', flat=True)) == [100, 1, 100]
+    assert PanierProduit.objects.count() == 3 and not Commande.objects.exists()
+
+
+@pytest.mark.django_db
+def test_annulation_en_masse_requetes_constantes(client, cliente, adresse, produits):
+    admin = APIClient()
+    admin.force_authenticate(Utilisateur.objects.create_user(username='admin', password='x', role='admin', is_staff=True))
+
+    def commander(lignes):
+        valider(client, remplir(cliente, produits[:lignes]), adresse)
+        return Commande.objects.latest('id')
+
+    petite, grandes = commander(1), [commander(30) for _ in range(3)]
+    livree = commander(2)
+    Commande.objects.filter(pk=livree.pk).update(statut='livree')
+    Produit.objects.update(stock=50)
+
+    url = reverse('commande-annuler-en-masse')
+    with CaptureQueriesContext(connection) as une:
+        assert admin.post(url, {'ids': [petite.pk]}, format='json').status_code == 200
+    with CaptureQueriesContext(connection) as plusieurs:
+        response = admin.post(url, {'ids': [c.pk for c in grandes] + [livree.pk, petite.pk]}, format='json')
+    assert response.data == {'annulees': [c.pk for c in grandes], 'ignorees': sorted([petite.pk, livree.pk])}
+    # Une notification par commande en plus ; stock et paiements en requêtes constantes
+    assert len(plusieurs) <= len(une) + 2
+
+    # Chaque commande annulée rend 2 unités par produit ; la commande livrée garde les siennes
+    assert Produit.objects.get(pk=produits[0].pk).stock == 50 + 2 * 4
+    assert Produit.objects.get(pk=produits[29].pk).stock == 50 + 2 * 3
+    assert not Paiement.objects.filter(commande__statut='annulee').exists()
+    assert admin.post(url, {'ids': []}, format='json').status_code == 400
+    assert client.post(url, {'ids': [livree.pk]}, format='json').status_code == 403
@@ -0,0 +1,55 @@
+import pytest
+from rest_framework.test import APIClient
+from django.urls import reverse
+from api.models import Article, Panier, Utilisateur
+
+
+@pytest.fixture
+def client_authentifie(db):
+    utilisateur = Utilisateur.objects.create_user(
+        username='cliente', email='cliente@example.com', password='secret', is_active=True
+    )
+    client = APIClient()
+    client.force_authenticate(utilisateur)
+    client.utilisateur = utilisateur
+    return client
+
+
+@pytest.mark.django_db
+def test_article_304_sans_serialisation(django_assert_num_queries, django_capture_on_commit_callbacks):
+    """Un ETag encore valide donne un 304 vide ; une modification change l'ETag."""
+    auteur = Utilisateur.objects.create_user(username='admin', password='secret', role='admin')
+    article = Article.objects.create(titre='Roses', contenu='...', auteur=auteur)
+    client = APIClient()
+    url = reverse('article-detail', args=[article.pk])
+
+    response = client.get(url)
+    etag = response['ETag']
+    assert response.status_code == 200 and response.has_header('Last-Modified')
+
+    with django_assert_num_queries(0):  # Réponse et validateur servis depuis le cache
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304 and response.content == b''
+
+    with django_capture_on_commit_callbacks(execute=True):
+        article.titre = 'Tulipes'
+        article.save()
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+
+@pytest.mark.django_db
+def test_mon_panier_304_une_requete(client_authentifie, django_assert_num_queries):
+    """Le panier authentifié est revalidé par une seule requête, puis touché par les modifications."""
+    url = reverse('panier-detail', args=['mon_panier'])
+    client_authentifie.get(url)  # Crée le panier
+    etag = client_authentifie.get(url)['ETag']
+
+    with django_assert_num_queries(1):
+        response = client_authentifie.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    panier = Panier.objects.get(client=client_authentifie.utilisateur)
+    Panier.objects.filter(pk=panier.pk).update(date_mise_a_jour=panier.date_mise_a_jour.replace(year=2030))
+    assert client_authentifie.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
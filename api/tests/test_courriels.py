@@ -0,0 +1,87 @@
+import pytest
+from datetime import timedelta
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from api.courriels import MAX_TENTATIVES, envoyer_en_attente, mettre_en_file
+from api.models import Courriel
+
+
+class BackendEnPanne(EmailBackend):
+    def send_messages(self, messages):
+        raise ConnectionRefusedError('SMTP indisponible')
+
+
+@pytest.mark.django_db
+def test_inscription_met_le_courriel_en_file(django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks() as rappels:
+        response = APIClient().post(reverse('register'), {
+            'username': 'rose', 'email': 'rose@example.com', 'password': 'secret123'
+        }, format='json')
+    assert response.status_code == 201
+    courriel = Courriel.objects.get()
+    assert courriel.destinataires == ['rose@example.com'] and courriel.statut == 'en_attente'
+    assert mail.outbox == []  # Rien n'est envoyé pendant la requête
+
+    for rappel in rappels:  # Tâche envoyer_courriels (exécutée sur place par Celery en test)
+        rappel()
+    courriel.refresh_from_db()
+    assert courriel.statut == 'envoye' and courriel.tentatives == 1
+    assert len(mail.outbox) == 1 and mail.outbox[0].alternatives[0][1] == 'text/html'
+
+
+@pytest.mark.django_db
+def test_annule_avec_la_transaction():
+    with pytest.raises(RuntimeError), transaction.atomic():
+        mettre_en_file('Sujet', 'Texte', None, ['a@example.com'])
+        raise RuntimeError
+    assert not Courriel.objects.exists()
+
+
+@pytest.mark.django_db
+def test_reessai_avec_delai_exponentiel(settings):
+    settings.EMAIL_BACKEND = 'api.tests.test_courriels.BackendEnPanne'
+    courriel = mettre_en_file('Sujet', 'Texte', None, ['a@example.com'])
+    maintenant = timezone.now()
+    attentes = []
+    for _ in range(MAX_TENTATIVES):
+        assert envoyer_en_attente(maintenant=maintenant) == (0, 1)
+        assert envoyer_en_attente(maintenant=maintenant) == (0, 0)  # Pas encore dû
+        courriel.refresh_from_db()
+        attentes.append(courriel.prochain_essai - maintenant)
+        maintenant = courriel.prochain_essai
+    assert attentes[:3] == [timedelta(seconds=30), timedelta(minutes=1), timedelta(minutes=2)]
+    assert courriel.statut == 'echec' and 'SMTP indisponible' in courriel.derniere_erreur
+
+    # Le serveur revient : les courriels en attente partent sur une même connexion
+    settings.EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+    for i in range(3):
+        mettre_en_file(f'Sujet {i}', 'Texte', None, ['b@example.com'])
+    assert envoyer_en_attente() == (3, 0)
+    assert [m.subject for m in mail.outbox] == ['Sujet 0', 'Sujet 1', 'Sujet 2']
+
+
+@pytest.mark.django_db
+def test_une_tache_par_transaction(django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks() as rappels:
+        for i in range(3):
+            mettre_en_file('Sujet', 'Texte', None, [f'admin{i}@example.com'])
+    assert len(rappels) == 1 and Courriel.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_broker_injoignable(django_capture_on_commit_callbacks, monkeypatch):
+    from api.tasks import envoyer_courriels
+
+    def en_panne():
+        raise ConnectionRefusedError('broker indisponible')
+    monkeypatch.setattr(envoyer_courriels, 'delay', en_panne)
+    with django_capture_on_commit_callbacks(execute=True):
+        response = APIClient().post(reverse('register'), {
+            'username': 'rose', 'email': 'rose@example.com', 'password': 'secret123'
+        }, format='json')
+    assert response.status_code == 201
+    assert Courriel.objects.get().statut == 'en_attente'  # Envoyé au prochain passage de la tâche périodique
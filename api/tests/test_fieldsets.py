@@ -0,0 +1,57 @@
+import pytest
+from decimal import Decimal
+from datetime import timedelta
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from api.models import Categorie, Produit, Promotion, Utilisateur
+
+
+@pytest.fixture
+def client():
+    return APIClient()
+
+
+@pytest.fixture
+def produits(db):
+    categorie = Categorie.objects.create(nom='Roses')
+    return [
+        Produit.objects.create(nom=f'Rose {i}', description='Fleur', prix=Decimal('1000'), stock=5, categorie=categorie)
+        for i in range(20)
+    ]
+
+
+@pytest.mark.django_db
+def test_fields_restreint_la_reponse_et_les_requetes(client, produits, django_assert_num_queries):
+    """?fields= ne rend que les champs demandés et ne charge pas les relations non demandées."""
+    with django_assert_num_queries(3):  # validateur ETag, count, produits
+        response = client.get(reverse('produit-list'), {'fields': 'id,nom,prix_reduit', 'per_page': 100})
+    assert set(response.data['results'][0]) == {'id', 'nom', 'prix_reduit'}
+
+
+@pytest.mark.django_db
+def test_fields_imbriques_et_expand(client, produits):
+    """La notation pointée filtre les imbriqués ; hors ?expand=, une relation est rendue par ses ids."""
+    url = reverse('produit-list')
+    response = client.get(url, {'fields': 'id,categorie.nom'})
+    assert response.data['results'][0]['categorie'] == {'nom': 'Roses'}
+
+    response = client.get(url, {'fields': 'id,categorie,photos', 'expand': ''})
+    produit = response.data['results'][0]
+    assert produit['categorie'] == produits[0].categorie_id
+    assert produit['photos'] == []
+
+
+@pytest.mark.django_db
+def test_promotion_produits_replies(client, produits, django_assert_num_queries):
+    """?expand= évite d'embarquer chaque produit d'une promotion."""
+    admin = Utilisateur.objects.create_user(username='admin', password='secret', role='admin', is_staff=True)
+    client.force_authenticate(admin)
+    now = timezone.now()
+    promotion = Promotion.objects.create(
+        nom='Printemps', reduction=0.2, date_debut=now - timedelta(days=1), date_fin=now + timedelta(days=1)
+    )
+    promotion.produits.set(produits)
+    with django_assert_num_queries(2):  # promotion + catégorie, ids des produits
+        response = client.get(reverse('promotion-detail', args=[promotion.id]), {'expand': 'categorie'})
+    assert sorted(response.data['produits']) == sorted(p.id for p in produits)
@@ -0,0 +1,60 @@
+import pytest
+from django.template import engines
+from django.template.base import Template
+from django.template.loader import render_to_string
+from api.gabarits import Gabarit, gabarit, html_en_texte, rendre, rendre_plusieurs
+
+COMMUN = {'atelier_titre': 'Bouquets & couronnes', 'atelier_date': '2026-11-02 14:00', 'raison': 'Fleuriste <absente>'}
+
+
+def test_rendre_plusieurs_identique_au_rendu_complet():
+    contextes = [{'client_name': f'Client {i}'} for i in range(3)] + [{'client_name': 'Zoé <"o\'brien">'}]
+    rendus = rendre_plusieurs('atelier_canceled_email.html', contextes, commun=COMMUN)
+    for contexte, (html, texte) in zip(contextes, rendus):
+        attendu = render_to_string('atelier_canceled_email.html', {**COMMUN, **contexte})
+        assert html == attendu
+        assert texte == html_en_texte(attendu)
+    assert 'Zoé <"o\'brien">' in rendus[-1][1] and '&lt;absente&gt;' in rendus[-1][0]
+
+
+def test_repli_sur_le_rendu_complet():
+    # Valeur vide ou non textuelle : chaque contexte est rendu entièrement
+    rendus = rendre_plusieurs('commande_annulation_email.html', [
+        {'client_name': '', 'commande_id': 1}, {'client_name': 'Rose', 'commande_id': None},
+    ])
+    assert rendus[0] == rendre('commande_annulation_email.html', {'client_name': '', 'commande_id': 1})
+    assert 'None' in rendus[1][1]
+
+
+def test_texte():
+    html = render_to_string('otp_email.html', {'username': 'rose', 'otp_code': '123456'})
+    texte = html_en_texte(html)
+    assert '123456' in texte and 'rose' in texte
+    assert '<' not in texte and '\n\n' not in texte
+    assert 'font-family' not in texte  # Contenu de <head> / <style> écarté
+    assert gabarit('otp_email.html') is gabarit('otp_email.html')
+
+
+def test_un_seul_rendu_pour_le_lot(monkeypatch):
+    rendus = []
+    original = Template.render
+    monkeypatch.setattr(Template, 'render', lambda self, context: rendus.append(self) or original(self, context))
+    contextes = [{'client_name': f'Participant {i}'} for i in range(200)]
+    resultats = rendre_plusieurs('atelier_canceled_email.html', contextes, commun=COMMUN)
+    assert len(resultats) == 200 and 'Participant 199' in resultats[-1][1]
+    assert len(rendus) == 1
+
+
+@pytest.mark.parametrize('source', [
+    '<p>{{ client_name|lower }} — {{ titre }}</p>',
+    '<p>{% if client_name == "Rose" %}Chère Rose{% else %}Bonjour{% endif %} {{ client_name }}</p>',
+    '<p>{% autoescape off %}{{ client_name }}{% endautoescape %}</p>',
+    '<p>{{ client_name.upper }}</p>',
+])
+def test_variable_non_substituable(source):
+    modele = Gabarit('essai', engines['django'].from_string(source))
+    assert 'client_name' not in modele.substituables
+    contextes = [{'client_name': 'Rose'}, {'client_name': 'LYS <b>'}]
+    assert modele.rendre_plusieurs(contextes, {'titre': 'Atelier'}) == [
+        modele.rendre({'titre': 'Atelier', **contexte}) for contexte in contextes
+    ]
@@ -0,0 +1,100 @@
+import pytest
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework.views import exception_handler
+from api.models import Adresse, Atelier, Categorie, Commande, Paiement, Panier, PanierProduit, Participant, Produit, Utilisateur
+
+
+@pytest.fixture
+def cliente(db):
+    return Utilisateur.objects.create_user(username='cliente', password='x', role='client')
+
+
+@pytest.fixture
+def client(cliente):
+    client = APIClient()
+    client.force_authenticate(cliente)
+    return client
+
+
+@pytest.mark.django_db
+def test_valider_panier_rejoue(client, cliente):
+    produit = Produit.objects.create(
+        nom='Rose', description='', prix=Decimal('1000'), stock=10, categorie=Categorie.objects.create(nom='Roses')
+    )
+    panier = Panier.objects.create(client=cliente)
+    PanierProduit.objects.create(panier=panier, produit=produit, quantite=2)
+    adresse = Adresse.objects.create(client=cliente, nom='Maison', rue='1 rue', ville='Douala', code_postal='0', pays='CM')
+    url = reverse('panier-valider-panier', args=[panier.pk])
+
+    premiere = client.post(url, {'adresse_id': adresse.pk}, HTTP_IDEMPOTENCY_KEY='cle-1')
+    seconde = client.post(url, {'adresse_id': adresse.pk}, HTTP_IDEMPOTENCY_KEY='cle-1')
+    assert premiere.status_code == seconde.status_code == 201
+    assert seconde.data == premiere.data and seconde['Idempotent-Replayed'] == 'true'
+    assert Commande.objects.count() == 1 and Paiement.objects.count() == 1
+
+    assert client.post(url, {'adresse_id': 0}, HTTP_IDEMPOTENCY_KEY='cle-1').status_code == 422
+    # Sans clé, ou avec une autre clé, l'action s'exécute normalement (panier vide désormais)
+    assert client.post(url, {'adresse_id': adresse.pk}, HTTP_IDEMPOTENCY_KEY='cle-2').status_code == 400
+
+
+@pytest.mark.django_db(transaction=True)
+def test_doublons_concurrents_attendent_la_premiere_reponse(cliente):
+    atelier = Atelier.objects.create(
+        nom='Bouquet', date=timezone.now() + timedelta(days=3), duree=60, prix=Decimal('5000'),
+        places_disponibles=5, places_totales=5,
+    )
+    url = reverse('atelier-s-inscrire', args=[atelier.pk])
+    reponses, depart = [], threading.Barrier(5)
+
+    def inscrire():
+        try:
+            client = APIClient()
+            client.force_authenticate(cliente)
+            depart.wait()
+            reponses.append(client.post(url, HTTP_IDEMPOTENCY_KEY='inscription-1'))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=inscrire) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [r.status_code for r in reponses] == [200] * 5
+    assert sum(r.has_header('Idempotent-Replayed') for r in reponses) == 4
+    assert Participant.objects.count() == 1
+    atelier.refresh_from_db()
+    assert atelier.places_disponibles == 4
+
+
+@pytest.mark.django_db
+def test_verrou_rendu_apres_une_exception(client, cliente, monkeypatch):
+    from api import stock
+    from api.views import PanierViewSet
+    produit = Produit.objects.create(
+        nom='Rose', description='', prix=Decimal('1000'), stock=10, categorie=Categorie.objects.create(nom='Roses')
+    )
+    panier = Panier.objects.create(client=cliente)
+    PanierProduit.objects.create(panier=panier, produit=produit, quantite=2, reservation_active=False)
+    adresse = Adresse.objects.create(client=cliente, nom='Maison', rue='1 rue', ville='Douala', code_postal='0', pays='CM')
+    url = reverse('panier-valider-panier', args=[panier.pk])
+    monkeypatch.setattr(PanierViewSet, 'idempotency_wait', 0.2)
+    # Gestionnaire par défaut de DRF : l'exception remonte sans passer par finalize_response
+    monkeypatch.setattr(PanierViewSet, 'get_exception_handler', lambda self: exception_handler)
+
+    def en_panne(*args, **kwargs):
+        raise RuntimeError('base indisponible')
+    with monkeypatch.context() as patch:
+        patch.setattr(stock, 'reserver_quantites', en_panne)
+        with pytest.raises(RuntimeError):
+            client.post(url, {'adresse_id': adresse.pk}, HTTP_IDEMPOTENCY_KEY='cle-2')
+
+    # Nouvelle tentative avec la même clé : exécutée, sans attente ni 409
+    assert client.post(url, {'adresse_id': adresse.pk}, HTTP_IDEMPOTENCY_KEY='cle-2').status_code == 201
@@ -0,0 +1,76 @@
+import pytest
+from io import BytesIO
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+from rest_framework.test import APIClient
+from api.images import nom_variante
+from api.models import Photo
+from api.serializers import PhotoSerializer
+
+
+@pytest.fixture(autouse=True)
+def media(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+
+
+def image_png(largeur=1200, hauteur=900):
+    sortie = BytesIO()
+    Image.new('RGBA', (largeur, hauteur), (200, 30, 60, 255)).save(sortie, format='PNG')
+    return ContentFile(sortie.getvalue(), name='rose.png')
+
+
+@pytest.mark.django_db
+def test_variantes_generees_apres_enregistrement(django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        photo = Photo.objects.create(image=image_png())
+    photo.refresh_from_db()
+    assert photo.variantes['source'] == photo.image.name
+    with default_storage.open(photo.variantes['medium.webp']) as fichier:
+        image = Image.open(fichier)
+        assert (image.format, image.size) == ('WEBP', (480, 360))
+    with default_storage.open(photo.variantes['thumb.jpeg']) as fichier:
+        assert Image.open(fichier).size == (160, 120)
+
+    srcset = PhotoSerializer(photo).data['srcset']
+    assert srcset['thumb']['webp'] == default_storage.url(photo.variantes['thumb.webp'])
+
+
+@pytest.mark.django_db
+def test_variante_manquante_generee_a_la_demande():
+    photo = Photo.objects.create(image=image_png())  # Tâche jamais exécutée (pas de commit)
+    url = PhotoSerializer(photo).data['srcset']['medium']['jpeg']
+    assert not photo.variantes
+
+    response = APIClient().get(url)
+    assert response.status_code == 302
+    photo.refresh_from_db()
+    assert response['Location'] == default_storage.url(photo.variantes['medium.jpeg'])
+    assert default_storage.exists(photo.variantes['medium.jpeg'])
+    assert APIClient().get(url.replace('medium', 'geante')).status_code == 404
+
+
+@pytest.mark.django_db
+def test_variante_en_cours_de_generation():
+    photo = Photo.objects.create(image=image_png())
+    url = PhotoSerializer(photo).data['srcset']['thumb']['webp']
+    cache.add(f'images:variantes:api.photo:{photo.pk}', photo.image.name)  # Génération déjà en cours
+
+    response = APIClient().get(url)
+    assert response.status_code == 302 and response['Location'] == photo.image.url
+    photo.refresh_from_db()
+    assert not photo.variantes and not default_storage.exists(nom_variante(photo.image.name, 'thumb', 'webp'))
+
+
+@pytest.mark.django_db
+def test_televersement_broker_injoignable(django_capture_on_commit_callbacks, monkeypatch):
+    from api.tasks import generer_variantes_image
+
+    def en_panne(*args):
+        raise ConnectionRefusedError('broker indisponible')
+    monkeypatch.setattr(generer_variantes_image, 'delay', en_panne)
+    with django_capture_on_commit_callbacks(execute=True):
+        photo = Photo.objects.create(image=image_png())
+    photo.refresh_from_db()
+    assert not photo.variantes  # Générées par variante_image à la première requête
@@ -0,0 +1,151 @@
+import json
+import threading
+import time
+import pytest
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from api import moderation, tasks
+from api.models import Article, Commentaire, Utilisateur, VerdictModeration
+
+
+class ModeleLocal(BaseHTTPRequestHandler):
+    """Bouchon HTTP du modèle : répond comme l'API Gemini, avec un verdict et un délai réglables."""
+    requetes = []
+    verdict = {'isAppropriate': True, 'reason': ''}
+    delai = 0
+
+    def do_POST(self):
+        corps = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        type(self).requetes.append(corps['contents'][0]['parts'][0]['text'])
+        time.sleep(self.delai)
+        reponse = json.dumps({'candidates': [{'content': {'parts': [
+            {'text': f"```json\n{json.dumps(self.verdict)}\n```"}
+        ]}}]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(reponse)))
+        self.end_headers()
+        self.wfile.write(reponse)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def modele(monkeypatch):
+    ModeleLocal.requetes, ModeleLocal.verdict, ModeleLocal.delai = [], {'isAppropriate': True, 'reason': ''}, 0
+    serveur = ThreadingHTTPServer(('127.0.0.1', 0), ModeleLocal)
+    serveur.daemon_threads = True
+    threading.Thread(target=serveur.serve_forever, daemon=True).start()
+    monkeypatch.setattr(moderation, 'MODERATION_URL', f'http://127.0.0.1:{serveur.server_port}/')
+    yield ModeleLocal
+    serveur.shutdown()
+    serveur.server_close()
+
+
+@pytest.fixture
+def client_article(db):
+    client = Utilisateur.objects.create_user(username='rose', email='rose@example.com', password='x')
+    auteur = Utilisateur.objects.create_user(username='auteur', email='auteur@example.com', password='x', role='admin')
+    api = APIClient()
+    api.force_authenticate(client)
+    return api, Article.objects.create(titre='Bouquets', contenu='...', auteur=auteur)
+
+
+def commenter(api, article, texte, rappels_commit):
+    with rappels_commit() as rappels:
+        response = api.post(reverse('commentaire-list'), {'article': article.pk, 'texte': texte}, format='json')
+    assert response.status_code == 201 and response.data['statut_moderation'] == 'en_attente'
+    assert not Commentaire.objects.get(pk=response.data['id']).is_active  # Invisible avant le verdict
+    for rappel in rappels:  # Tâche moderer_commentaire
+        rappel()
+    return Commentaire.objects.get(pk=response.data['id'])
+
+
+@pytest.mark.django_db
+def test_moderation_asynchrone_et_cache(modele, client_article, django_capture_on_commit_callbacks):
+    api, article = client_article
+    commentaire = commenter(api, article, 'Très beau bouquet, merci !', django_capture_on_commit_callbacks)
+    assert commentaire.statut_moderation == 'approuve' and commentaire.is_active
+    assert len(modele.requetes) == 1
+
+    # Même texte à la casse, aux accents et à la ponctuation près : verdict en cache
+    commentaire = commenter(api, article, 'tres  BEAU bouquet merci', django_capture_on_commit_callbacks)
+    assert commentaire.is_active and len(modele.requetes) == 1
+    assert VerdictModeration.objects.count() == 1
+
+    modele.verdict = {'isAppropriate': False, 'reason': 'Publicité'}
+    commentaire = commenter(api, article, 'Achetez mes fleurs ailleurs', django_capture_on_commit_callbacks)
+    assert commentaire.statut_moderation == 'rejete' and commentaire.ban_reason == 'Publicité'
+    assert APIClient().get(reverse('commentaire-detail', args=[commentaire.pk])).status_code == 404
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('texte', ['Espèce de C0NNAAARD', 'quelle m-e-r-d-e', 'http://a.io http://b.io www.c.io'])
+def test_prefiltre_sans_appel_au_modele(modele, client_article, django_capture_on_commit_callbacks, texte):
+    api, article = client_article
+    commentaire = commenter(api, article, texte, django_capture_on_commit_callbacks)
+    assert commentaire.statut_moderation == 'rejete' and commentaire.ban_reason
+    assert modele.requetes == [] and not VerdictModeration.objects.exists()
+
+
+def test_prefiltre_sans_faux_positifs():
+    for texte in ['Un bouquet de roses pour ma mère', 'Les pivoines sont superbes', 'Merci, très bon service']:
+        assert moderation.prefiltrer(texte) is None
+
+
+@pytest.mark.django_db
+def test_modele_trop_lent(modele, client_article, monkeypatch):
+    _, article = client_article
+    commentaire = Commentaire.objects.create(article=article, client=article.auteur, texte='Jolies tulipes', is_active=False)
+    monkeypatch.setattr(moderation, 'MODERATION_TIMEOUT', 0.2)
+    modele.delai = 1
+    debut = time.perf_counter()
+    with pytest.raises(moderation.ErreurModeration):
+        moderation.moderer(commentaire.pk)
+    assert time.perf_counter() - debut < 1
+    commentaire.refresh_from_db()
+    assert commentaire.statut_moderation == 'en_attente' and not VerdictModeration.objects.exists()
+
+
+@pytest.mark.django_db
+def test_verdict_visible_malgre_le_cache(client_article, django_capture_on_commit_callbacks):
+    _, article = client_article
+    commentaire = Commentaire.objects.create(article=article, client=article.auteur, texte='Jolies tulipes', is_active=False)
+    url = reverse('article-detail', args=[article.pk])
+    assert APIClient().get(url).data['commentaires'] == []  # Réponse mise en cache
+    with django_capture_on_commit_callbacks(execute=True):
+        moderation.appliquer(commentaire.pk, True)
+    assert [c['id'] for c in APIClient().get(url).data['commentaires']] == [commentaire.pk]
+
+
+@pytest.mark.django_db
+def test_relance_unique_apres_la_serie_d_essais(client_article, monkeypatch):
+    _, article = client_article
+    creer = lambda age: Commentaire.objects.filter(pk=Commentaire.objects.create(
+        article=article, client=article.auteur, texte='Jolies tulipes', is_active=False
+    ).pk).update(date=timezone.now() - age)
+    creer(timedelta(minutes=16))  # Série d'essais peut-être encore en cours
+    creer(moderation.RELANCE_APRES + timedelta(minutes=1))
+    relances = []
+    monkeypatch.setattr(tasks.moderer_commentaire, 'delay', relances.append)
+
+    tasks.moderer_commentaires_en_attente()
+    tasks.moderer_commentaires_en_attente()  # Déjà relancé : pas de seconde série
+    assert relances == [Commentaire.objects.order_by('date').first().pk]
+
+
+@pytest.mark.django_db
+def test_broker_injoignable(client_article, django_capture_on_commit_callbacks, monkeypatch):
+    api, article = client_article
+
+    def en_panne(*args):
+        raise ConnectionRefusedError('broker indisponible')
+    monkeypatch.setattr(tasks.moderer_commentaire, 'delay', en_panne)
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api.post(reverse('commentaire-list'), {'article': article.pk, 'texte': 'Jolies tulipes'}, format='json')
+    assert response.status_code == 201
+    assert Commentaire.objects.get().statut_moderation == 'en_attente'  # Repris par moderer_commentaires_en_attente
@@ -0,0 +1,39 @@
+import pytest
+from decimal import Decimal
+from rest_framework.test import APIClient
+from django.urls import reverse
+from api.models import Utilisateur, Paiement
+
+
+@pytest.fixture
+def admin_client(db):
+    admin = Utilisateur.objects.create_user(username='admin', email='admin@example.com', password='admin123', role='admin')
+    client = APIClient()
+    client.force_authenticate(user=admin)
+    return client
+
+
+@pytest.fixture
+def paiements(db):
+    return [Paiement.objects.create(type_transaction='commande', montant=Decimal('1000')) for _ in range(25)]
+
+
+@pytest.mark.django_db
+def test_pagination_par_cle_sans_count_et_stable(admin_client, paiements, django_assert_num_queries):
+    """?cursor= parcourt (date, id) décroissant sans COUNT(*), même si des lignes arrivent entre deux pages."""
+    url = reverse('paiement-list')
+    with django_assert_num_queries(1):
+        premiere = admin_client.get(url, {'cursor': '', 'per_page': 10})
+    assert 'count' not in premiere.data
+    assert [p['id'] for p in premiere.data['results']] == [p.id for p in reversed(paiements)][:10]
+
+    Paiement.objects.create(type_transaction='commande', montant=Decimal('5'))  # Insertion concurrente
+    deuxieme = admin_client.get(premiere.data['next'])
+    assert [p['id'] for p in deuxieme.data['results']] == [p.id for p in reversed(paiements)][10:20]
+
+
+@pytest.mark.django_db
+def test_pagination_par_page_par_defaut(admin_client, paiements):
+    """Sans ?cursor=, la pagination par numéro de page reste inchangée."""
+    response = admin_client.get(reverse('paiement-list'))
+    assert response.data['count'] == 25
@@ -0,0 +1,52 @@
+import pytest
+from decimal import Decimal
+from datetime import timedelta
+from django.utils import timezone
+from api.models import Categorie, Produit, Promotion
+from api.pricing import PromotionIndex
+
+
+@pytest.fixture
+def categorie(db):
+    return Categorie.objects.create(nom='Fleurs fraîches')
+
+
+@pytest.fixture
+def produits(categorie):
+    return [
+        Produit.objects.create(nom=f'Rose {i}', description='Rose', prix=Decimal('1000'), stock=10, categorie=categorie)
+        for i in range(3)
+    ]
+
+
+def creer_promotion(nom, reduction, produits=(), categorie=None, **kwargs):
+    now = timezone.now()
+    promotion = Promotion.objects.create(
+        nom=nom, reduction=reduction, categorie=categorie,
+        date_debut=kwargs.get('date_debut', now - timedelta(days=1)),
+        date_fin=kwargs.get('date_fin', now + timedelta(days=1)),
+    )
+    promotion.produits.set(produits)
+    return promotion
+
+
+@pytest.mark.django_db
+def test_plus_forte_reduction_retenue(produits, categorie):
+    """Seule la plus forte réduction (produit ou catégorie) s'applique."""
+    creer_promotion('Printemps', 0.1, produits=[produits[0]])
+    creer_promotion('Fête', 0.25, categorie=categorie)
+    creer_promotion('Expirée', 0.9, produits=[produits[0]], date_fin=timezone.now() - timedelta(hours=1))
+
+    index = PromotionIndex.pour_produits(produits)
+    assert index.prix(produits[0]) == Decimal('750.00')
+    assert index.prix(produits[1]) == Decimal('750.00')
+
+
+@pytest.mark.django_db
+def test_index_en_une_requete(produits, django_assert_num_queries):
+    """L'index se construit en une seule requête quel que soit le nombre de produits."""
+    for i, produit in enumerate(produits):
+        creer_promotion(f'Promo {i}', 0.1 * (i + 1), produits=[produit])
+    with django_assert_num_queries(1):
+        index = PromotionIndex.pour_produits(produits)
+    assert [index.prix(p) for p in produits] == [Decimal('900.00'), Decimal('800.00'), Decimal('700.00')]
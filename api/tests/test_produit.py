@@ -0,0 +1,142 @@
+import pytest
+from decimal import Decimal
+from datetime import timedelta
+from rest_framework.test import APIClient
+from django.urls import reverse
+from django.utils import timezone
+from api.models import Categorie, Produit, Promotion, Utilisateur
+from api.pricing import recalculer_prix_effectifs
+
+
+@pytest.fixture
+def client():
+    return APIClient()
+
+
+@pytest.fixture
+def catalogue(db):
+    """Catalogue de 30 produits répartis sur 3 catégories, avec deux promotions actives."""
+    categories = [Categorie.objects.create(nom=f'Catégorie {i}') for i in range(3)]
+    produits = [
+        Produit.objects.create(
+            nom=f'Produit {i}', description='Fleur', prix=Decimal('1000'), stock=10,
+            categorie=categories[i % 3],
+        )
+        for i in range(30)
+    ]
+    now = timezone.now()
+    promotion = Promotion.objects.create(
+        nom='Printemps', reduction=0.2, date_debut=now - timedelta(days=1), date_fin=now + timedelta(days=1)
+    )
+    promotion.produits.set(produits[:10])
+    Promotion.objects.create(
+        nom='Catégorie 1', reduction=0.5, categorie=categories[1],
+        date_debut=now - timedelta(days=1), date_fin=now + timedelta(days=1)
+    )
+    recalculer_prix_effectifs()
+    return produits
+
+
+@pytest.mark.django_db
+def test_liste_produits_nombre_de_requetes_fixe(client, catalogue, django_assert_num_queries):
+    """
+    Une page de produits coûte un nombre fixe de requêtes : validateur ETag, count,
+    produits + catégories, photos et promotions liées (prix effectif matérialisé).
+    """
+    url = reverse('produit-list')
+    with django_assert_num_queries(5):
+        response = client.get(url, {'per_page': 100})
+    assert response.status_code == 200
+    assert len(response.data['results']) == 30
+
+
+@pytest.mark.django_db
+def test_liste_produits_prix_reduit(client, catalogue):
+    """Le prix réduit affiché retient la plus forte promotion applicable."""
+    response = client.get(reverse('produit-list'), {'per_page': 100})
+    prix = {p['id']: p['prix_reduit'] for p in response.data['results']}
+    assert prix[catalogue[0].id] == 800.0    # promotion produit
+    assert prix[catalogue[1].id] == 500.0    # promotion catégorie plus forte
+    assert prix[catalogue[29].id] == 1000.0  # aucune promotion
+
+
+@pytest.mark.django_db
+def test_recherche_produits_repli_sqlite(client, catalogue):
+    """Hors PostgreSQL, ?search= garde le comportement du SearchFilter (sous-chaîne)."""
+    Produit.objects.filter(pk=catalogue[0].pk).update(nom='Orchidée de Buea')
+    response = client.get(reverse('produit-list'), {'search': 'Orchid'})
+    assert [p['id'] for p in response.data['results']] == [catalogue[0].id]
+
+
+@pytest.mark.django_db
+def test_cache_liste_produits_invalide_par_signal(client, catalogue, django_assert_num_queries,
+                                                  django_capture_on_commit_callbacks):
+    """La liste anonyme est servie depuis le cache, puis invalidée dès qu'un produit change."""
+    url = reverse('produit-list')
+    client.get(url)
+    with django_assert_num_queries(0):
+        response = client.get(url)
+    assert response.status_code == 200
+
+    with django_capture_on_commit_callbacks(execute=True):
+        produit = Produit.objects.get(pk=response.data['results'][0]['id'])
+        produit.nom = 'Rose modifiée'
+        produit.save()
+    response = client.get(url)
+    assert response.data['results'][0]['nom'] == 'Rose modifiée'
+
+
+@pytest.mark.django_db
+def test_promotion_api_rafraichit_prix_effectifs(client, catalogue, django_capture_on_commit_callbacks):
+    """Créer une promotion via l'API recalcule les prix ; prix_max et le tri portent sur le prix réduit."""
+    admin = Utilisateur.objects.create_user(username='admin', password='secret', role='admin', is_staff=True)
+    client.force_authenticate(admin)
+    now = timezone.now()
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.post(reverse('promotion-list'), {
+            'nom': 'Soldes', 'reduction': 0.9, 'produit_ids': [catalogue[29].id],
+            'date_debut': now - timedelta(hours=1), 'date_fin': now + timedelta(days=1),
+        }, format='json')
+    assert response.status_code == 201
+    assert Produit.objects.get(pk=catalogue[29].pk).prix_effectif == Decimal('100.00')
+
+    response = client.get(reverse('produit-list'), {'prix_max': 500, 'ordering': 'prix_effectif', 'per_page': 100})
+    ids = [p['id'] for p in response.data['results']]
+    assert ids[0] == catalogue[29].id
+    assert len(ids) == 11  # catégorie 1 (-50 %) + le produit soldé
+
+
+@pytest.mark.django_db
+def test_promotion_broker_injoignable(client, catalogue, django_capture_on_commit_callbacks, monkeypatch):
+    """Broker injoignable : la suppression validée ne devient pas une erreur 500."""
+    from api.tasks import rafraichir_prix_effectifs
+
+    def en_panne(*args, **kwargs):
+        raise ConnectionRefusedError('broker indisponible')
+    monkeypatch.setattr(rafraichir_prix_effectifs, 'delay', en_panne)
+    client.force_authenticate(Utilisateur.objects.create_user(username='admin', password='secret', role='admin', is_staff=True))
+    promotion = Promotion.objects.first()
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.delete(reverse('promotion-detail', args=[promotion.pk]))
+    assert response.status_code == 204 and not Promotion.objects.filter(pk=promotion.pk).exists()
+
+
+@pytest.mark.django_db
+def test_facettes_une_requete_et_cache(client, catalogue, django_assert_num_queries):
+    """Les facettes suivent les filtres de la liste, en une requête, puis depuis le cache."""
+    Produit.objects.filter(pk=catalogue[2].pk).update(stock=0)
+    url = reverse('produit-facets')
+    with django_assert_num_queries(1):
+        response = client.get(url, {'prix_max': 900})
+    facettes = response.data
+    assert facettes['total'] == 17  # -20 % (produits 0 à 9) ou catégorie 1 (-50 %)
+    assert {c['nom']: c['count'] for c in facettes['categories']} == {
+        'Catégorie 0': 4, 'Catégorie 1': 10, 'Catégorie 2': 3,
+    }
+    assert facettes['prix'][0] == {'min': None, 'max': 5000, 'count': 17}
+    assert facettes['stock'] == {'en_stock': 16, 'rupture': 1}
+    assert facettes['promotion'] == {'en_promotion': 17, 'sans_promotion': 0}
+
+    with django_assert_num_queries(0):  # Même signature de filtres, ordre et pagination ignorés
+        response = client.get(url, {'page': 2, 'prix_max': '900 '})
+    assert response.data == facettes
@@ -0,0 +1,171 @@
+import pytest
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from api import stock
+from api.models import (
+    Adresse, Categorie, Commande, InstantaneStock, MouvementStock, Panier, PanierProduit, Parametre, Produit, Utilisateur
+)
+
+
+@pytest.fixture
+def produit(db):
+    categorie = Categorie.objects.create(nom='Roses')
+    return Produit.objects.create(nom='Rose', description='Fleur', prix=Decimal('1000'), stock=10, categorie=categorie)
+
+
+def stock_de(produit):
+    return Produit.objects.values_list('stock', flat=True).get(pk=produit.pk)
+
+
+@pytest.mark.django_db
+def test_panier_passe_par_le_service(produit):
+    client = APIClient()
+    client.force_authenticate(Utilisateur.objects.create_user(username='cliente', password='x'))
+    panier = Panier.objects.create(client=Utilisateur.objects.get(username='cliente'))
+    url = lambda action: reverse(f'panier-{action}', args=[panier.pk])
+
+    assert client.post(url('ajouter-produit'), {'produit_id': produit.pk, 'quantite': 4}).status_code == 201
+    assert client.post(url('ajouter-produit'), {'produit_id': produit.pk, 'quantite': 4}).data['quantite'] == 8
+    assert client.post(url('ajouter-produit'), {'produit_id': produit.pk, 'quantite': 3}).status_code == 400
+    assert stock_de(produit) == 2
+
+    assert client.post(url('modifier-quantite'), {'produit_id': produit.pk, 'quantite': 11}).status_code == 400
+    assert client.post(url('modifier-quantite'), {'produit_id': produit.pk, 'quantite': 5}).status_code == 200
+    assert stock_de(produit) == 5
+
+    assert client.post(url('supprimer-produit'), {'produit_id': produit.pk}).status_code == 204
+    assert stock_de(produit) == 10
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reservations_concurrentes(produit):
+    """Chaque thread a sa propre connexion : seul le UPDATE conditionnel arbitre entre eux."""
+    resultats, depart = [], threading.Barrier(25)
+
+    def acheter():
+        try:
+            depart.wait()
+            for _ in range(500):
+                try:
+                    resultats.append(stock.reserver(produit.pk, 1))
+                    break
+                except OperationalError:
+                    # SQLite (cache partagé) rejette l'écrivain concurrent au lieu de le faire attendre
+                    time.sleep(0.01)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=acheter) for _ in range(25)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(resultats) == 25  # Aucun thread n'a épuisé ses essais
+    assert resultats.count(True) == 10
+    assert stock_de(produit) == 0
+
+
+@pytest.mark.django_db
+def test_reservation_expiree_puis_reprise(produit):
+    Parametre.objects.create(cle='DUREE_RESERVATION_PANIER_MINUTES', valeur='10')
+    cliente = Utilisateur.objects.create_user(username='cliente', password='x')
+    client = APIClient()
+    client.force_authenticate(cliente)
+    panier = Panier.objects.create(client=cliente)
+    client.post(reverse('panier-ajouter-produit', args=[panier.pk]), {'produit_id': produit.pk, 'quantite': 3})
+    ligne = PanierProduit.objects.get()
+    assert timedelta(minutes=9) < ligne.reserve_jusqu_a - timezone.now() <= timedelta(minutes=10)
+
+    assert stock.liberer_reservations_expirees(timezone.now()) == 0
+    assert stock.liberer_reservations_expirees(timezone.now() + timedelta(minutes=11)) == 1
+    assert stock_de(produit) == 10
+    item = client.get(reverse('panier-detail', args=['mon_panier'])).data['items'][0]
+    assert item['reservation_expiree'] is True and item['quantite'] == 3
+
+    # La validation reprend le stock des lignes expirées
+    adresse = Adresse.objects.create(client=cliente, nom='Maison', rue='1 rue', ville='Douala', code_postal='0', pays='CM')
+    response = client.post(reverse('panier-valider-panier', args=[panier.pk]), {'adresse_id': adresse.pk})
+    assert response.status_code == 201
+    assert stock_de(produit) == 7
+    assert Commande.objects.get().lignes.get().quantite == 3
+
+
+@pytest.mark.django_db
+def test_batch_panier(produit):
+    cliente = Utilisateur.objects.create_user(username='cliente', password='x')
+    client = APIClient()
+    client.force_authenticate(cliente)
+    panier = Panier.objects.create(client=cliente)
+    lys = Produit.objects.create(nom='Lys', description='', prix=Decimal('500'), stock=5, categorie=produit.categorie)
+    tulipe = Produit.objects.create(nom='Tulipe', description='', prix=Decimal('200'), stock=3, categorie=produit.categorie)
+    client.post(reverse('panier-ajouter-produit', args=[panier.pk]), {'produit_id': produit.pk, 'quantite': 2})
+    url = reverse('panier-batch', args=[panier.pk])
+
+    response = client.post(url, [
+        {'op': 'add', 'produit_id': produit.pk, 'quantite': 3},
+        {'op': 'set', 'produit_id': lys.pk, 'quantite': 4},
+        {'op': 'add', 'produit_id': tulipe.pk, 'quantite': 1},
+        {'op': 'remove', 'produit_id': tulipe.pk},
+    ], format='json')
+    assert response.status_code == 200
+    assert {item['produit']['id']: item['quantite'] for item in response.data['items']} == {produit.pk: 5, lys.pk: 4}
+    assert response.data['total'] == '7000.00'
+    assert [stock_de(p) for p in (produit, lys, tulipe)] == [5, 1, 3]
+
+    # Tout ou rien
+    response = client.post(url, [
+        {'op': 'set', 'produit_id': produit.pk, 'quantite': 1},
+        {'op': 'add', 'produit_id': lys.pk, 'quantite': 2},
+    ], format='json')
+    assert response.status_code == 400 and response.data['produits'] == [lys.pk]
+    assert [stock_de(p) for p in (produit, lys)] == [5, 1]
+    assert client.post(url, [{'op': 'set', 'produit_id': lys.pk}], format='json').status_code == 400
+
+
+@pytest.mark.django_db
+def test_journal_des_mouvements(produit):
+    admin = APIClient()
+    admin.force_authenticate(Utilisateur.objects.create_user(username='admin', password='x', role='admin', is_staff=True))
+    cliente = Utilisateur.objects.create_user(username='cliente', password='x')
+    client = APIClient()
+    client.force_authenticate(cliente)
+    panier = Panier.objects.create(client=cliente)
+    adresse = Adresse.objects.create(client=cliente, nom='Maison', rue='1 rue', ville='Douala', code_postal='0', pays='CM')
+
+    client.post(reverse('panier-ajouter-produit', args=[panier.pk]), {'produit_id': produit.pk, 'quantite': 4})
+    client.post(reverse('panier-valider-panier', args=[panier.pk]), {'adresse_id': adresse.pk})
+    commande = Commande.objects.get()
+    assert stock.compacter_journal(timezone.now() + timedelta(minutes=10)) == 1
+    client.post(reverse('commande-cancel', args=[commande.pk]))
+    produit.refresh_from_db()
+    produit.nom = 'Rose rouge'
+    with CaptureQueriesContext(connection) as requetes:
+        produit.save()  # Stock inchangé : ni lecture préalable ni mouvement
+    assert not any('"api_produit"."stock" FROM' in requete['sql'] for requete in requetes)
+    produit.stock = 15
+    produit.save()  # Ajustement manuel
+
+    assert list(MouvementStock.objects.filter(produit=produit).order_by('id').values_list('delta', 'raison', 'reference')) == [
+        (10, 'initial', ''), (-4, 'panier', f'panier:{panier.pk}'),
+        (4, 'annulation', f'commande:{commande.pk}'), (5, 'ajustement', ''),
+    ]
+    assert InstantaneStock.objects.get(produit=produit).stock == 6
+    assert stock.ecarts_stock() == {}
+
+    response = admin.get(reverse('produit-mouvements', args=[produit.pk]), {'limit': 3})
+    assert response.data['stock'] == response.data['stock_calcule'] == 15
+    assert [m['raison'] for m in response.data['mouvements']] == ['ajustement', 'annulation', 'panier']
+    suite = admin.get(reverse('produit-mouvements', args=[produit.pk]), {'avant': response.data['avant']})
+    assert [m['raison'] for m in suite.data['mouvements']] == ['initial'] and suite.data['avant'] is None
+    assert client.get(reverse('produit-mouvements', args=[produit.pk])).status_code == 403
+
+    # Une écriture hors du service se voit au rapprochement
+    Produit.objects.filter(pk=produit.pk).update(stock=12)
+    assert stock.ecarts_stock() == {produit.pk: (12, 15)}
@@ -0,0 +1,58 @@
+import hashlib
+import pytest
+from datetime import timedelta
+from io import BytesIO
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from PIL import Image
+from rest_framework.test import APIClient
+from api.models import FichierImage, UploadedImage, Utilisateur
+from api.stockage import collecter_orphelins
+
+
+@pytest.fixture(autouse=True)
+def media(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+
+
+def octets_png():
+    sortie = BytesIO()
+    Image.new('RGB', (64, 64), (20, 120, 40)).save(sortie, format='PNG')
+    return sortie.getvalue()
+
+
+@pytest.mark.django_db
+def test_upload_identique_stocke_une_fois(django_capture_on_commit_callbacks):
+    client = APIClient()
+    client.force_authenticate(Utilisateur.objects.create_user(username='admin', password='x', role='admin'))
+    contenu = octets_png()
+    with django_capture_on_commit_callbacks(execute=True):
+        for nom in ('rose.png', 'copie.png'):
+            response = client.post(reverse('upload-image'), {'image': SimpleUploadedFile(nom, contenu)}, format='multipart')
+            assert response.status_code == 201
+
+    premiere, seconde = UploadedImage.objects.order_by('pk')
+    hexa = hashlib.sha256(contenu).hexdigest()
+    assert premiere.image.name == seconde.image.name == f'cas/{hexa[:2]}/{hexa[2:4]}/{hexa}.png'
+    # Un seul original, et ses variantes (générées une fois)
+    assert sorted(default_storage.listdir(f'cas/{hexa[:2]}/{hexa[2:4]}')[1]) == sorted(
+        [f'{hexa}.png'] + [f'{hexa}.{t}.{e}' for t in ('thumb', 'medium') for e in ('jpg', 'webp')]
+    )
+    assert FichierImage.objects.get(nom=premiere.image.name).references == 2
+
+
+@pytest.mark.django_db
+def test_ramasse_miettes():
+    image = UploadedImage.objects.create(image=ContentFile(octets_png(), name='rose.png'))
+    nom = image.image.name
+    autre = UploadedImage.objects.create(image=ContentFile(b'GIF89a', name='autre.gif'))
+    autre.delete()  # Plus aucune référence
+    perdu = default_storage.save(f'cas/00/00/{"0" * 64}.png', ContentFile(b'upload sans ligne'))
+
+    assert collecter_orphelins() == 0  # Trop récents
+    assert collecter_orphelins(delai=timedelta(0)) == 2
+    assert default_storage.exists(nom)
+    assert not default_storage.exists(autre.image.name) and not default_storage.exists(perdu)
+    assert list(FichierImage.objects.values_list('nom', 'references')) == [(nom, 1)]
@@ -0,0 +1,106 @@
+import pytest
+from decimal import Decimal
+from django.urls import reverse
+from rest_framework.test import APIClient
+from api.models import Categorie, Produit, Service
+from api.cache import generation
+from api.suggestions import CLE_VERSION, index_suggestions
+
+
+@pytest.fixture
+def client():
+    return APIClient()
+
+
+@pytest.fixture
+def catalogue(db, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        roses = Categorie.objects.create(nom='Roses')
+        produits = [
+            Produit.objects.create(nom=nom, description='Fleur', prix=Decimal('1000'), stock=5, categorie=roses)
+            for nom in ['Rose rouge', 'Rosier grimpant', 'Bouquet de roses', 'Orchidée blanche', 'Lys']
+        ]
+        Produit.objects.create(nom='Rose retirée', description='', prix=Decimal('1000'), stock=0, categorie=roses,
+                               is_active=False)
+        Service.objects.create(nom='Décoration florale', description='Mariages')
+    return produits
+
+
+def noms(response):
+    return [s['nom'] for s in response.data]
+
+
+@pytest.mark.django_db
+def test_prefixe_insensible_aux_accents(client, catalogue):
+    url = reverse('produit-suggest')
+    response = client.get(url, {'q': 'ros'})
+    assert response.status_code == 200
+    # Nom commençant par la requête d'abord, puis par longueur ; les inactifs sont exclus
+    assert noms(response) == ['Roses', 'Rose rouge', 'Rosier grimpant', 'Bouquet de roses']
+    assert noms(client.get(url, {'q': 'ORCHIDEE bl'})) == ['Orchidée blanche']
+    assert noms(client.get(url, {'q': 'deco'})) == ['Décoration florale']
+    assert noms(client.get(url, {'q': 'ros', 'types': 'categorie', 'limit': 5})) == ['Roses']
+    assert client.get(url, {'q': 'ros', 'types': 'inconnu'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_aucune_requete_une_fois_charge(client, catalogue, django_assert_num_queries):
+    url = reverse('produit-suggest')
+    client.get(url, {'q': 'lys'})
+    with django_assert_num_queries(0):
+        response = client.get(url, {'q': 'bouq'})
+    assert noms(response) == ['Bouquet de roses']
+
+
+@pytest.mark.django_db
+def test_mise_a_jour_incrementale(client, catalogue, django_capture_on_commit_callbacks):
+    url = reverse('produit-suggest')
+    assert noms(client.get(url, {'q': 'lys'})) == ['Lys']
+    version = index_suggestions._version
+
+    lys = catalogue[4]
+    with django_capture_on_commit_callbacks(execute=True):
+        lys.stock = 2
+        lys.save()
+    assert index_suggestions._version == version  # Rien de visible : pas de rechargement ailleurs
+
+    with django_capture_on_commit_callbacks(execute=True):
+        lys.nom = 'Lys tigré'
+        lys.save()
+        Produit.objects.create(nom='Lysianthus', description='', prix=Decimal('800'), stock=3,
+                               categorie=lys.categorie)
+    assert index_suggestions._version == version + 2  # Index local à jour, sans rechargement
+    assert noms(client.get(url, {'q': 'lys'})) == ['Lys tigré', 'Lysianthus']
+
+    with django_capture_on_commit_callbacks(execute=True):
+        lys.delete()
+    assert noms(client.get(url, {'q': 'lys'})) == ['Lysianthus']
+
+
+@pytest.mark.django_db
+def test_version_inchangee_sans_changement_visible(catalogue, django_capture_on_commit_callbacks):
+    index_suggestions.reinitialiser()  # Processus qui n'a pas encore chargé l'index
+    version = generation(CLE_VERSION)
+    lys = Produit.objects.get(nom='Lys')
+    retiree = Produit.objects.get(nom='Rose retirée')
+    with django_capture_on_commit_callbacks(execute=True):
+        lys.stock = 2
+        lys.save()
+        lys.prix = Decimal('900')
+        lys.save(update_fields=['prix'])
+        retiree.nom = 'Rose ancienne'  # Inactif : invisible
+        retiree.save()
+        retiree.delete()
+    assert generation(CLE_VERSION) == version
+
+    with django_capture_on_commit_callbacks(execute=True):
+        lys.nom = 'Lys tigré'
+        lys.save()
+    assert generation(CLE_VERSION) == version + 1
+
+
+@pytest.mark.django_db
+def test_repli_par_trigrammes(client, catalogue):
+    response = client.get(reverse('produit-suggest'), {'q': 'orchydee'})
+    assert noms(response) == ['Orchidée blanche']
+    assert client.get(reverse('produit-suggest'), {'q': 'zzzz'}).data == []
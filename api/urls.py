@@ -4,7 +4,7 @@ from .views import (
     ContactView, PhotoViewSet, UtilisateurViewSet, CategorieViewSet, ProduitViewSet, PromotionViewSet, CommandeViewSet,
     LigneCommandeViewSet, PanierViewSet, DevisViewSet, ServiceViewSet, RealisationViewSet,
     AbonnementViewSet, AtelierViewSet, ArticleViewSet, CommentaireViewSet, ParametreViewSet,
-    PaiementViewSet, AdresseViewSet, WishlistViewSet, upload_image
+    PaiementViewSet, AdresseViewSet, WishlistViewSet, upload_image, variante_image
 )
 import sys
 
@@ -42,4 +42,5 @@ urlpatterns = [
     path('change-password/', UtilisateurViewSet.as_view({'post': 'change_password'}), name='change-password'),
     path('update-profile/', UtilisateurViewSet.as_view({'patch': 'update_profile'}), name='update-profile'),
     path('upload-image/', upload_image, name='upload-image'),
+    path('images/<str:label>/<int:pk>/<str:taille>.<str:format>', variante_image, name='image-variante'),
 ]
\ No newline at end of file
@@ -1,21 +1,17 @@
+from collections import Counter
 from datetime import timedelta
-import json
 import random
 import string
-import requests
 from rest_framework import viewsets, status, serializers
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.throttling import ScopedRateThrottle
-from rest_framework.pagination import PageNumberPagination
 from django.db import models, transaction
 from django.shortcuts import get_object_or_404
-from django.db.models import Count, Sum, Q, F
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
+from django.db.models import Count, Sum, Q, F, Prefetch, prefetch_related_objects
+from django.core.files.storage import default_storage
 from django.utils import timezone
 from decimal import Decimal
 from django_filters.rest_framework import DjangoFilterBackend
@@ -27,13 +23,15 @@ from django.contrib.auth import authenticate
 
 from .models import (
     UploadedImage, Utilisateur, Categorie, Produit, Promotion, Commande, LigneCommande, Panier, PanierProduit, Adresse, Participant,
-    Devis, Service, Realisation, Abonnement, Atelier, Article, Commentaire, Parametre, Paiement, OTP, Wishlist, Photo
+    Devis, Service, Realisation, Abonnement, Atelier, Article, Commentaire, Parametre, Paiement, OTP, Wishlist, Photo,
+    MouvementStock
 )
 from .serializers import (
     UtilisateurSerializer, CategorieSerializer, ProduitSerializer, PromotionSerializer, AdresseSerializer,
     CommandeSerializer, LigneCommandeSerializer, PanierSerializer, PanierProduitSerializer, WishlistSerializer,
     DevisSerializer, ServiceSerializer, RealisationSerializer, AbonnementSerializer, OTPSerializer, PhotoSerializer,
-    AtelierSerializer, ArticleSerializer, CommentaireSerializer, ParametreSerializer, PaiementSerializer
+    AtelierSerializer, ArticleSerializer, ArticleDetailSerializer, CommentaireSerializer, ParametreSerializer, PaiementSerializer,
+    OperationPanierSerializer, AnnulationCommandesSerializer, MouvementStockSerializer
 )
 from .filters import (
     UtilisateurFilter, CategorieFilter, ProduitFilter, PromotionFilter, CommandeFilter,
@@ -41,7 +39,21 @@ from .filters import (
     AtelierFilter, ArticleFilter, CommentaireFilter, ParametreFilter, PaiementFilter
 )
 from .exceptions import BannedUserException
+from .alertes import en_stock_faible, seuil_par_defaut
+from .courriels import mettre_en_file, mettre_en_file_plusieurs
+from .gabarits import rendre, rendre_plusieurs
+from .catalogue import FORMATS as FORMATS_CATALOGUE, exporter_produits, importer_produits
+from .facettes import facettes_en_cache, signature_filtres
+from .images import FORMATS as FORMATS_IMAGES, TAILLES as TAILLES_IMAGES, champ_image, modele_image, preparer_variantes, srcset
+from .pricing import PromotionIndex
+from .tasks import planifier_prix_effectifs, programmer_moderation
+from .mixins import CachedResponseMixin, ConditionalGetMixin, IdempotencyMixin, QueryPlanViewSetMixin
+from .search import ProduitSearchFilter
+from . import stock
+from .suggestions import LIMITE_MAX as LIMITE_SUGGESTIONS, LIMITE_PAR_DEFAUT as LIMITE_SUGGESTIONS_DEFAUT, TYPES as TYPES_SUGGESTIONS, index_suggestions
+from .pagination import StandardResultsSetPagination, StandardOrKeysetPagination
 from django.conf import settings
+from django.http import Http404, HttpResponseRedirect, StreamingHttpResponse
 from django.db.models.functions import TruncDay
 from django.contrib.auth.hashers import check_password, make_password
 
@@ -57,7 +69,27 @@ def upload_image(request):
 
     # Construire l'URL complète de l'image
     image_url = request.build_absolute_uri(uploaded_image.image.url)
-    return Response({"url": image_url}, status=status.HTTP_201_CREATED)
+    return Response({"url": image_url, "srcset": srcset(uploaded_image, request)}, status=status.HTTP_201_CREATED)
+
+
+def variante_image(request, label, pk, taille, format):
+    """
+    Variante réduite d'une image, générée ici si la tâche ne l'a pas encore fait,
+    puis servie depuis MEDIA_URL par redirection. Pendant qu'une autre requête ou la
+    tâche la génère, redirection vers l'original.
+    """
+    model = modele_image(label)
+    if model is None or taille not in TAILLES_IMAGES or format not in FORMATS_IMAGES:
+        raise Http404
+    try:
+        variantes = preparer_variantes(model, pk)
+        if variantes is None:
+            return HttpResponseRedirect(getattr(model.objects.get(pk=pk), champ_image(model)).url)
+    except model.DoesNotExist:
+        raise Http404
+    if not variantes:
+        raise Http404
+    return HttpResponseRedirect(default_storage.url(variantes[f'{taille}.{format}']))
 
 
 class PhotoViewSet(viewsets.ModelViewSet):
@@ -95,11 +127,10 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
             OTP.objects.filter(utilisateur=user).delete()
             otp = OTP.objects.create(utilisateur=user)
             subject = 'Votre code OTP pour ChezFlora'
-            html_message = render_to_string('otp_email.html', {'username': user.username, 'otp_code': otp.code})
-            plain_message = strip_tags(html_message)
+            html_message, plain_message = rendre('otp_email.html', {'username': user.username, 'otp_code': otp.code})
             from_email = 'ChezFlora <plazarecrute@gmail.com>'
             to_email = user.email
-            send_mail(subject, plain_message, from_email, [to_email], html_message=html_message)
+            mettre_en_file(subject, plain_message, from_email, [to_email], html_message=html_message)
             raise serializers.ValidationError(
                 {'detail': 'Utilisateur non actif', 'user_id': user.id},
                 code='authorization'
@@ -120,13 +151,8 @@ class RegisterThrottle(ScopedRateThrottle):
 class VerifyOTPThrottle(ScopedRateThrottle):
     scope = 'verify_otp'
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'per_page'
-    max_page_size = 100
-
 # ViewSet pour les utilisateurs (authentification requise sauf pour inscription/OTP)
-class UtilisateurViewSet(viewsets.ModelViewSet):
+class UtilisateurViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Utilisateur.objects.all()
     serializer_class = UtilisateurSerializer
     permission_classes = [IsAuthenticated]
@@ -157,11 +183,10 @@ class UtilisateurViewSet(viewsets.ModelViewSet):
         user = serializer.save(role='client', is_active=False, is_banned=False)
         otp = OTP.objects.create(utilisateur=user)
         subject = 'Votre code OTP pour ChezFlora'
-        html_message = render_to_string('otp_email.html', {'username': user.username, 'otp_code': otp.code})
-        plain_message = strip_tags(html_message)
+        html_message, plain_message = rendre('otp_email.html', {'username': user.username, 'otp_code': otp.code})
         from_email = 'ChezFlora <plazarecrute@gmail.com>'
         to_email = user.email
-        send_mail(subject, plain_message, from_email, [to_email], html_message=html_message)
+        mettre_en_file(subject, plain_message, from_email, [to_email], html_message=html_message)
         return user
 
     @extend_schema(
@@ -186,11 +211,10 @@ class UtilisateurViewSet(viewsets.ModelViewSet):
                 OTP.objects.filter(utilisateur=existing_user).delete()
                 otp = OTP.objects.create(utilisateur=existing_user)
                 subject = 'Votre code OTP pour ChezFlora'
-                html_message = render_to_string('otp_email.html', {'username': existing_user.username, 'otp_code': otp.code})
-                plain_message = strip_tags(html_message)
+                html_message, plain_message = rendre('otp_email.html', {'username': existing_user.username, 'otp_code': otp.code})
                 from_email = 'ChezFlora <plazarecrute@gmail.com>'
                 to_email = existing_user.email
-                send_mail(subject, plain_message, from_email, [to_email], html_message=html_message)
+                mettre_en_file(subject, plain_message, from_email, [to_email], html_message=html_message)
                 return Response(
                     {'error': 'Utilisateur existe mais non actif', 'user_id': existing_user.id},
                     status=status.HTTP_400_BAD_REQUEST
@@ -252,11 +276,10 @@ class UtilisateurViewSet(viewsets.ModelViewSet):
         OTP.objects.filter(utilisateur=user).delete()
         otp = OTP.objects.create(utilisateur=user)
         subject = 'Votre nouvel OTP pour ChezFlora'
-        html_message = render_to_string('otp_email.html', {'username': user.username, 'otp_code': otp.code})
-        plain_message = strip_tags(html_message)
+        html_message, plain_message = rendre('otp_email.html', {'username': user.username, 'otp_code': otp.code})
         from_email = 'ChezFlora <plazarecrute@gmail.com>'
         to_email = user.email
-        send_mail(subject, plain_message, from_email, [to_email], html_message=html_message)
+        mettre_en_file(subject, plain_message, from_email, [to_email], html_message=html_message)
         return Response({'status': 'Nouvel OTP envoyé', 'user_id': user.id}, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['post'], permission_classes=[AllowAny])
@@ -268,7 +291,7 @@ class UtilisateurViewSet(viewsets.ModelViewSet):
             user = Utilisateur.objects.get(email=email)
             token = ''.join(random.choices(string.ascii_letters + string.digits, k=20))
             OTP.objects.create(utilisateur=user, code=token, expiration=timezone.now() + timedelta(hours=1))
-            send_mail(
+            mettre_en_file(
                 'Réinitialisation de mot de passe - ChezFlora',
                 f'Utilisez ce code pour réinitialiser votre mot de passe : {token}',
                 'plazarecrute@gmail.com',
@@ -366,7 +389,7 @@ class UtilisateurViewSet(viewsets.ModelViewSet):
 
         total_products = Produit.objects.count()
         active_products = Produit.objects.filter(is_active=True).count()
-        low_stock_products = Produit.objects.filter(stock__lt=5, is_active=True).count()
+        low_stock_products = en_stock_faible(Produit.objects.filter(is_active=True)).count()
         products_by_category = Produit.objects.filter(is_active=True).values('categorie__nom').annotate(count=Count('id'))
 
         total_ateliers = Atelier.objects.count()
@@ -382,7 +405,7 @@ class UtilisateurViewSet(viewsets.ModelViewSet):
         active_subscriptions = Abonnement.objects.filter(is_active=True).count()
         subscription_revenue = Abonnement.objects.filter(is_active=True).aggregate(Sum('prix'))['prix__sum'] or Decimal('0.00')
 
-        low_stock_details = Produit.objects.filter(stock__lt=5, is_active=True).values('id', 'nom', 'stock')
+        low_stock_details = en_stock_faible(Produit.objects.filter(is_active=True)).values('id', 'nom', 'stock', 'seuil')
 
         dashboard_data = {
             'users': {
@@ -504,7 +527,7 @@ class UtilisateurViewSet(viewsets.ModelViewSet):
     
 
 # ViewSet pour les catégories (public par défaut)
-class CategorieViewSet(viewsets.ModelViewSet):
+class CategorieViewSet(CachedResponseMixin, QueryPlanViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet pour les catégories. Accessible publiquement en lecture seule.
     Modification réservée aux admins.
@@ -515,8 +538,9 @@ class CategorieViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_class = CategorieFilter
     search_fields = ['nom']
-    ordering_fields = ['nom', 'date_creation']
+    ordering_fields = ['nom', 'date_creation', 'produits_count']
     pagination_class = StandardResultsSetPagination  # Ajouté
+    cache_models = (Categorie,)  # Compteurs de produits dénormalisés sur Categorie
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -527,45 +551,36 @@ class CategorieViewSet(viewsets.ModelViewSet):
         if getattr(self, 'swagger_fake_view', False):
             return Categorie.objects.none()
         if self.request.user.is_authenticated and self.request.user.role == 'admin':
-            return Categorie.objects.all()  # Admins voient toutes les catégories, actives ou non
-        return Categorie.objects.filter()
+            queryset = Categorie.objects.all()  # Admins voient toutes les catégories, actives ou non
+        else:
+            queryset = Categorie.objects.filter()
+        return self.planifier_queryset(queryset)
 
 # ViewSet pour les produits (public par défaut)
-class ProduitViewSet(viewsets.ModelViewSet):
+class ProduitViewSet(CachedResponseMixin, ConditionalGetMixin, QueryPlanViewSetMixin, viewsets.ModelViewSet):
     serializer_class = ProduitSerializer
     permission_classes = [AllowAny]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, ProduitSearchFilter, filters.OrderingFilter]  # Plein texte sous PostgreSQL
     filterset_class = ProduitFilter
     search_fields = ['nom', 'description']
-    ordering_fields = ['prix', 'stock', 'date_creation']
+    ordering_fields = ['prix', 'prix_effectif', 'stock', 'date_creation']
     pagination_class = StandardResultsSetPagination  # Ajouté
+    cache_models = (Produit, Categorie, Promotion, Photo)
 
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
             return Produit.objects.none()
         if self.request.user.is_authenticated and self.request.user.role == 'admin':
-            return Produit.objects.all().order_by('id')  # Admins voient tous les produits, actifs ou non
-        return Produit.objects.filter(is_active=True)
+            queryset = Produit.objects.all().order_by('id')  # Admins voient tous les produits, actifs ou non
+        else:
+            queryset = Produit.objects.filter(is_active=True)
+        return self.planifier_queryset(queryset)
 
     def get_permissions(self):
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'importer', 'exporter', 'mouvements']:
             return [IsAdminUser()]
         return [AllowAny()]
 
-    def perform_update(self, serializer):
-        produit = serializer.save()
-        if produit.stock < 5:
-            admins = Utilisateur.objects.filter(role='admin')
-            subject = 'Alerte Stock Faible - ChezFlora'
-            for admin in admins:
-                html_message = render_to_string('stock_faible_email.html', {
-                    'admin_name': admin.username,
-                    'produit_nom': produit.nom,
-                    'stock': produit.stock,
-                })
-                plain_message = strip_tags(html_message)
-                send_mail(subject, plain_message, 'ChezFlora <plazarecrute@gmail.com>', [admin.email], html_message=html_message)
-
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def upload_photo(self, request, pk=None):
         produit = self.get_object()
@@ -577,6 +592,103 @@ class ProduitViewSet(viewsets.ModelViewSet):
 
     def get_serializer_context(self):
         return {'request': self.request}
+
+    @extend_schema(
+        description="Facettes du catalogue pour les filtres de la liste (mêmes paramètres) : nombre de produits "
+                    "par catégorie, par tranche de prix (après promotion), en stock ou non, en promotion ou non.",
+    )
+    @action(detail=False, methods=['get'], url_path='facets')
+    def facets(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        admin = request.user.is_authenticated and request.user.role == 'admin'  # Produits inactifs inclus
+        noms = [*self.filterset_class.base_filters, settings.REST_FRAMEWORK.get('SEARCH_PARAM', 'search')]
+        signature = f"{'admin' if admin else 'public'}:{signature_filtres(request.query_params, noms)}"
+        return Response(facettes_en_cache(queryset, signature))
+
+    @extend_schema(
+        description="Autocomplétion : produits, catégories et services actifs dont un mot commence par chaque "
+                    "terme de `q` (sans tenir compte des accents), servis depuis un index en mémoire. "
+                    "À défaut, noms approchants (fautes de frappe).",
+        parameters=[
+            OpenApiParameter('q', str, required=True),
+            OpenApiParameter('limit', int, description=f'Nombre de suggestions (max {LIMITE_SUGGESTIONS})'),
+            OpenApiParameter('types', str, description='Types séparés par des virgules : produit, categorie, service'),
+        ],
+    )
+    @action(detail=False, methods=['get'], url_path='suggest', authentication_classes=[], permission_classes=[AllowAny])
+    def suggest(self, request):
+        try:
+            limite = int(request.query_params.get('limit', LIMITE_SUGGESTIONS_DEFAUT))
+        except ValueError:
+            return Response({'error': 'limit doit être un entier'}, status=status.HTTP_400_BAD_REQUEST)
+        limite = max(1, min(limite, LIMITE_SUGGESTIONS))
+        types = {t.strip() for t in request.query_params.get('types', '').split(',') if t.strip()}
+        if types - TYPES_SUGGESTIONS.keys():
+            return Response({'error': f"Types inconnus : {', '.join(sorted(types - TYPES_SUGGESTIONS.keys()))}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(index_suggestions.suggerer(request.query_params.get('q', ''), limite, types or None))
+
+    @extend_schema(
+        description="Importe des produits en masse depuis un fichier CSV ou JSONL (champ `fichier`). "
+                    "Une ligne avec `id` met à jour le produit existant ; la catégorie est désignée par son nom. "
+                    "Retourne le nombre de produits créés / mis à jour et les lignes rejetées.",
+    )
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def importer(self, request):
+        fichier = request.FILES.get('fichier')
+        if fichier is None:
+            return Response({'error': 'Fichier requis (champ fichier)'}, status=status.HTTP_400_BAD_REQUEST)
+        type_fichier = request.data.get('type') or ('jsonl' if fichier.name.endswith(('.jsonl', '.ndjson')) else 'csv')
+        if type_fichier not in FORMATS_CATALOGUE:
+            return Response({'error': f'Type inconnu : {type_fichier}'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            rapport = importer_produits(fichier.file, type_fichier)
+        except UnicodeDecodeError:
+            return Response({'error': 'Le fichier doit être encodé en UTF-8'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(rapport.as_dict(), status=status.HTTP_200_OK)
+
+    @extend_schema(
+        description="Exporte le catalogue (filtres de la liste applicables) en flux CSV ou JSONL (?type=).",
+        parameters=[OpenApiParameter('type', str, enum=['csv', 'jsonl'])],
+    )
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def exporter(self, request):
+        type_fichier = request.query_params.get('type', 'csv')
+        if type_fichier not in FORMATS_CATALOGUE:
+            return Response({'error': f'Type inconnu : {type_fichier}'}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(
+            exporter_produits(queryset, type_fichier),
+            content_type='text/csv' if type_fichier == 'csv' else 'application/x-ndjson',
+        )
+        response['Content-Disposition'] = f'attachment; filename="produits.{type_fichier}"'
+        return response
+
+    @extend_schema(
+        description="Historique des mouvements de stock du produit, du plus récent au plus ancien, par pages "
+                    "de `limit` (?avant=<id> pour la page suivante), avec le stock recalculé depuis le journal.",
+        parameters=[OpenApiParameter('avant', int), OpenApiParameter('limit', int)],
+    )
+    @action(detail=True, methods=['get'], permission_classes=[IsAdminUser])
+    def mouvements(self, request, pk=None):
+        produit = self.get_object()
+        try:
+            limite = min(max(int(request.query_params.get('limit', 50)), 1), 500)
+            avant = int(request.query_params['avant']) if 'avant' in request.query_params else None
+        except ValueError:
+            return Response({'error': 'limit et avant doivent être des entiers'}, status=status.HTTP_400_BAD_REQUEST)
+        # Parcours de l'index (produit, id)
+        mouvements = MouvementStock.objects.filter(produit=produit).order_by('-id')
+        if avant is not None:
+            mouvements = mouvements.filter(id__lt=avant)
+        page = list(mouvements[:limite])
+        stock_calcule = stock.avec_stock_calcule(Produit.objects.filter(pk=produit.pk)).values_list('stock_calcule', flat=True).get()
+        return Response({
+            'stock': produit.stock,
+            'stock_calcule': stock_calcule,
+            'mouvements': MouvementStockSerializer(page, many=True).data,
+            'avant': page[-1].id if len(page) == limite else None,
+        })
     
     @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
     def stats(self, request):
@@ -590,7 +702,7 @@ class ProduitViewSet(viewsets.ModelViewSet):
 
         total_products = Produit.objects.count()
         active_products = Produit.objects.filter(is_active=True).count()
-        low_stock_products = Produit.objects.filter(stock__lt=5, is_active=True).count()
+        low_stock_products = en_stock_faible(Produit.objects.filter(is_active=True)).count()
         total_sales = (
             LigneCommande.objects
             .filter(commande__date__gte=last_period, commande__statut__in=['livree', 'expediee'])
@@ -609,7 +721,7 @@ class ProduitViewSet(viewsets.ModelViewSet):
             .annotate(total_stock=Sum('stock'))
             .order_by('categorie__nom')
         )
-        low_stock_details = Produit.objects.filter(stock__lt=5, is_active=True).values('id', 'nom', 'stock')
+        low_stock_details = en_stock_faible(Produit.objects.filter(is_active=True)).values('id', 'nom', 'stock', 'seuil')
 
         stats_data = {
             'total_products': total_products,
@@ -630,10 +742,10 @@ class ProduitViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
     def low_stock(self, request):
-        seuil_param = Parametre.objects.filter(cle='SEUIL_STOCK_FAIBLE').first()
-        seuil = int(seuil_param.valeur) if seuil_param else 5  # Valeur par défaut : 5
-
-        low_stock_products = Produit.objects.filter(stock__lt=seuil, is_active=True).values('id', 'nom', 'stock', 'categorie__nom')
+        seuil = seuil_par_defaut()  # Parametre SEUIL_STOCK_FAIBLE ; seuils propres au produit ou à la catégorie d'abord
+        low_stock_products = en_stock_faible(Produit.objects.filter(is_active=True), seuil).values(
+            'id', 'nom', 'stock', 'seuil', 'categorie__nom'
+        )
         total_low_stock = low_stock_products.count()
 
         return Response({
@@ -643,7 +755,7 @@ class ProduitViewSet(viewsets.ModelViewSet):
         })
     
 # ViewSet pour les promotions (admin seulement)
-class PromotionViewSet(viewsets.ModelViewSet):
+class PromotionViewSet(QueryPlanViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet pour les promotions. Réservé aux administrateurs.
     """
@@ -665,12 +777,14 @@ class PromotionViewSet(viewsets.ModelViewSet):
         if getattr(self, 'swagger_fake_view', False):
             return Promotion.objects.none()
         if self.request.user.is_authenticated and self.request.user.role == 'admin':
-            return Promotion.objects.all()
-        return Promotion.objects.filter(
-            date_debut__lte=timezone.now(),
-            date_fin__gte=timezone.now(),
-            is_active=True
-        )
+            queryset = Promotion.objects.all()
+        else:
+            queryset = Promotion.objects.filter(
+                date_debut__lte=timezone.now(),
+                date_fin__gte=timezone.now(),
+                is_active=True
+            )
+        return self.planifier_queryset(queryset)
 
     @action(detail=True, methods=['get'], permission_classes=[])
     def produits_affectes(self, request, pk=None):
@@ -698,6 +812,7 @@ class PromotionViewSet(viewsets.ModelViewSet):
         # Si ni produit_ids ni categorie, vider la liste (optionnel selon vos besoins)
         else:
             instance.produits.clear()
+        planifier_prix_effectifs(instance)
 
     def perform_update(self, serializer):
         # Sauvegarde des modifications
@@ -713,9 +828,14 @@ class PromotionViewSet(viewsets.ModelViewSet):
         elif instance.categorie_id and instance.categorie_id is not None:
             instance.produits.set(Produit.objects.filter(categorie=instance.categorie_id))
         # Si ni produit_ids ni categorie, ne rien faire (conserver les produits existants)
+        planifier_prix_effectifs(instance)
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        planifier_prix_effectifs()
 
 # ViewSet pour les commandes (authentification requise)
-class CommandeViewSet(viewsets.ModelViewSet):
+class CommandeViewSet(ConditionalGetMixin, QueryPlanViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet pour les commandes. Nécessite une authentification.
     """
@@ -725,53 +845,75 @@ class CommandeViewSet(viewsets.ModelViewSet):
     filterset_class = CommandeFilter
     search_fields = ['client__username']
     ordering_fields = ['date', 'total']
-    pagination_class = StandardResultsSetPagination  # Ajouté
+    pagination_class = StandardOrKeysetPagination  # ?cursor= pour la pagination par clé
+    keyset_ordering = ('-date', '-id')
+    conditional_models = (Utilisateur, Adresse, Produit, Categorie, Promotion, Photo)  # Contenu imbriqué
 
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
             return Commande.objects.none()
         if self.request.user.role == 'admin':
-            return Commande.objects.all()
-        return Commande.objects.filter(client=self.request.user)
+            queryset = Commande.objects.all()
+        else:
+            queryset = Commande.objects.filter(client=self.request.user)
+        return self.planifier_queryset(queryset)
     
+    ANNULABLES = ('en_attente', 'en_cours')
+
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def cancel(self, request, pk=None):
         commande = self.get_object()
         if commande.client != request.user and request.user.role != 'admin':
             return Response({'error': 'Non autorisé'}, status=status.HTTP_403_FORBIDDEN)
-        if commande.statut not in ['en_attente', 'en_cours']:
+        if commande.statut not in self.ANNULABLES:
             return Response({'error': 'Commande déjà traitée ou annulée'}, status=status.HTTP_400_BAD_REQUEST)
 
         with transaction.atomic():
-            # Restaurer le stock
-            for ligne in commande.lignes.all():
-                produit = ligne.produit
-                produit.stock += ligne.quantite
-                produit.save()
-            
-            # Gérer le paiement
-            paiement = commande.paiements.first()
-            if paiement:
-                if paiement.statut == 'effectue':
-                    paiement.statut = 'rembourse'
-                    paiement.save()
-                elif paiement.statut == 'simule':
-                    paiement.delete()
-
+            # Transition conditionnelle : une annulation concurrente ne restitue pas le stock deux fois
+            if not stock.annuler_commandes(Commande.objects.filter(pk=commande.pk, statut__in=self.ANNULABLES)):
+                return Response({'error': 'Commande déjà traitée ou annulée'}, status=status.HTTP_400_BAD_REQUEST)
+            self._solder_paiements([commande.pk])
             commande.statut = 'annulee'
-            commande.save()
-
-            # Notifier
-            subject = 'Annulation de votre commande - ChezFlora'
-            html_message = render_to_string('commande_annulation_email.html', {
-                'client_name': commande.client.username,
-                'commande_id': commande.id,
-            })
-            plain_message = strip_tags(html_message)
-            send_mail(subject, plain_message, 'ChezFlora <plazarecrute@gmail.com>', [commande.client.email], html_message=html_message)
+            self._notifier_annulation([commande])
 
         return Response({'status': 'Commande annulée'}, status=status.HTTP_200_OK)
 
+    @extend_schema(request=AnnulationCommandesSerializer)
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser], url_path='annuler')
+    def annuler_en_masse(self, request):
+        """Annule plusieurs commandes (admin) ; stock et paiements en un nombre constant de requêtes."""
+        serializer = AnnulationCommandesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+
+        with transaction.atomic():
+            annulees = stock.annuler_commandes(Commande.objects.filter(pk__in=ids, statut__in=self.ANNULABLES))
+            self._solder_paiements(annulees)
+            self._notifier_annulation(Commande.objects.filter(pk__in=annulees).select_related('client'))
+
+        return Response({
+            'annulees': sorted(annulees),
+            'ignorees': sorted(set(ids) - set(annulees)),
+        }, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def _solder_paiements(commande_ids):
+        # Paiement effectué : remboursé ; simple simulation : supprimée
+        Paiement.objects.filter(commande_id__in=commande_ids, statut='effectue').update(statut='rembourse')
+        Paiement.objects.filter(commande_id__in=commande_ids, statut='simule').delete()
+
+    @staticmethod
+    def _notifier_annulation(commandes):
+        commandes = list(commandes)
+        subject = 'Annulation de votre commande - ChezFlora'
+        rendus = rendre_plusieurs('commande_annulation_email.html', [
+            {'client_name': commande.client.username, 'commande_id': commande.id} for commande in commandes
+        ])
+        mettre_en_file_plusieurs(subject, 'ChezFlora <plazarecrute@gmail.com>', [
+            ([commande.client.email], plain_message, html_message)
+            for commande, (html_message, plain_message) in zip(commandes, rendus)
+        ])
+
     @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
     def revenue(self, request):
         days = request.query_params.get('days', 7)
@@ -815,58 +957,91 @@ class LigneCommandeViewSet(viewsets.ModelViewSet):
         return LigneCommande.objects.filter(commande__client=self.request.user)
 
 # ViewSet pour les paniers (authentification requise)
-class PanierViewSet(viewsets.ModelViewSet):
+class PanierViewSet(IdempotencyMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = PanierSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = StandardResultsSetPagination  # Ajouté
+    # Les lignes touchent date_mise_a_jour du panier ; prix et stock viennent des produits
+    conditional_models = (Utilisateur, Produit, Categorie, Promotion, Photo)
+    idempotent_actions = ('valider_panier', 'batch')  # En-tête Idempotency-Key
 
     def get_queryset(self):
         return Panier.objects.filter(client=self.request.user)
 
+    def get_conditional_queryset(self):
+        if self.kwargs.get('pk') == 'mon_panier':
+            return self.get_queryset()
+        return super().get_conditional_queryset()
+
+    def toucher(self, panier):
+        """Met à jour date_mise_a_jour : invalide l'ETag du panier."""
+        panier.save(update_fields=['date_mise_a_jour'])
+
+    @staticmethod
+    def verrouiller(panier):
+        """
+        Verrouille le panier en base (dans une transaction) : les ajouts concurrents d'un même
+        produit (double appui) s'exécutent l'un après l'autre, et le second voit la ligne créée
+        par le premier au lieu de heurter unique_together.
+        """
+        Panier.objects.select_for_update().filter(pk=panier.pk).values_list('pk', flat=True).first()
+
     def retrieve(self, request, pk=None):
         if pk == 'mon_panier':
-            panier, _ = Panier.objects.get_or_create(client=request.user)
-            serializer = self.get_serializer(panier)
-            data = serializer.data
-            total = Decimal('0.00')
-            for item in panier.items.all():
-                prix = item.produit.prix
-                promotions = item.produit.promotions.filter(
-                    is_active=True, date_debut__lte=timezone.now(), date_fin__gte=timezone.now()
-                )
-                if promotions.exists():
-                    reduction = Decimal(str(max(p.reduction for p in promotions)))
-                    prix *= (1 - reduction)
-                total += prix * item.quantite
-            data['total'] = "{:.2f}".format(total)
-            return Response(data)  # Pas de pagination ici
+            return self.conditional_response(request, self._mon_panier)
         return super().retrieve(request, pk)  # Pagination appliquée si admin liste un panier spécifique
 
+    def _mon_panier(self, request):
+        panier, _ = Panier.objects.get_or_create(client=request.user)
+        return Response(self._rendu(panier))  # Pas de pagination ici
+
+    def _rendu(self, panier):
+        """Panier sérialisé avec ses lignes et son total après promotions."""
+        prefetch_related_objects([panier], Prefetch(
+            'items',
+            queryset=PanierProduit.objects.select_related('produit__categorie')
+            .prefetch_related('produit__photos', 'produit__promotions')
+        ))
+        items = panier.items.all()
+        index = PromotionIndex.pour_produits(item.produit for item in items)
+        context = self.get_serializer_context()
+        context['promotion_index'] = index
+        serializer = self.get_serializer(panier, context=context)
+        data = serializer.data
+        data['total'] = "{:.2f}".format(index.total(items))
+        return data
+
+    def _quantite(self, request, defaut=None):
+        try:
+            return int(request.data.get('quantite', defaut))
+        except (TypeError, ValueError):
+            return None
+
     @action(detail=True, methods=['post'])
     def ajouter_produit(self, request, pk=None):
         panier = self.get_object()
         produit_id = request.data.get('produit_id')
-        quantite = int(request.data.get('quantite', 1))
+        quantite = self._quantite(request, 1)
+        if quantite is None or quantite <= 0:
+            return Response({'error': 'Quantité invalide'}, status=status.HTTP_400_BAD_REQUEST)
         produit = get_object_or_404(Produit, id=produit_id, is_active=True)
 
         with transaction.atomic():
-            if produit.stock < quantite:
+            # Verrou sur le panier puis sa ligne ; le stock est pris par UPDATE conditionnel
+            self.verrouiller(panier)
+            panier_produit = PanierProduit.objects.select_for_update().filter(panier=panier, produit=produit).first()
+            a_reserver = quantite
+            if panier_produit and not panier_produit.reservation_active:
+                a_reserver += panier_produit.quantite  # Réservation échue : tout est à reprendre
+            if not stock.reserver(produit.id, a_reserver, reference=f'panier:{panier.pk}'):
                 return Response({'error': 'Stock insuffisant'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            panier_produit, created = PanierProduit.objects.get_or_create(
-                panier=panier, produit=produit, defaults={'quantite': quantite}
-            )
-            if not created:
-                nouvelle_quantite = panier_produit.quantite + quantite
-                if produit.stock < nouvelle_quantite - panier_produit.quantite:  # Vérifie la différence
-                    return Response({'error': 'Stock insuffisant pour cette quantité'}, status=status.HTTP_400_BAD_REQUEST)
-                produit.stock -= quantite  # Réduit le stock
-                produit.save()
-                panier_produit.quantite = nouvelle_quantite
-                panier_produit.save()
-            else:
-                produit.stock -= quantite  # Réduit le stock pour un nouvel ajout
-                produit.save()
+            if panier_produit is None:
+                panier_produit = PanierProduit(panier=panier, produit=produit, quantite=0)
+            panier_produit.quantite += quantite
+            panier_produit.reservation_active = True
+            panier_produit.reserve_jusqu_a = stock.echeance_reservation()
+            panier_produit.save()
+            self.toucher(panier)
 
         serializer = PanierProduitSerializer(panier_produit)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -875,25 +1050,30 @@ class PanierViewSet(viewsets.ModelViewSet):
     def modifier_quantite(self, request, pk=None):
         panier = self.get_object()
         produit_id = request.data.get('produit_id')
-        nouvelle_quantite = int(request.data.get('quantite'))
+        nouvelle_quantite = self._quantite(request)
+        if nouvelle_quantite is None:
+            return Response({'error': 'Quantité invalide'}, status=status.HTTP_400_BAD_REQUEST)
         produit = get_object_or_404(Produit, id=produit_id, is_active=True)
-        panier_produit = get_object_or_404(PanierProduit, panier=panier, produit=produit)
 
         with transaction.atomic():
+            # Verrou sur la ligne du panier seulement (la différence dépend de sa quantité actuelle)
+            panier_produit = get_object_or_404(
+                PanierProduit.objects.select_for_update(), panier=panier, produit=produit
+            )
+            reserve = panier_produit.quantite if panier_produit.reservation_active else 0
             if nouvelle_quantite <= 0:
-                produit.stock += panier_produit.quantite  # Restaure le stock
-                produit.save()
+                stock.liberer(produit.id, reserve, reference=f'panier:{panier.pk}')
                 panier_produit.delete()
+                self.toucher(panier)
                 return Response({'status': 'Produit supprimé du panier'}, status=status.HTTP_204_NO_CONTENT)
-            
-            difference = nouvelle_quantite - panier_produit.quantite
-            if difference > 0 and produit.stock < difference:
+
+            if not stock.ajuster(produit.id, nouvelle_quantite - reserve, reference=f'panier:{panier.pk}'):
                 return Response({'error': 'Stock insuffisant'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            produit.stock -= difference  # Ajuste le stock (+ si négatif, - si positif)
-            produit.save()
             panier_produit.quantite = nouvelle_quantite
+            panier_produit.reservation_active = True
+            panier_produit.reserve_jusqu_a = stock.echeance_reservation()
             panier_produit.save()
+            self.toucher(panier)
 
         serializer = PanierProduitSerializer(panier_produit)
         return Response(serializer.data)
@@ -903,48 +1083,127 @@ class PanierViewSet(viewsets.ModelViewSet):
         panier = self.get_object()
         produit_id = request.data.get('produit_id')
         produit = get_object_or_404(Produit, id=produit_id)
-        panier_produit = get_object_or_404(PanierProduit, panier=panier, produit=produit)
 
         with transaction.atomic():
-            produit.stock += panier_produit.quantite  # Restaure le stock
-            produit.save()
+            # Ligne verrouillée : ni une autre suppression ni l'expiration ne restituent le stock en double
+            panier_produit = get_object_or_404(
+                PanierProduit.objects.select_for_update(), panier=panier, produit=produit
+            )
+            if panier_produit.reservation_active:
+                stock.liberer(produit.id, panier_produit.quantite, reference=f'panier:{panier.pk}')
             panier_produit.delete()
+            self.toucher(panier)
 
         return Response({'status': 'Produit supprimé du panier'}, status=status.HTTP_204_NO_CONTENT)
 
+    @extend_schema(
+        description="Applique en une transaction une liste d'opérations sur le panier "
+                    "(`add` ajoute `quantite`, `set` la fixe, 0 retirant la ligne, `remove` retire la ligne), "
+                    "dans l'ordre. Tout ou rien : si un produit manque de stock, rien n'est appliqué. "
+                    "Retourne le panier final et son total.",
+        request=OperationPanierSerializer(many=True),
+    )
     @action(detail=True, methods=['post'])
-    def valider_panier(self, request, pk=None):
+    def batch(self, request, pk=None):
         panier = self.get_object()
-        if not panier.items.exists():
-            return Response({'error': 'Panier vide'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = OperationPanierSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data
+        produit_ids = {operation['produit_id'] for operation in operations}
 
-        adresse_id = request.data.get('adresse_id')
-        if not adresse_id:
-            return Response({'error': 'Adresse de livraison requise'}, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            # Panier verrouillé (les lignes à créer n'existent pas encore), puis une lecture
+            # verrouillée des lignes du panier et une des produits concernés
+            self.verrouiller(panier)
+            lignes = {
+                ligne.produit_id: ligne
+                for ligne in PanierProduit.objects.select_for_update().filter(panier=panier)
+            }
+            actifs = set(Produit.objects.filter(pk__in=produit_ids, is_active=True).values_list('id', flat=True))
+            quantites = {pk: ligne.quantite for pk, ligne in lignes.items()}
+            for operation in operations:
+                produit_id = operation['produit_id']
+                if operation['op'] != 'remove' and produit_id not in actifs:
+                    return Response({'error': f'Produit {produit_id} introuvable'}, status=status.HTTP_400_BAD_REQUEST)
+                if operation['op'] == 'add':
+                    quantites[produit_id] = quantites.get(produit_id, 0) + operation['quantite']
+                elif operation['op'] == 'set':
+                    quantites[produit_id] = operation['quantite']
+                else:
+                    quantites[produit_id] = 0
+
+            # Écart de réservation par produit : une seule requête de stock, tout ou rien
+            ecarts = {}
+            for produit_id, quantite in quantites.items():
+                ligne = lignes.get(produit_id)
+                reserve = ligne.quantite if ligne and ligne.reservation_active else 0
+                ecarts[produit_id] = quantite - reserve
+            if not stock.reserver_quantites(ecarts, reference=f'panier:{panier.pk}'):
+                return Response(
+                    {'error': 'Stock insuffisant', 'produits': stock.manquants(ecarts)},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
 
-        adresse = get_object_or_404(Adresse, id=adresse_id, client=request.user)
+            echeance = stock.echeance_reservation()
+            a_creer, a_modifier, a_supprimer = [], [], []
+            for produit_id, quantite in quantites.items():
+                ligne = lignes.get(produit_id)
+                if quantite <= 0:
+                    if ligne:
+                        a_supprimer.append(ligne.pk)
+                    continue
+                if ligne is None:
+                    a_creer.append(PanierProduit(
+                        panier=panier, produit_id=produit_id, quantite=quantite, reserve_jusqu_a=echeance
+                    ))
+                elif ecarts[produit_id] or not ligne.reservation_active:
+                    ligne.quantite, ligne.reservation_active, ligne.reserve_jusqu_a = quantite, True, echeance
+                    a_modifier.append(ligne)
+            PanierProduit.objects.bulk_create(a_creer)
+            PanierProduit.objects.bulk_update(a_modifier, ['quantite', 'reservation_active', 'reserve_jusqu_a'])
+            PanierProduit.objects.filter(pk__in=a_supprimer).delete()
+            self.toucher(panier)
+
+        return Response(self._rendu(panier))
 
+    @action(detail=True, methods=['post'])
+    def valider_panier(self, request, pk=None):
+        """
+        Nombre de requêtes constant quelle que soit la taille du panier : lignes et produits
+        en une requête, promotions en une, lignes de commande en un bulk_create.
+        """
+        panier = self.get_object()
         with transaction.atomic():
-            total = Decimal('0.00')
-            commande = Commande.objects.create(client=request.user, total=total)
-            for item in panier.items.all():
-                prix = item.produit.prix
-                promotions = item.produit.promotions.filter(
-                    is_active=True, date_debut__lte=timezone.now(), date_fin__gte=timezone.now()
-                )
-                if promotions.exists():
-                    reduction = Decimal(str(max(p.reduction for p in promotions)))
-                    prix *= (1 - reduction)
-                total += prix * item.quantite
-                LigneCommande.objects.create(
-                    commande=commande, produit=item.produit, quantite=item.quantite, prix_unitaire=prix
+            items = list(panier.items.select_related('produit').select_for_update(of=('self',)))
+            if not items:
+                return Response({'error': 'Panier vide'}, status=status.HTTP_400_BAD_REQUEST)
+            adresse_id = request.data.get('adresse_id')
+            if not adresse_id:
+                return Response({'error': 'Adresse de livraison requise'}, status=status.HTTP_400_BAD_REQUEST)
+            adresse = get_object_or_404(Adresse, id=adresse_id, client=request.user)
+
+            # Lignes dont la réservation a expiré : leur stock est repris, tout ou rien
+            expirees = Counter()
+            for item in items:
+                if not item.reservation_active:
+                    expirees[item.produit_id] += item.quantite
+            if not stock.reserver_quantites(expirees, reference=f'panier:{panier.pk}'):
+                return Response(
+                    {'error': 'Stock insuffisant', 'produits': stock.manquants(expirees)},
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
-            commande.total = total
-            commande.adresse = adresse  # Ajout de l'adresse à la commande
-            commande.statut = 'en_cours'
-            commande.save()
+
+            index = PromotionIndex.pour_produits(item.produit for item in items)
+            prix = {item.pk: index.prix(item.produit) for item in items}
+            total = sum((prix[item.pk] * item.quantite for item in items), Decimal('0.00'))
+            commande = Commande.objects.create(client=request.user, total=total, adresse=adresse, statut='en_cours')
+            LigneCommande.objects.bulk_create([
+                LigneCommande(commande=commande, produit_id=item.produit_id, quantite=item.quantite, prix_unitaire=prix[item.pk])
+                for item in items
+            ])
             Paiement.objects.create(commande=commande, type_transaction='commande', montant=total)
-            panier.items.all().delete()
+            PanierProduit.objects.filter(pk__in=[item.pk for item in items]).delete()
+            self.toucher(panier)
 
         return Response({'status': 'Commande créée et paiement simulé', 'commande_id': commande.id}, status=status.HTTP_201_CREATED)
 
@@ -992,31 +1251,30 @@ class DevisViewSet(viewsets.ModelViewSet):
         devis.save()
 
         # Notification aux admins
-        admins = Utilisateur.objects.filter(role='admin')
+        admins = Utilisateur.objects.filter(role='admin').values_list('email', flat=True)
         subject = 'Nouveau devis soumis - ChezFlora'
-        html_message = render_to_string('devis_nouveau_email.html', {
+        html_message, plain_message = rendre('devis_nouveau_email.html', {
             'client_name': devis.client.username,
             'service': devis.service.nom,
             'description': devis.description,
             'prix_demande': devis.prix_demande or 'Non spécifié',
             'devis_id': devis.id,
         })
-        plain_message = strip_tags(html_message)
-        for admin in admins:
-            send_mail(subject, plain_message, 'ChezFlora <plazarecrute@gmail.com>', [admin.email], html_message=html_message)
+        mettre_en_file_plusieurs(subject, 'ChezFlora <plazarecrute@gmail.com>', [
+            ([email], plain_message, html_message) for email in admins
+        ])
 
     def _notifier_client(self, devis):
         """Notifie le client lors d’une mise à jour importante."""
         subject = f"Votre devis #{devis.id} - Mise à jour"
-        html_message = render_to_string('devis_reponse_email.html', {
+        html_message, plain_message = rendre('devis_reponse_email.html', {
             'client_name': devis.client.username,
             'service': devis.service.nom,
             'prix_propose': devis.prix_propose or 'Non spécifié',
             'statut': devis.get_statut_display(),
             'commentaire_admin': devis.commentaire_admin or 'Aucun commentaire',
         })
-        plain_message = strip_tags(html_message)
-        send_mail(subject, plain_message, 'ChezFlora <plazarecrute@gmail.com>', [devis.client.email], html_message=html_message)
+        mettre_en_file(subject, plain_message, 'ChezFlora <plazarecrute@gmail.com>', [devis.client.email], html_message=html_message)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def soumettre(self, request, pk=None):
@@ -1109,7 +1367,7 @@ class DevisViewSet(viewsets.ModelViewSet):
         })
 
 # ViewSet pour les services (public par défaut)
-class ServiceViewSet(viewsets.ModelViewSet):
+class ServiceViewSet(CachedResponseMixin, QueryPlanViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet pour les services. Accessible publiquement en lecture seule.
     Modification réservée aux admins.
@@ -1122,6 +1380,7 @@ class ServiceViewSet(viewsets.ModelViewSet):
     search_fields = ['nom', 'description']
     ordering_fields = ['nom']
     pagination_class = StandardResultsSetPagination  # Ajouté
+    cache_models = (Service, Photo, Realisation)
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -1132,8 +1391,10 @@ class ServiceViewSet(viewsets.ModelViewSet):
         if getattr(self, 'swagger_fake_view', False):
             return Service.objects.none()
         if self.request.user.is_authenticated and self.request.user.role == 'admin':
-            return Service.objects.all()
-        return Service.objects.filter(is_active=True)
+            queryset = Service.objects.all()
+        else:
+            queryset = Service.objects.filter(is_active=True)
+        return self.planifier_queryset(queryset)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def upload_photo(self, request, pk=None):
@@ -1145,7 +1406,7 @@ class ServiceViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 # ViewSet pour les réalisations (admin seulement)
-class RealisationViewSet(viewsets.ModelViewSet):
+class RealisationViewSet(CachedResponseMixin, QueryPlanViewSetMixin, viewsets.ModelViewSet):
     queryset = Realisation.objects.filter(is_active=True)
     serializer_class = RealisationSerializer
     permission_classes = [AllowAny]
@@ -1154,12 +1415,16 @@ class RealisationViewSet(viewsets.ModelViewSet):
     search_fields = ['titre', 'description']
     ordering_fields = ['date']
     pagination_class = StandardResultsSetPagination  # Ajout de la pagination
+    cache_models = (Realisation, Service, Photo, Utilisateur)
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [IsAdminUser()]
         return [AllowAny()]
 
+    def get_queryset(self):
+        return self.planifier_queryset(super().get_queryset())
+
     def perform_create(self, serializer):
         serializer.save(admin=self.request.user)
 
@@ -1202,7 +1467,7 @@ class RealisationViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 # ViewSet pour les abonnements (authentification requise)
-class AbonnementViewSet(viewsets.ModelViewSet):
+class AbonnementViewSet(IdempotencyMixin, viewsets.ModelViewSet):
     """
     ViewSet pour les abonnements. Nécessite une authentification.
     """
@@ -1213,6 +1478,7 @@ class AbonnementViewSet(viewsets.ModelViewSet):
     search_fields = ['client__username']
     ordering_fields = ['date_debut', 'prix']
     pagination_class = StandardResultsSetPagination
+    idempotent_actions = ('create',)  # En-tête Idempotency-Key
 
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
@@ -1237,7 +1503,7 @@ class AbonnementViewSet(viewsets.ModelViewSet):
             abonnement.paiement_statut = 'paye_complet' if abonnement.type == 'annuel' else 'paye_mensuel'
             abonnement.save()
 
-            send_mail(
+            mettre_en_file(
                 'Confirmation de votre abonnement - ChezFlora',
                 f'Votre abonnement {abonnement.type} a été créé. Montant: {montant} FCFA.',
                 'ChezFlora <plazarecrute@gmail.com>',
@@ -1259,7 +1525,7 @@ class AbonnementViewSet(viewsets.ModelViewSet):
         )
         abonnement.prochaine_facturation = abonnement.calculer_prochaine_facturation()
         abonnement.save()
-        send_mail(
+        mettre_en_file(
             'Facture de votre abonnement - ChezFlora',
             f'Paiement de {montant} FCFA pour votre abonnement {abonnement.type}.',
             'ChezFlora <plazarecrute@gmail.com>',
@@ -1280,14 +1546,13 @@ class AbonnementViewSet(viewsets.ModelViewSet):
         commande = abonnement.generer_commande()
         if commande:
             subject = 'Confirmation de votre commande - ChezFlora'
-            html_message = render_to_string('commande_confirmation_email.html', {
+            html_message, plain_message = rendre('commande_confirmation_email.html', {
                 'client_name': commande.client.username,
                 'commande_id': commande.id,
                 'total': str(commande.total),  # Convertir Decimal en chaîne
                 'date': commande.date.strftime('%Y-%m-%d %H:%M:%S'),
             })
-            plain_message = strip_tags(html_message)
-            send_mail(subject, plain_message, 'ChezFlora <plazarecrute@gmail.com>', [commande.client.email], html_message=html_message)
+            mettre_en_file(subject, plain_message, 'ChezFlora <plazarecrute@gmail.com>', [commande.client.email], html_message=html_message)
             return Response({'status': 'Commande générée', 'commande_id': commande.id}, status=status.HTTP_201_CREATED)
         return Response({'error': 'Abonnement inactif ou expiré'}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -1315,12 +1580,11 @@ class AbonnementViewSet(viewsets.ModelViewSet):
 
             # Notifier
             subject = 'Annulation de votre abonnement - ChezFlora'
-            html_message = render_to_string('abonnement_annulation_email.html', {
+            html_message, plain_message = rendre('abonnement_annulation_email.html', {
                 'client_name': abonnement.client.username,
                 'abonnement_id': abonnement.id,
             })
-            plain_message = strip_tags(html_message)
-            send_mail(subject, plain_message, 'ChezFlora <plazarecrute@gmail.com>', [abonnement.client.email], html_message=html_message)
+            mettre_en_file(subject, plain_message, 'ChezFlora <plazarecrute@gmail.com>', [abonnement.client.email], html_message=html_message)
 
         return Response({'status': 'Abonnement annulé'}, status=status.HTTP_200_OK)
 
@@ -1354,7 +1618,7 @@ class AbonnementViewSet(viewsets.ModelViewSet):
         return Response(stats_data)
 
 # ViewSet pour les ateliers (public par défaut)
-class AtelierViewSet(viewsets.ModelViewSet):
+class AtelierViewSet(IdempotencyMixin, viewsets.ModelViewSet):
     """
     ViewSet pour les ateliers. Accessible publiquement en lecture seule.
     Modification et inscription nécessitent une authentification.
@@ -1369,6 +1633,7 @@ class AtelierViewSet(viewsets.ModelViewSet):
     csv_fields = ['id', 'nom', 'description', 'date', 'prix', 'places_disponibles']
     csv_filename = "ateliers_export.csv"
     pagination_class = StandardResultsSetPagination
+    idempotent_actions = ('s_inscrire',)  # En-tête Idempotency-Key
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy', 'cancel']:
@@ -1426,12 +1691,11 @@ class AtelierViewSet(viewsets.ModelViewSet):
 
             # Notifier
             subject = 'Désinscription atelier - ChezFlora'
-            html_message = render_to_string('atelier_desinscription_email.html', {
+            html_message, plain_message = rendre('atelier_desinscription_email.html', {
                 'client_name': user.username,
                 'atelier_titre': atelier.nom,
             })
-            plain_message = strip_tags(html_message)
-            send_mail(subject, plain_message, 'ChezFlora <plazarecrute@gmail.com>', [user.email], html_message=html_message)
+            mettre_en_file(subject, plain_message, 'ChezFlora <plazarecrute@gmail.com>', [user.email], html_message=html_message)
 
         return Response({'status': 'Désinscription réussie', 'atelier_id': atelier.id}, status=200)
 
@@ -1446,7 +1710,7 @@ class AtelierViewSet(viewsets.ModelViewSet):
             atelier.is_active = False
             atelier.save()
             
-            participants = atelier.participants.all()
+            participants = list(atelier.participants.select_related('utilisateur'))
             for participant in participants:
                 # Gérer les paiements
                 paiement = Paiement.objects.filter(atelier=atelier, type_transaction='atelier', montant=atelier.prix).first()
@@ -1456,17 +1720,22 @@ class AtelierViewSet(viewsets.ModelViewSet):
                     elif paiement.statut == 'effectue':
                         paiement.statut = 'rembourse'
                         paiement.save()
-                
-                # Notifier
-                subject = 'Annulation de votre atelier - ChezFlora'
-                html_message = render_to_string('atelier_cancelled_email.html', {
-                    'client_name': participant.username,
+
+            # Notifier : gabarit rendu une fois pour tous les participants
+            subject = 'Annulation de votre atelier - ChezFlora'
+            rendus = rendre_plusieurs(
+                'atelier_canceled_email.html',
+                [{'client_name': participant.utilisateur.username} for participant in participants],
+                commun={
                     'atelier_titre': atelier.nom,
                     'atelier_date': atelier.date.strftime('%Y-%m-%d %H:%M'),
                     'raison': raison,
-                })
-                plain_message = strip_tags(html_message)
-                send_mail(subject, plain_message, 'ChezFlora <plazarecrute@gmail.com>', [participant.email], html_message=html_message)
+                },
+            )
+            mettre_en_file_plusieurs(subject, 'ChezFlora <plazarecrute@gmail.com>', [
+                ([participant.utilisateur.email], plain_message, html_message)
+                for participant, (html_message, plain_message) in zip(participants, rendus)
+            ])
 
         return Response({'status': 'Atelier annulé, participants notifiés'}, status=status.HTTP_200_OK)
     
@@ -1518,7 +1787,7 @@ class AtelierViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 # ViewSet pour les articles (public par défaut)
-class ArticleViewSet(viewsets.ModelViewSet):
+class ArticleViewSet(CachedResponseMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Article.objects.filter(is_active=True).order_by('-date_publication')
     serializer_class = ArticleSerializer
     permission_classes = [AllowAny]
@@ -1527,6 +1796,7 @@ class ArticleViewSet(viewsets.ModelViewSet):
     search_fields = ['titre', 'contenu']
     ordering_fields = ['date_publication']
     pagination_class = StandardResultsSetPagination  # Ajout de la pagination
+    cache_models = (Article, Commentaire, Utilisateur)
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -1536,13 +1806,10 @@ class ArticleViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(auteur=self.request.user)
 
-    def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
-        serializer = self.get_serializer(instance)
-        data = serializer.data
-        commentaires = instance.commentaires.filter(parent__isnull=True, is_active=True)
-        data['commentaires'] = CommentaireSerializer(commentaires, many=True).data
-        return Response(data)
+    def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return ArticleDetailSerializer  # Avec les commentaires actifs
+        return super().get_serializer_class()
 
     @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
     def stats(self, request):
@@ -1581,52 +1848,6 @@ class ArticleViewSet(viewsets.ModelViewSet):
         }
         return Response(stats_data)   
     
-import re
-
-def moderate_comment_with_gemini(text):
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
-    headers = {
-        "Content-Type": "application/json",
-    }
-    data = {
-        "contents": [{
-            "parts": [{
-                "text": f"""
-                Analyse le texte suivant et détermine s'il contient du contenu inapproprié (insultes, langage offensant, spam, etc.).
-                Retourne un objet JSON avec :
-                - "isAppropriate": true/false
-                - "reason": une courte explication si inapproprié
-                Texte à analyser : "{text}"
-                """
-            }]
-        }]
-    }
-    params = {"key": settings.GEMINI_API_KEY}
-
-    try:
-        response = requests.post(url, headers=headers, json=data, params=params)
-        response.raise_for_status()  # Lève une exception pour les erreurs HTTP
-        result = response.json()
-        generated_text = result["candidates"][0]["content"]["parts"][0]["text"]
-        
-        # Extraire le JSON contenu dans les balises Markdown
-        match = re.search(r'```json\n(.*?)\n```', generated_text, re.DOTALL)
-        if match:
-            cleaned_text = match.group(1).strip()
-            moderation_result = json.loads(cleaned_text)
-        else:
-            # Si le format n'est pas celui attendu, retour par défaut
-            moderation_result = {"isAppropriate": True, "reason": "Format de réponse invalide"}
-        
-        return moderation_result
-    except requests.exceptions.RequestException as e:
-        print(f"Erreur Gemini : {e}")
-        return {"isAppropriate": True, "reason": "Erreur de modération, accepté par défaut"}
-    except (KeyError, json.JSONDecodeError) as e:
-        print(f"Erreur de parsing : {e}")
-        return {"isAppropriate": True, "reason": "Erreur de parsing, accepté par défaut"}
-
-
 class CommentaireViewSet(viewsets.ModelViewSet):
     serializer_class = CommentaireSerializer
     permission_classes = [AllowAny]
@@ -1634,7 +1855,8 @@ class CommentaireViewSet(viewsets.ModelViewSet):
     filterset_class = CommentaireFilter
     search_fields = ['texte']
     ordering_fields = ['date']
-    pagination_class = StandardResultsSetPagination
+    pagination_class = StandardOrKeysetPagination  # ?cursor= pour la pagination par clé
+    keyset_ordering = ('id',)
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy', 'moderate']:
@@ -1661,28 +1883,18 @@ class CommentaireViewSet(viewsets.ModelViewSet):
         if any(len(word) > 50 for word in texte.split()):  # MAX_WORD_LENGTH
             raise serializers.ValidationError("Aucun mot ne peut dépasser 50 caractères sans espace.")
 
-        # Modération avec Gemini
-        moderation_result = moderate_comment_with_gemini(texte)
         article = get_object_or_404(Article, id=article_id)
         parent = get_object_or_404(Commentaire, id=parent_id) if parent_id else None
 
-        if not moderation_result['isAppropriate']:
-            # Enregistrer le commentaire comme banni
-            serializer.save(
-                client=self.request.user,
-                article=article,
-                parent=parent,
-                is_active=False,
-                ban_reason=moderation_result['reason']
-            )
-        else:
-            # Enregistrer le commentaire comme actif
-            serializer.save(
-                client=self.request.user,
-                article=article,
-                parent=parent,
-                is_active=True
-            )
+        # Invisible jusqu'au verdict de la tâche de modération (api.moderation)
+        commentaire = serializer.save(
+            client=self.request.user,
+            article=article,
+            parent=parent,
+            is_active=False,
+            statut_moderation='en_attente',
+        )
+        programmer_moderation(commentaire.pk)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
     def moderate(self, request, pk=None):
@@ -1695,6 +1907,7 @@ class CommentaireViewSet(viewsets.ModelViewSet):
 
         commentaire.is_active = is_active
         commentaire.ban_reason = ban_reason if not is_active else None
+        commentaire.statut_moderation = 'approuve' if is_active else 'rejete'
         commentaire.save()
         action = 'activé' if is_active else 'désactivé'
         return Response({'status': f'Commentaire {action}'}, status=status.HTTP_200_OK)
@@ -1741,7 +1954,7 @@ class CommentaireViewSet(viewsets.ModelViewSet):
         return Response(stats_data)
 
 # ViewSet pour les paramètres (public par défaut, modification admin)
-class ParametreViewSet(viewsets.ModelViewSet):
+class ParametreViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     """
     ViewSet pour les paramètres. Accessible publiquement en lecture seule.
     Modification réservée aux admins.
@@ -1754,6 +1967,8 @@ class ParametreViewSet(viewsets.ModelViewSet):
     search_fields = ['cle', 'valeur']
     ordering_fields = ['cle']
     pagination_class = StandardResultsSetPagination
+    cache_models = (Parametre,)
+    cache_actions = ('public',)
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -1773,6 +1988,9 @@ class ParametreViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def public(self, request):
+        return self.cached_response(request, self._public)
+
+    def _public(self, request):
         public_keys = ['site_name', 'site_description', 'contact_email', 'contact_phone', 'primary_color', 'secondary_color', 'background_color']
         queryset = self.queryset.filter(cle__in=public_keys)
         serializer = self.get_serializer(queryset, many=True)
@@ -1791,14 +2009,16 @@ from django.db.models import Sum, Count, Avg, Max, Min
 from django.db.models.functions import TruncDay, TruncMonth, TruncYear
 from rest_framework.decorators import action
 
-class PaiementViewSet(viewsets.ModelViewSet):
+class PaiementViewSet(IdempotencyMixin, viewsets.ModelViewSet):
     serializer_class = PaiementSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_class = PaiementFilter
     search_fields = ['type_transaction', 'methode_paiement', 'commande__id', 'abonnement__id', 'atelier__id']
     ordering_fields = ['date', 'montant']
-    pagination_class = StandardResultsSetPagination
+    pagination_class = StandardOrKeysetPagination  # ?cursor= pour la pagination par clé
+    idempotent_actions = ('simuler',)  # En-tête Idempotency-Key
+    keyset_ordering = ('-date', '-id')
 
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
@@ -1822,17 +2042,16 @@ class PaiementViewSet(viewsets.ModelViewSet):
         elif paiement.atelier:
             paiement.atelier.participants.add(paiement.atelier.participants.first())
         subject = 'Confirmation de votre paiement - ChezFlora'
-        html_message = render_to_string('paiement_confirmation.html', {
+        html_message, plain_message = rendre('paiement_confirmation.html', {
             'username': self.request.user.username,
             'montant': paiement.montant,
             'type_transaction': paiement.type_transaction,
             'transaction_id': paiement.id,
             'date': paiement.date.strftime('%Y-%m-%d %H:%M:%S'),
         })
-        plain_message = strip_tags(html_message)
         from_email = 'ChezFlora <plazarecrute@gmail.com>'
         to_email = self.request.user.email
-        send_mail(subject, plain_message, from_email, [to_email], html_message=html_message)
+        mettre_en_file(subject, plain_message, from_email, [to_email], html_message=html_message)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def simuler(self, request, pk=None):
@@ -1852,12 +2071,10 @@ class PaiementViewSet(viewsets.ModelViewSet):
         with transaction.atomic():
             if paiement.commande:
                 commande = paiement.commande
-                commande.statut = 'annulee'
-                for ligne in commande.lignes.all():
-                    produit = ligne.produit
-                    produit.stock += ligne.quantite
-                    produit.save()
-                commande.save()
+                # Le stock n'est restitué qu'une fois, même si la commande a déjà été annulée
+                stock.annuler_commandes(
+                    Commande.objects.filter(pk=commande.pk).exclude(statut='annulee'), raison='remboursement'
+                )
             elif paiement.abonnement:
                 abonnement = paiement.abonnement
                 abonnement.is_active = False
@@ -1875,12 +2092,11 @@ class PaiementViewSet(viewsets.ModelViewSet):
                     paiement.abonnement.client.email if paiement.abonnement else \
                     request.user.email
             subject = 'Remboursement effectué - ChezFlora'
-            html_message = render_to_string('paiement_remboursement_email.html', {
+            html_message, plain_message = rendre('paiement_remboursement_email.html', {
                 'montant': paiement.montant,
                 'type_transaction': paiement.type_transaction,
             })
-            plain_message = strip_tags(html_message)
-            send_mail(subject, plain_message, 'ChezFlora <plazarecrute@gmail.com>', [email], html_message=html_message)
+            mettre_en_file(subject, plain_message, 'ChezFlora <plazarecrute@gmail.com>', [email], html_message=html_message)
 
         return Response({'status': 'Paiement remboursé'}, status=status.HTTP_200_OK)
 
@@ -2158,12 +2374,11 @@ class ContactView(APIView):
             # Envoyer un email au support
             subject = f'Nouveau message de {name} via ChezFlora'
             body = f'Nom: {name}\nEmail: {email}\nMessage:\n{message}'
-            send_mail(
+            mettre_en_file(
                 subject,
                 body,
                 settings.DEFAULT_FROM_EMAIL,  # ex. 'ChezFlora <plazarecrute@gmail.com>'
                 [settings.CONTACT_EMAIL],    # À définir dans settings.py (ex. 'support@chezflora.com')
-                fail_silently=False,
             )
             return Response({'status': 'Message envoyé avec succès.'}, status=status.HTTP_200_OK)
         except Exception as e:
@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -122,6 +122,10 @@ CORS_ALLOWED_ORIGINS = config('CORS_ALLOWED_ORIGINS', default='').split(',')
 
 CORS_ALLOW_CREDENTIALS = True  # Pour les cookies/auth
 
+from corsheaders.defaults import default_headers
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['Idempotent-Replayed']
+
 
 ROOT_URLCONF = "chezflora_api.urls"
 
@@ -209,6 +213,15 @@ STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Tailles réduites des images (côté max en pixels), en JPEG et WebP à côté de l'original (api.images)
+IMAGES_VARIANTES = {'thumb': 160, 'medium': 480}
+# Uploads : empreinte SHA-256 calculée à la réception (stockage adressé par le contenu, api.stockage)
+FILE_UPLOAD_HANDLERS = [
+    'api.stockage.MemoryEmpreinteUploadHandler',
+    'api.stockage.TemporaryEmpreinteUploadHandler',
+]
+# Délai avant suppression d'une image qui n'est plus référencée
+IMAGES_DELAI_ORPHELINS_HEURES = 24
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -247,10 +260,40 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'api.tasks.facturer_abonnements',
         'schedule': crontab(hour=0, minute=0),  # Tous les jours à 00:00
     },
-    # Notification de stock faible tous les jours à 8h00
-    'notifier-stock-faible-quotidien': {
+    # Filet de sécurité des prix effectifs (les échéances sont planifiées par tâches ETA)
+    'rafraichir-prix-effectifs-horaire': {
+        'task': 'api.tasks.rafraichir_prix_effectifs',
+        'schedule': 3600.0,
+    },
+    # Courriels en attente de réessai (les nouveaux partent dès le commit de la requête)
+    'envoyer-courriels-minute': {
+        'task': 'api.tasks.envoyer_courriels',
+        'schedule': 60.0,
+    },
+    # Réservations de panier expirées (durée : Parametre DUREE_RESERVATION_PANIER_MINUTES)
+    'liberer-reservations-expirees-minute': {
+        'task': 'api.tasks.liberer_reservations_expirees',
+        'schedule': 60.0,
+    },
+    # Compaction du journal des mouvements de stock et rapprochement, toutes les heures
+    'compacter-journal-stock-horaire': {
+        'task': 'api.tasks.compacter_journal_stock',
+        'schedule': crontab(minute=15),
+    },
+    # Récapitulatif des produits passés sous leur seuil de stock, toutes les heures
+    'notifier-stock-faible-horaire': {
         'task': 'api.tasks.notifier_stock_faible',
-        'schedule': crontab(hour=8, minute=0),  # Tous les jours à 08:00
+        'schedule': crontab(minute=0),
+    },
+    # Commentaires encore en attente après toute leur série d'essais (tâche perdue), toutes les 15 minutes
+    'moderer-commentaires-en-attente': {
+        'task': 'api.tasks.moderer_commentaires_en_attente',
+        'schedule': crontab(minute='*/15'),
+    },
+    # Ramasse-miettes des images orphelines tous les jours à 1h30, avant les sauvegardes
+    'collecter-images-orphelines-quotidien': {
+        'task': 'api.tasks.collecter_images_orphelines',
+        'schedule': crontab(hour=1, minute=30),
     },
     # Sauvegarde de la base de données tous les jours à 2h00
     'backup-database-quotidien': {
@@ -265,19 +308,38 @@ CELERY_BEAT_SCHEDULE = {
 }
 
 GEMINI_API_KEY = config('GEMINI_API_KEY')
-
-
-# Configuration du cache avec Redis
-# CACHES = {
-#     'default': {
-#         'BACKEND': 'django_redis.cache.RedisCache',
-#         'LOCATION': 'redis://127.0.0.1:6379/1',  # Base 1 pour le cache, Celery utilise 0
-#         'OPTIONS': {
-#             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
-#         }
-#     }
-# }
+# Modération des commentaires (api.moderation) : délai maximal de lecture de la réponse
+# du modèle, en secondes (connexion : 3 s)
+MODERATION_TIMEOUT = (3, config('MODERATION_TIMEOUT', default=10, cast=int))
+# Mots interdits ajoutés à la liste du préfiltre local, séparés par des virgules
+MODERATION_MOTS_INTERDITS = config('MODERATION_MOTS_INTERDITS', default='', cast=Csv())
+
+
+# Configuration du cache : Redis si CACHE_URL est défini (ex. redis://127.0.0.1:6379/1,
+# base 1 pour le cache, Celery utilise 0), sinon mémoire locale (dev, tests)
+CACHE_URL = config('CACHE_URL', default='')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
 
 # Durée par défaut du cache (en secondes, ici 5 minutes)
 CACHE_TTL = 60 * 5  # 300 secondes
 
+# Idempotency-Key (api.mixins.IdempotencyMixin) : conservation de la première réponse,
+# et attente maximale d'un doublon pendant que l'original s'exécute (secondes)
+IDEMPOTENCE_TTL = 60 * 60 * 24
+IDEMPOTENCE_ATTENTE = 10
+
+
+# Bornes (FCFA) des tranches de prix de /api/produits/facets/, sur le prix après promotion
+FACETTES_TRANCHES_PRIX = [5000, 10000, 25000, 50000]